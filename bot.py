@@ -8,42 +8,105 @@ Gọi trực tiếp `https://api.telegram.org/bot<TOKEN>/<METHOD>` qua aiohttp,
 không qua thư viện python-telegram-bot.
 
 Cơ chế:
-- Long-polling getUpdates với offset + exponential backoff
+- Long-polling getUpdates với offset + exponential backoff, hoặc webhook
+  (aiohttp.web) khi đặt TELEGRAM_WEBHOOK_URL
 - Tự dispatch update: command / text / callback
 - State tạm per user lưu trong Redis (qua utils/state_store)
 - Instance lock qua DatabaseManager để chỉ 1 instance bot chạy polling
-- Tác vụ nền: auto refresh cache mỗi 10 phút
 """
 
 import asyncio
 import hashlib
+import hmac
 import logging
+import re
 import signal
-from contextlib import suppress
-from typing import Any, Dict, List, Optional
+from functools import cached_property
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from aiohttp import web
+
+try:
+    import uvloop
+except ImportError:  # uvloop không hỗ trợ Windows → dùng event loop mặc định của asyncio
+    uvloop = None
 
 from config.config import Config
 from database.db_manager import DatabaseManager
 from cache.cache_manager import CacheManager
+from utils import background
+from utils.http_client import HttpClient
 from utils.logging_config import setup_logging
 from utils.state_store import StateStore
 from utils.telegram_api import TelegramAPI, TelegramAPIError, DEFAULT_ALLOWED_UPDATES
+from utils.ttl_cache import MISSING, TtlLruCache
+
+if TYPE_CHECKING:
+    from handlers.login_handler import LoginHandler
+    from handlers.logout_handler import LogoutHandler
+    from handlers.tkb_handler import TkbHandler
+    from handlers.lich_thi_handler import LichThiHandler
+    from handlers.diem_handler import DiemHandler
+    from handlers.hoc_phan_handler import HocPhanHandler
+    from handlers.diem_danh_handler import DiemDanhHandler
+    from handlers.diem_danh_tat_ca_handler import DiemDanhTatCaHandler
+    from handlers.danh_sach_handler import DanhSachHandler
+    from handlers.vi_tri_handler import ViTriHandler
+    from handlers.chinh_sach_handler import ChinhSachHandler
 
-from handlers.login_handler import LoginHandler
-from handlers.logout_handler import LogoutHandler
-from handlers.tkb_handler import TkbHandler
-from handlers.lich_thi_handler import LichThiHandler
-from handlers.diem_handler import DiemHandler
-from handlers.hoc_phan_handler import HocPhanHandler
-from handlers.diem_danh_handler import DiemDanhHandler
-from handlers.diem_danh_tat_ca_handler import DiemDanhTatCaHandler
-from handlers.danh_sach_handler import DanhSachHandler
-from handlers.vi_tri_handler import ViTriHandler
-from handlers.chinh_sach_handler import ChinhSachHandler
 
 setup_logging()
 logger = logging.getLogger(__name__)
 
+# Handler của 1 lệnh: (chat_id, user_id, arg_text, reply_to_message_id).
+# `arg_text` là phần sau tên lệnh, giữ nguyên khoảng trắng bên trong.
+CommandHandler = Callable[[int, int, str, Optional[int]], Awaitable[None]]
+
+# Handler của 1 callback: (callback_id, chat_id, message_id, user_id, callback_data)
+CallbackHandler = Callable[[str, int, int, int, str], Awaitable[None]]
+
+# Bấm trùng cùng 1 nút trên cùng 1 message trong khoảng này tính từ lúc lần đầu
+# xử lý xong (double-click, mạng chập chờn gửi lại) → chỉ xử lý lần đầu. Chỉ 1 instance bot polling (instance
+# lock) nên nhớ trong RAM là đủ, không cần Redis.
+CALLBACK_DEDUP_WINDOW = 0.3
+CALLBACK_DEDUP_MAX_SIZE = 10_000
+# Bàn phím số điểm danh: bấm cùng 1 số 2 lần liên tiếp là nhập hợp lệ
+CALLBACK_DEDUP_EXEMPT_PREFIXES = ("num_",)
+
+# Nội dung tĩnh của /start và /trogiup — dựng 1 lần lúc import
+_START_TEXT = (
+    "Chào bạn! Tôi là bot HUTECH.\n\n"
+    "/dangnhap để đăng nhập vào hệ thống HUTECH.\n"
+    "/danhsach để xem danh sách tài khoản đã đăng nhập.\n"
+    "/vitri để cài đặt vị trí điểm danh mặc định.\n"
+    "/diemdanh để điểm danh cho tài khoản hiện tại.\n"
+    "/diemdanhtatca để điểm danh tất cả tài khoản cùng lúc.\n"
+    "/tkb để xem thời khóa biểu của bạn.\n"
+    "/lichthi để xem lịch thi của bạn.\n"
+    "/diem để xem điểm của bạn.\n"
+    "/hocphan để xem thông tin học phần.\n"
+    "/trogiup để xem các lệnh có sẵn.\n"
+    "/chinhsach để xem chính sách bảo mật.\n"
+    "/dangxuat để đăng xuất khỏi hệ thống."
+)
+
+_HELP_TEXT = (
+    "Các lệnh có sẵn:\n\n"
+    "/dangnhap - Đăng nhập vào hệ thống HUTECH (hoặc /dangnhap <tài khoản> <mật khẩu>)\n"
+    "/danhsach - Xem danh sách tài khoản đã đăng nhập\n"
+    "/vitri - Cài đặt vị trí điểm danh mặc định\n"
+    "/diemdanh - Điểm danh cho tài khoản hiện tại\n"
+    "/diemdanhtatca - Điểm danh tất cả tài khoản cùng lúc\n"
+    "/tkb - Xem thời khóa biểu\n"
+    "/lichthi - Xem lịch thi\n"
+    "/diem - Xem điểm\n"
+    "/hocphan - Xem thông tin học phần\n"
+    "/trogiup - Hiển thị trợ giúp\n"
+    "/chinhsach - Xem chính sách bảo mật\n"
+    "/dangxuat - Đăng xuất khỏi hệ thống"
+)
+
 
 class HutechBot:
     def __init__(self) -> None:
@@ -51,29 +114,146 @@ class HutechBot:
         self.db_manager = DatabaseManager()
         self.cache_manager = CacheManager()
         self.telegram = TelegramAPI(self.config)
+        self.http = HttpClient()
         self.state = StateStore(self.cache_manager)
 
-        # Handlers
-        self.login_handler = LoginHandler(self.db_manager, self.cache_manager, self.telegram)
-        self.logout_handler = LogoutHandler(self.db_manager, self.cache_manager, self.telegram)
-        self.tkb_handler = TkbHandler(self.db_manager, self.cache_manager, self.telegram)
-        self.lich_thi_handler = LichThiHandler(self.db_manager, self.cache_manager, self.telegram)
-        self.diem_handler = DiemHandler(self.db_manager, self.cache_manager, self.telegram)
-        self.hoc_phan_handler = HocPhanHandler(self.db_manager, self.cache_manager, self.telegram)
-        self.diem_danh_handler = DiemDanhHandler(self.db_manager, self.cache_manager, self.telegram)
-        self.diem_danh_tat_ca_handler = DiemDanhTatCaHandler(
-            self.db_manager, self.cache_manager, self.telegram
-        )
-        self.vi_tri_handler = ViTriHandler(self.db_manager, self.telegram)
-        self.danh_sach_handler = DanhSachHandler(
-            self.db_manager, self.cache_manager, self.logout_handler, self.telegram
-        )
-        self.chinh_sach_handler = ChinhSachHandler(
-            self.db_manager, self.cache_manager, self.telegram
-        )
+        self._commands = self._build_command_table()
+        self._callbacks = self._build_callback_table()
+        # Prefix dài xếp trước để `num_tatca_` không bị `num_` bắt mất
+        self._callback_prefix_re = re.compile("|".join(
+            re.escape(prefix) for prefix in sorted(self._callbacks, key=len, reverse=True)
+        ))
+
+        # (user_id, message_id, callback_data) của các lần bấm vừa xử lý
+        self._recent_callbacks = TtlLruCache(CALLBACK_DEDUP_WINDOW, CALLBACK_DEDUP_MAX_SIZE)
 
         self._stop_event = asyncio.Event()
-        self._auto_refresh_task: Optional[asyncio.Task] = None
+
+    # ==================== Handlers ====================
+    # Khởi tạo lười: handler chỉ được import + tạo ở lần đầu có update cần tới nó
+    # (không tạo gì nếu bot thoát sớm vì instance khác đang giữ lock). Import nằm
+    # trong property để module nặng (icalendar, pytz...) chỉ load khi thật sự dùng.
+
+    @cached_property
+    def login_handler(self) -> "LoginHandler":
+        from handlers.login_handler import LoginHandler
+
+        return LoginHandler(self.db_manager, self.cache_manager, self.telegram)
+
+    @cached_property
+    def logout_handler(self) -> "LogoutHandler":
+        from handlers.logout_handler import LogoutHandler
+
+        return LogoutHandler(self.db_manager, self.cache_manager, self.telegram)
+
+    @cached_property
+    def tkb_handler(self) -> "TkbHandler":
+        from handlers.tkb_handler import TkbHandler
+
+        return TkbHandler(self.db_manager, self.cache_manager, self.telegram)
+
+    @cached_property
+    def lich_thi_handler(self) -> "LichThiHandler":
+        from handlers.lich_thi_handler import LichThiHandler
+
+        return LichThiHandler(self.db_manager, self.cache_manager, self.telegram)
+
+    @cached_property
+    def diem_handler(self) -> "DiemHandler":
+        from handlers.diem_handler import DiemHandler
+
+        return DiemHandler(self.db_manager, self.cache_manager, self.telegram)
+
+    @cached_property
+    def hoc_phan_handler(self) -> "HocPhanHandler":
+        from handlers.hoc_phan_handler import HocPhanHandler
+
+        return HocPhanHandler(self.db_manager, self.cache_manager, self.telegram)
+
+    @cached_property
+    def diem_danh_handler(self) -> "DiemDanhHandler":
+        from handlers.diem_danh_handler import DiemDanhHandler
+
+        return DiemDanhHandler(self.db_manager, self.cache_manager, self.telegram)
+
+    @cached_property
+    def diem_danh_tat_ca_handler(self) -> "DiemDanhTatCaHandler":
+        from handlers.diem_danh_tat_ca_handler import DiemDanhTatCaHandler
+
+        return DiemDanhTatCaHandler(self.db_manager, self.cache_manager, self.telegram)
+
+    @cached_property
+    def vi_tri_handler(self) -> "ViTriHandler":
+        from handlers.vi_tri_handler import ViTriHandler
+
+        return ViTriHandler(self.db_manager, self.telegram)
+
+    @cached_property
+    def danh_sach_handler(self) -> "DanhSachHandler":
+        from handlers.danh_sach_handler import DanhSachHandler
+
+        return DanhSachHandler(self.db_manager, self.cache_manager, self.logout_handler, self.telegram)
+
+    @cached_property
+    def chinh_sach_handler(self) -> "ChinhSachHandler":
+        from handlers.chinh_sach_handler import ChinhSachHandler
+
+        return ChinhSachHandler(self.db_manager, self.cache_manager, self.telegram)
+
+    def _build_command_table(self) -> Dict[str, CommandHandler]:
+        """Bảng tra cứu `command → handler`, dựng 1 lần để route lệnh O(1).
+
+        Mọi entry nhận cùng chữ ký `(chat_id, user_id, arg_text, reply_to)`.
+        """
+        return {
+            "start": lambda c, u, a, r: self._cmd_start(c, u, r),
+            "trogiup": lambda c, u, a, r: self._cmd_help(c, r),
+            "help": lambda c, u, a, r: self._cmd_help(c, r),
+            "dangnhap": lambda c, u, a, r: self.login_handler.start(c, u, r, a),
+            "dangxuat": lambda c, u, a, r: self.logout_handler.handle(c, u, r),
+            "tkb": lambda c, u, a, r: self.tkb_handler.cmd_tkb(c, u, a.split(), r),
+            "lichthi": lambda c, u, a, r: self.lich_thi_handler.cmd_lichthi(c, u, r),
+            "diem": lambda c, u, a, r: self.diem_handler.cmd_diem(c, u, r),
+            "hocphan": lambda c, u, a, r: self.hoc_phan_handler.cmd_hocphan(c, u, r),
+            "diemdanh": lambda c, u, a, r: self.diem_danh_handler.cmd_diemdanh(c, u, r),
+            "diemdanhtatca": lambda c, u, a, r: self.diem_danh_tat_ca_handler.cmd_diemdanhtatca(c, u, r),
+            "vitri": lambda c, u, a, r: self.vi_tri_handler.cmd_vitri(c, u, r),
+            "danhsach": lambda c, u, a, r: self.danh_sach_handler.cmd_danhsach(c, u, r),
+            "chinhsach": lambda c, u, a, r: self.chinh_sach_handler.cmd_chinhsach(c, u, r),
+        }
+
+    def _build_callback_table(self) -> Dict[str, CallbackHandler]:
+        """Bảng tra cứu `prefix callback_data → handler`.
+
+        Route bằng 1 lần match regex (các prefix ghép lại) + 1 lần tra dict,
+        thay cho chuỗi `startswith` dài. Handler được lấy lười qua lambda.
+        """
+        return {
+            "consent_": lambda *a: self.chinh_sach_handler.cb_consent(*a),
+            "diemdanh_campus_": lambda *a: self.diem_danh_handler.cb_campus(*a),
+            "num_": lambda *a: self.diem_danh_handler.cb_numeric(*a),
+            "diemdanhtatca_campus_": lambda *a: self.diem_danh_tat_ca_handler.cb_campus(*a),
+            "num_tatca_": lambda *a: self.diem_danh_tat_ca_handler.cb_numeric(*a),
+            "vitri_": lambda *a: self.vi_tri_handler.cb_handle(*a),
+            "sa:": lambda *a: self.danh_sach_handler.cb_switch(*a),
+            "switch_account_": lambda *a: self.danh_sach_handler.cb_switch(*a),
+            "tkb_subject_toggle_": lambda *a: self.tkb_handler.cb_subject_toggle(*a),
+            "tkb_subject_confirm": lambda *a: self.tkb_handler.cb_subject_confirm(*a),
+            "tkb_subject_cancel": lambda *a: self.tkb_handler.cb_subject_cancel(*a),
+            "tkb_time_back": lambda *a: self.tkb_handler.cb_time_back(*a),
+            "tkb_noop": lambda *a: self.tkb_handler.cb_noop(*a),
+            "tkb_time_": lambda *a: self.tkb_handler.cb_time_export(*a),
+            "tkb_export_ics_": lambda *a: self.tkb_handler.cb_export(*a),
+            "tkb_": lambda *a: self.tkb_handler.cb_week(*a),
+            "diem_more": lambda *a: self.diem_handler.cb_more(*a),
+            "diem_back": lambda *a: self.diem_handler.cb_back(*a),
+            "diem_export_": lambda *a: self.diem_handler.cb_export(*a),
+            "diem_": lambda *a: self.diem_handler.cb_detail(*a),
+            "namhoc_": lambda *a: self.hoc_phan_handler.cb_namhoc(*a),
+            "hocphan_": lambda *a: self.hoc_phan_handler.cb_hocphan(*a),
+            "danhsach_": lambda *a: self.hoc_phan_handler.cb_danhsach(*a),
+            "diemdanh_lop_hoc_phan_": lambda *a: self.hoc_phan_handler.cb_diemdanh_lop(*a),
+        }
 
     # ==================== Lifecycle ====================
 
@@ -81,6 +261,7 @@ class HutechBot:
         await self.db_manager.connect()
         await self.cache_manager.connect()
         await self.telegram.start()
+        await self.http.start()
 
         lock_key = self._build_instance_lock_key(self.config.TELEGRAM_BOT_TOKEN)
         acquired = await self.db_manager.acquire_bot_instance_lock(lock_key)
@@ -91,9 +272,12 @@ class HutechBot:
             await self._cleanup()
             return
 
+        self._install_signal_handlers()
         try:
-            await self._run_polling_loop()
-        except (KeyboardInterrupt, SystemExit):
+            if self.config.TELEGRAM_WEBHOOK_URL:
+                await self._run_webhook()
+            else:
+                await self._run_polling_loop()
             logger.info("Đang dừng bot...")
         except Exception:
             logger.exception("Bot crashed unexpectedly.")
@@ -102,15 +286,24 @@ class HutechBot:
             await self._cleanup()
 
     async def _cleanup(self) -> None:
-        if self._auto_refresh_task and not self._auto_refresh_task.done():
-            self._auto_refresh_task.cancel()
-            with suppress(asyncio.CancelledError):
-                await self._auto_refresh_task
+        # File Excel đang upload dở cần session Telegram → đợi xong rồi mới đóng
+        await background.drain()
         await self.telegram.close()
+        await self.http.close()
         await self.db_manager.close()
         await self.cache_manager.close()
         logger.info("Bot đã dừng và đóng các kết nối.")
 
+    def _install_signal_handlers(self) -> None:
+        """SIGINT/SIGTERM chỉ set stop event — polling loop và tác vụ nền tự thoát."""
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, self._stop_event.set)
+            except (NotImplementedError, RuntimeError):
+                # Windows không hỗ trợ add_signal_handler cho SIGTERM; bỏ qua
+                pass
+
     @staticmethod
     def _build_instance_lock_key(bot_token: str) -> int:
         digest = hashlib.blake2b(bot_token.encode("utf-8"), digest_size=8).digest()
@@ -118,46 +311,155 @@ class HutechBot:
 
     # ==================== Polling ====================
 
-    async def _run_polling_loop(self) -> None:
-        backoff = 1
-        offset: Optional[int] = None
+    async def _log_bot_identity(self) -> None:
         try:
             me = await self.telegram.get_me()
             logger.info("Bot đang chạy: @%s (id=%s)", me.get("username"), me.get("id"))
         except Exception as e:
             logger.warning("Không thể gọi getMe lúc khởi động: %s", e)
 
-        self._auto_refresh_task = asyncio.create_task(self._auto_refresh_cache_task())
+    async def _process_update(self, update: Dict[str, Any]) -> None:
+        """Dispatch 1 update; lỗi chỉ được log để không dừng vòng nhận update."""
+        try:
+            await self._dispatch(update)
+        except Exception:
+            logger.exception(
+                "Lỗi xử lý update_id=%s user_id=%s chat_id=%s",
+                *self._update_context(update),
+            )
+
+    async def _run_polling_loop(self) -> None:
+        backoff = 1
+        offset: Optional[int] = None
+        await self._log_bot_identity()
+        try:
+            # Lần chạy trước dùng webhook thì getUpdates bị Telegram từ chối (409)
+            await self.telegram.delete_webhook()
+        except TelegramAPIError as e:
+            logger.warning("Không thể gỡ webhook cũ: %s", e.description)
 
         while not self._stop_event.is_set():
             try:
-                updates = await self.telegram.get_updates(
-                    offset=offset,
-                    limit=100,
-                    allowed_updates=DEFAULT_ALLOWED_UPDATES,
-                )
+                updates = await self._get_updates_or_stop(offset)
+                if updates is None:
+                    break
                 backoff = 1  # Reset backoff khi thành công
                 for update in updates:
                     offset = update["update_id"] + 1
-                    try:
-                        await self._dispatch(update)
-                    except Exception:
-                        logger.exception(
-                            "Lỗi xử lý update_id=%s", update.get("update_id")
-                        )
+                    await self._process_update(update)
             except TelegramAPIError as e:
                 logger.warning("Telegram API error, retry sau %ss: %s", backoff, e.description)
                 await self._sleep_or_stop(backoff)
                 backoff = min(backoff * 2, 30)
 
+    async def _get_updates_or_stop(self, offset: Optional[int]) -> Optional[List[Dict[str, Any]]]:
+        """Long-poll getUpdates, nhưng trả về None ngay khi có tín hiệu dừng
+        thay vì chờ hết timeout 25s của Telegram."""
+        poll = asyncio.ensure_future(self.telegram.get_updates(
+            offset=offset,
+            limit=100,
+            allowed_updates=DEFAULT_ALLOWED_UPDATES,
+        ))
+        stop = asyncio.ensure_future(self._stop_event.wait())
+        try:
+            await asyncio.wait({poll, stop}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            pending = [t for t in (poll, stop) if not t.done()]
+            for t in pending:
+                t.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        if self._stop_event.is_set():
+            # Update chưa xác nhận offset sẽ được Telegram gửi lại ở lần chạy sau
+            return None
+        return poll.result()
+
     async def _sleep_or_stop(self, seconds: float) -> None:
         try:
             await asyncio.wait_for(self._stop_event.wait(), timeout=seconds)
         except asyncio.TimeoutError:
             return
 
+    # ==================== Webhook ====================
+
+    async def _run_webhook(self) -> None:
+        """Nhận update qua webhook thay cho long-polling.
+
+        Request chỉ được xác thực rồi đưa vào hàng đợi và trả 200 ngay (Telegram
+        gửi lại nếu phản hồi chậm). Một worker xử lý hàng đợi tuần tự — cùng thứ
+        tự và ngữ nghĩa như long-polling, state của 1 user không bị 2 update ghi
+        chồng nhau. Hàng đợi đầy thì trả 503: Telegram giữ update và gửi lại sau,
+        RAM không phình theo lượng update dồn về.
+        """
+        url = self.config.TELEGRAM_WEBHOOK_URL
+        path = urlsplit(url).path or "/"
+        secret = self.config.TELEGRAM_WEBHOOK_SECRET_TOKEN
+        listen, port = self.config.TELEGRAM_WEBHOOK_LISTEN, self.config.TELEGRAM_WEBHOOK_PORT
+        queue: "asyncio.Queue[Optional[Dict[str, Any]]]" = asyncio.Queue(
+            maxsize=self.config.TELEGRAM_WEBHOOK_QUEUE_SIZE
+        )
+
+        async def receive(request: web.Request) -> web.Response:
+            token = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+            if not hmac.compare_digest(token.encode(), secret.encode()):
+                return web.Response(status=403)
+            try:
+                update = await request.json()
+            except ValueError:
+                return web.Response(status=400)
+            if isinstance(update, dict):
+                try:
+                    queue.put_nowait(update)
+                except asyncio.QueueFull:
+                    logger.warning(
+                        "Hàng đợi webhook đầy (%s update), trả 503 để Telegram gửi lại.", queue.qsize()
+                    )
+                    return web.Response(status=503)
+            return web.Response()
+
+        await self._log_bot_identity()
+        app = web.Application()
+        app.router.add_post(path, receive)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        worker = asyncio.create_task(self._webhook_worker(queue), name="webhook_worker")
+        try:
+            await web.TCPSite(runner, listen, port).start()
+            await self.telegram.set_webhook(
+                url, secret_token=secret, allowed_updates=DEFAULT_ALLOWED_UPDATES
+            )
+            logger.info("Webhook đang lắng nghe %s:%s%s", listen, port, path)
+            await self._stop_event.wait()
+        finally:
+            # Ngừng nhận update mới rồi xử lý nốt hàng đợi. Không gỡ webhook: trong
+            # lúc bot restart Telegram giữ update lại và gửi tiếp khi bot chạy lại.
+            await runner.cleanup()
+            # Hàng đợi có thể đang đầy → chờ worker nhả chỗ cho tín hiệu dừng
+            await queue.put(None)
+            await worker
+
+    async def _webhook_worker(self, queue: "asyncio.Queue[Optional[Dict[str, Any]]]") -> None:
+        while True:
+            update = await queue.get()
+            if update is None:
+                return
+            await self._process_update(update)
+
     # ==================== Dispatch ====================
 
+    @staticmethod
+    def _update_context(update: Dict[str, Any]) -> Tuple[Optional[int], Optional[int], Optional[int]]:
+        """Trích `(update_id, user_id, chat_id)` của update trong 1 lượt — dùng khi log lỗi."""
+        callback_query = update.get("callback_query")
+        if callback_query is not None:
+            sender = callback_query
+            message = callback_query.get("message") or {}
+        else:
+            message = update.get("message") or update.get("edited_message") or {}
+            sender = message
+        user_id = (sender.get("from") or {}).get("id")
+        chat_id = (message.get("chat") or {}).get("id")
+        return update.get("update_id"), user_id, chat_id
+
     async def _dispatch(self, update: Dict[str, Any]) -> None:
         # 1. Callback query
         if "callback_query" in update:
@@ -183,70 +485,50 @@ class HutechBot:
         if chat_id is None or user_id is None:
             return
 
-        # Nếu user có state login (text message không phải command) → xử lý login
-        st = await self.state.get_state(user_id)
-        if st and st.get("step") in ("awaiting_username", "awaiting_password") and not text.startswith("/"):
-            handled = await self.login_handler.on_user_text(chat_id, user_id, text, message_id)
-            if handled:
-                return
-
-        # Nếu là command
+        # Nếu là command → route thẳng, không cần đọc state
         if text.startswith("/"):
             await self._handle_command(chat_id, user_id, text, message_id)
             return
 
+        # Ảnh / sticker / tin rỗng: không luồng nào nhận → bỏ qua trước khi đọc state
+        if not text:
+            return
+
+        # Nếu user có state login → text là username / password
+        st = await self.state.get_state(user_id)
+        if st.get("step") in ("awaiting_username", "awaiting_password"):
+            if await self.login_handler.on_user_text(chat_id, user_id, text, message_id):
+                return
+
         # Text không phải command và không trong state → bỏ qua
         logger.debug("Bỏ qua text message không xử lý: %s", text[:50])
 
     async def _handle_command(self, chat_id: int, user_id: int, text: str, message_id: int) -> None:
-        # Tách command và args
-        parts = text.split()
-        cmd = parts[0][1:].split("@")[0].lower()  # bỏ / và bot username
-        args = parts[1:]
+        # Tách command (bỏ / và bot username) và phần tham số thô
+        cmd, arg_text = self.chinh_sach_handler.split_command(text)
 
         # Guard chính sách
         if await self.chinh_sach_handler.check_command_guard(user_id, cmd):
-            await self.telegram.send_message(
-                chat_id=chat_id,
-                text="Bạn cần chấp nhận chính sách bảo mật trước khi dùng lệnh này.",
-                reply_to_message_id=message_id,
+            # 2 tin nhắn độc lập → gửi song song, user chỉ chờ 1 round-trip
+            await asyncio.gather(
+                self.telegram.send_message(
+                    chat_id=chat_id,
+                    text="Bạn cần chấp nhận chính sách bảo mật trước khi dùng lệnh này.",
+                    reply_to_message_id=message_id,
+                ),
+                self.chinh_sach_handler.cmd_chinhsach(chat_id, user_id, message_id),
             )
-            await self.chinh_sach_handler.cmd_chinhsach(chat_id, user_id, message_id)
             return
 
-        reply_to = message_id
-        if cmd == "start":
-            await self._cmd_start(chat_id, user_id, reply_to)
-        elif cmd == "trogiup" or cmd == "help":
-            await self._cmd_help(chat_id, reply_to)
-        elif cmd == "dangnhap":
-            await self.login_handler.start(chat_id, user_id, reply_to)
-        elif cmd == "dangxuat":
-            await self.logout_handler.handle(chat_id, user_id, reply_to)
-        elif cmd == "tkb":
-            await self.tkb_handler.cmd_tkb(chat_id, user_id, args, reply_to)
-        elif cmd == "lichthi":
-            await self.lich_thi_handler.cmd_lichthi(chat_id, user_id, reply_to)
-        elif cmd == "diem":
-            await self.diem_handler.cmd_diem(chat_id, user_id, reply_to)
-        elif cmd == "hocphan":
-            await self.hoc_phan_handler.cmd_hocphan(chat_id, user_id, reply_to)
-        elif cmd == "diemdanh":
-            await self.diem_danh_handler.cmd_diemdanh(chat_id, user_id, reply_to)
-        elif cmd == "diemdanhtatca":
-            await self.diem_danh_tat_ca_handler.cmd_diemdanhtatca(chat_id, user_id, reply_to)
-        elif cmd == "vitri":
-            await self.vi_tri_handler.cmd_vitri(chat_id, user_id, reply_to)
-        elif cmd == "danhsach":
-            await self.danh_sach_handler.cmd_danhsach(chat_id, user_id, reply_to)
-        elif cmd == "chinhsach":
-            await self.chinh_sach_handler.cmd_chinhsach(chat_id, user_id, reply_to)
-        else:
+        handler = self._commands.get(cmd)
+        if handler is None:
             await self.telegram.send_message(
                 chat_id=chat_id,
-                text=f"Lệnh không tồn tại. Dùng /trogiup để xem danh sách lệnh.",
-                reply_to_message_id=reply_to,
+                text="Lệnh không tồn tại. Dùng /trogiup để xem danh sách lệnh.",
+                reply_to_message_id=message_id,
             )
+            return
+        await handler(chat_id, user_id, arg_text, message_id)
 
     async def _handle_callback(self, callback_query: Dict[str, Any]) -> None:
         callback_id = callback_query.get("id")
@@ -260,6 +542,14 @@ class HutechBot:
         if not callback_id or user_id is None or chat_id is None or message_id is None:
             return
 
+        dedup_key = None
+        if not callback_data.startswith(CALLBACK_DEDUP_EXEMPT_PREFIXES):
+            dedup_key = (user_id, message_id, callback_data)
+            if self._recent_callbacks.get(dedup_key) is not MISSING:
+                # Lần bấm đầu vừa xử lý xong → chỉ tắt loading của lần bấm trùng
+                await self.telegram.answer_callback_query(callback_id)
+                return
+
         # Guard chính sách
         if await self.chinh_sach_handler.check_callback_guard(user_id, callback_data):
             await self.telegram.answer_callback_query(
@@ -268,134 +558,56 @@ class HutechBot:
             )
             return
 
+        match = self._callback_prefix_re.match(callback_data)
         try:
-            if callback_data.startswith("consent_"):
-                await self.chinh_sach_handler.cb_consent(
-                    callback_id, chat_id, message_id, user_id, callback_data
-                )
-            elif callback_data.startswith("diemdanh_campus_"):
-                await self.diem_danh_handler.cb_campus(
-                    callback_id, chat_id, message_id, user_id, callback_data
-                )
-            elif callback_data.startswith("num_") and not callback_data.startswith("num_tatca_"):
-                await self.diem_danh_handler.cb_numeric(
-                    callback_id, chat_id, message_id, user_id, callback_data
-                )
-            elif callback_data.startswith("diemdanhtatca_campus_"):
-                await self.diem_danh_tat_ca_handler.cb_campus(
-                    callback_id, chat_id, message_id, user_id, callback_data
-                )
-            elif callback_data.startswith("num_tatca_"):
-                await self.diem_danh_tat_ca_handler.cb_numeric(
-                    callback_id, chat_id, message_id, user_id, callback_data
-                )
-            elif callback_data.startswith("vitri_"):
-                await self.vi_tri_handler.cb_handle(
-                    callback_id, chat_id, message_id, user_id, callback_data
-                )
-            elif callback_data.startswith("switch_account_"):
-                await self.danh_sach_handler.cb_switch(
-                    callback_id, chat_id, message_id, user_id, callback_data
-                )
-            elif callback_data.startswith("tkb_"):
-                await self.tkb_handler.cb_route(
-                    callback_id, chat_id, message_id, user_id, callback_data
-                )
-            elif callback_data.startswith("diem_"):
-                await self.diem_handler.cb_route(
-                    callback_id, chat_id, message_id, user_id, callback_data
-                )
-            elif (
-                callback_data.startswith("namhoc_")
-                or callback_data.startswith("hocphan_")
-                or callback_data.startswith("danhsach_")
-                or callback_data.startswith("diemdanh_lop_hoc_phan_")
-            ):
-                await self.hoc_phan_handler.cb_route(
-                    callback_id, chat_id, message_id, user_id, callback_data
-                )
-            else:
+            if match is None:
                 await self.telegram.answer_callback_query(callback_id)
                 logger.debug("Callback không xử lý: %s", callback_data)
+                return
+            handler = self._callbacks[match.group(0)]
+            await handler(callback_id, chat_id, message_id, user_id, callback_data)
         except TelegramAPIError as e:
             logger.warning("Lỗi khi xử lý callback: %s", e.description)
         except Exception:
             logger.exception("Lỗi không xác định khi xử lý callback data=%s", callback_data)
+        finally:
+            # Ghi key khi handler đã xong: update xử lý tuần tự nên lần bấm trùng xếp
+            # hàng sau 1 handler chậm (gọi API HUTECH) vẫn rơi vào cửa sổ dedup
+            if dedup_key is not None:
+                self._recent_callbacks.set(dedup_key, True)
 
     # ==================== Commands ====================
 
     async def _cmd_start(self, chat_id: int, user_id: int, reply_to_message_id: Optional[int]) -> None:
-        from_user_first_name = ""
-        # Lấy first name từ start message (gọi lại getUpdates thì tốn kém; bỏ qua)
-        message = (
-            f"Chào bạn! Tôi là bot HUTECH.\n\n"
-            f"/dangnhap để đăng nhập vào hệ thống HUTECH.\n"
-            f"/danhsach để xem danh sách tài khoản đã đăng nhập.\n"
-            f"/vitri để cài đặt vị trí điểm danh mặc định.\n"
-            f"/diemdanh để điểm danh cho tài khoản hiện tại.\n"
-            f"/diemdanhtatca để điểm danh tất cả tài khoản cùng lúc.\n"
-            f"/tkb để xem thời khóa biểu của bạn.\n"
-            f"/lichthi để xem lịch thi của bạn.\n"
-            f"/diem để xem điểm của bạn.\n"
-            f"/hocphan để xem thông tin học phần.\n"
-            f"/trogiup để xem các lệnh có sẵn.\n"
-            f"/chinhsach để xem chính sách bảo mật.\n"
-            f"/dangxuat để đăng xuất khỏi hệ thống."
-        )
         await self.telegram.send_message(
-            chat_id=chat_id, text=message, reply_to_message_id=reply_to_message_id
+            chat_id=chat_id, text=_START_TEXT, reply_to_message_id=reply_to_message_id
         )
 
     async def _cmd_help(self, chat_id: int, reply_to_message_id: Optional[int]) -> None:
-        help_text = (
-            "Các lệnh có sẵn:\n\n"
-            "/dangnhap - Đăng nhập vào hệ thống HUTECH\n"
-            "/danhsach - Xem danh sách tài khoản đã đăng nhập\n"
-            "/vitri - Cài đặt vị trí điểm danh mặc định\n"
-            "/diemdanh - Điểm danh cho tài khoản hiện tại\n"
-            "/diemdanhtatca - Điểm danh tất cả tài khoản cùng lúc\n"
-            "/tkb - Xem thời khóa biểu\n"
-            "/lichthi - Xem lịch thi\n"
-            "/diem - Xem điểm\n"
-            "/hocphan - Xem thông tin học phần\n"
-            "/trogiup - Hiển thị trợ giúp\n"
-            "/chinhsach - Xem chính sách bảo mật\n"
-            "/dangxuat - Đăng xuất khỏi hệ thống"
-        )
         await self.telegram.send_message(
-            chat_id=chat_id, text=help_text, reply_to_message_id=reply_to_message_id
+            chat_id=chat_id, text=_HELP_TEXT, reply_to_message_id=reply_to_message_id
         )
 
-    # ==================== Background task ====================
 
-    async def _auto_refresh_cache_task(self) -> None:
-        """Tác vụ nền tự động xóa cache của người dùng đang đăng nhập mỗi 10 phút."""
-        while not self._stop_event.is_set():
-            try:
-                await asyncio.wait_for(self._stop_event.wait(), timeout=600)
-                return
-            except asyncio.TimeoutError:
-                try:
-                    logged_in_users = await self.db_manager.get_all_logged_in_users()
-                    for user_id in logged_in_users:
-                        await self.cache_manager.clear_user_cache(user_id, log_info=False)
-                except Exception:
-                    logger.exception("Lỗi trong tác vụ auto refresh cache.")
+def _enable_event_loop_monitor(threshold_ms: int) -> None:
+    """Bật debug mode của asyncio: mọi callback chạy lâu hơn `threshold_ms`
+    (vd lỡ gọi hàm sync chặn loop) sẽ được log WARNING qua logger `asyncio`."""
+    loop = asyncio.get_running_loop()
+    loop.set_debug(True)
+    loop.slow_callback_duration = threshold_ms / 1000
+    logging.getLogger("asyncio").setLevel(logging.WARNING)
+    logger.warning("BOT_PROFILE bật: theo dõi event loop, ngưỡng %sms.", threshold_ms)
 
 
 async def main() -> None:
     bot = HutechBot()
-
-    loop = asyncio.get_running_loop()
-    for sig in (signal.SIGINT, signal.SIGTERM):
-        try:
-            loop.add_signal_handler(sig, bot._stop_event.set)
-        except (NotImplementedError, RuntimeError):
-            # Windows không hỗ trợ add_signal_handler cho SIGTERM; bỏ qua
-            pass
-
+    if bot.config.BOT_PROFILE:
+        _enable_event_loop_monitor(bot.config.BOT_PROFILE_SLOW_CALLBACK_MS)
     await bot.run()
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    if uvloop is not None:
+        uvloop.run(main())
+    else:
+        asyncio.run(main())
@@ -11,10 +11,27 @@ handler đọc cache đồng nhất, không phụ thuộc backend.
 
 import abc
 import logging
-from typing import Any, Dict, Optional
+import re
+from typing import Any, Dict, Iterable, List, Optional
 
 logger = logging.getLogger(__name__)
 
+# Tách user_id từ key. Khớp với convention của các handler
+# (vd `tkb:123456`, `search_hoc_phan:123456:2024_1`, `bot:state:123456`).
+USER_ID_RE = re.compile(r":(\d+)(?::|$)")
+
+
+def extract_user_id(key: str) -> Optional[int]:
+    """Tách user_id từ key. Trả về None nếu key không gắn với user nào."""
+    m = USER_ID_RE.search(key)
+    return int(m.group(1)) if m else None
+
+
+# TTL (giây) của dữ liệu user handler cache lại từ API HUTECH (tkb, điểm, lịch
+# thi, học phần...). Mỗi key tự hết hạn theo mốc lúc nó được ghi → các lần gọi
+# lại API rải đều theo từng user thay vì cả bot cùng xoá cache định kỳ.
+USER_DATA_MAX_AGE = 600
+
 
 class BaseCache(abc.ABC):
     """Interface chung cho mọi cache backend."""
@@ -34,5 +51,18 @@ class BaseCache(abc.ABC):
     @abc.abstractmethod
     async def delete(self, key: str) -> None: ...
 
+    async def clear_user_cache(self, telegram_user_id: int, log_info: bool = True) -> None:
+        """Xóa tất cả cache (kể cả state) của một user."""
+        await self.clear_users_cache([telegram_user_id], log_info)
+
     @abc.abstractmethod
-    async def clear_user_cache(self, telegram_user_id: int, log_info: bool = True) -> None: ...
\ No newline at end of file
+    async def clear_users_cache(self, telegram_user_ids: Iterable[int], log_info: bool = False) -> None:
+        """Xóa tất cả cache của nhiều user trong 1 lượt (batch thay vì từng user)."""
+        ...
+
+    @staticmethod
+    def _log_cleared(total: int, user_ids: List[int]) -> None:
+        if len(user_ids) == 1:
+            logger.info("Đã xóa %s cache keys cho người dùng %s.", total, user_ids[0])
+        else:
+            logger.info("Đã xóa %s cache keys cho %s người dùng.", total, len(user_ids))
@@ -13,7 +13,7 @@ qua facade — không cần biết backend nào đang chạy.
 """
 
 import logging
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Iterable, Optional
 
 from cache.base import BaseCache
 from cache.memory_cache import MemoryCache
@@ -55,3 +55,6 @@ class CacheManager:
 
     async def clear_user_cache(self, telegram_user_id: int, log_info: bool = True):
         await self.backend.clear_user_cache(telegram_user_id, log_info)
+
+    async def clear_users_cache(self, telegram_user_ids: Iterable[int], log_info: bool = False):
+        await self.backend.clear_users_cache(telegram_user_ids, log_info)
@@ -22,20 +22,15 @@ Cấu trúc dữ liệu:
 
 import asyncio
 import logging
-import re
 import time
 from collections import defaultdict
 from datetime import datetime
-from typing import Any, Dict, Optional, Set
+from typing import Any, Dict, Iterable, Optional, Set
 
-from cache.base import BaseCache
+from cache.base import BaseCache, extract_user_id
 
 logger = logging.getLogger(__name__)
 
-# Tách user_id từ key. Khớp với convention của các handler
-# (vd `tkb:123456:2024-1`, `cache:user:123456:diem`).
-_USER_ID_RE = re.compile(r":(\d+)(?::|$)")
-
 
 class MemoryCache(BaseCache):
     """Cache backend lưu trong RAM, có TTL, có user-index, có background sweeper."""
@@ -75,13 +70,7 @@ class MemoryCache(BaseCache):
 
     def _extract_user_id(self, key: str) -> Optional[int]:
         """Tách user_id từ key theo pattern `:(\\d+)(?::|$)`. Trả về None nếu không khớp."""
-        m = _USER_ID_RE.search(key)
-        if m:
-            try:
-                return int(m.group(1))
-            except ValueError:
-                return None
-        return None
+        return extract_user_id(key)
 
     def _is_expired(self, key: str, now: float) -> bool:
         """Kiểm tra key đã hết hạn chưa."""
@@ -130,19 +119,20 @@ class MemoryCache(BaseCache):
                 self._user_index[user_id].discard(key)
         logger.debug("Đã xóa cache cho key: %s", key)
 
-    async def clear_user_cache(self, telegram_user_id: int, log_info: bool = True):
-        """Xóa tất cả cache của một user. Dùng user index để tránh scan toàn bộ store."""
+    async def clear_users_cache(self, telegram_user_ids: Iterable[int], log_info: bool = False):
+        """Xóa tất cả cache của nhiều user trong 1 lần giữ lock. Dùng user index
+        để tránh scan toàn bộ store."""
+        user_ids = list(telegram_user_ids)
+        total = 0
         async with self._lock:
-            keys = list(self._user_index.get(telegram_user_id, set()))
-            for k in keys:
-                self._store.pop(k, None)
-                self._expires.pop(k, None)
-            self._user_index.pop(telegram_user_id, None)
-        if log_info and keys:
-            logger.info(
-                "Đã xóa %s cache keys cho người dùng %s.",
-                len(keys), telegram_user_id,
-            )
+            for user_id in user_ids:
+                keys = self._user_index.pop(user_id, None) or ()
+                for k in keys:
+                    self._store.pop(k, None)
+                    self._expires.pop(k, None)
+                total += len(keys)
+        if log_info and total:
+            self._log_cleared(total, user_ids)
 
     async def _sweep_loop(self):
         """Background task dọn key expired định kỳ (60s/lần)."""
@@ -6,20 +6,34 @@ Cache backend dùng Redis.
 
 Lưu value theo format `{timestamp, data}` để thống nhất với `MemoryCache`.
 Hỗ trợ share cache giữa nhiều instance, phù hợp production.
+
+Giống `_user_index` của `MemoryCache`, mỗi user có 1 Redis SET
+`cache:user_keys:{user_id}` ghi lại các key của user đó (ghi cùng pipeline
+với `SET`). `clear_users_cache` đọc index rồi UNLINK theo lô — không phải
+SCAN toàn bộ keyspace cho từng user. Key ghi từ trước khi có index được đưa
+vào index 1 lần lúc `connect()` (đánh dấu bằng `_USER_INDEX_MIGRATED_KEY`).
 """
 
 import json
 import logging
 from datetime import datetime
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Iterable, Optional
 
 import redis.asyncio as redis
 
-from cache.base import BaseCache
+from cache.base import BaseCache, extract_user_id
 from config.config import Config
 
 logger = logging.getLogger(__name__)
 
+# Index key theo user, TTL tối thiểu = TTL dài nhất mà handler dùng (1 ngày)
+_USER_INDEX_PREFIX = "cache:user_keys:"
+_USER_INDEX_TTL = 86400
+# Số key tối đa trong 1 lệnh UNLINK
+_UNLINK_BATCH_SIZE = 1000
+# Đánh dấu đã đưa các key cũ (ghi trước khi có index) vào index
+_USER_INDEX_MIGRATED_KEY = "cache:user_keys_migrated"
+
 
 class RedisCache(BaseCache):
     def __init__(self):
@@ -38,6 +52,33 @@ class RedisCache(BaseCache):
             except Exception as e:
                 logger.error("Không thể tạo Redis connection pool: %s", e)
                 raise
+            await self._index_legacy_keys()
+
+    async def _index_legacy_keys(self) -> None:
+        """Chạy 1 lần cho mỗi Redis: SCAN các key theo user ghi trước khi có index
+        và thêm vào index, để logout / từ chối chính sách vẫn xóa được chúng."""
+        try:
+            r = self.get_redis_client()
+            if await r.exists(_USER_INDEX_MIGRATED_KEY):
+                return
+            indexed = 0
+            async with r.pipeline(transaction=False) as pipe:
+                async for key in r.scan_iter(match="*:*", count=1000):
+                    user_id = extract_user_id(key)
+                    if user_id is None or key.startswith(_USER_INDEX_PREFIX):
+                        continue
+                    index_key = f"{_USER_INDEX_PREFIX}{user_id}"
+                    pipe.sadd(index_key, key)
+                    pipe.expire(index_key, _USER_INDEX_TTL)
+                    indexed += 1
+                    if len(pipe) >= _UNLINK_BATCH_SIZE:
+                        await pipe.execute()
+                pipe.set(_USER_INDEX_MIGRATED_KEY, 1)
+                await pipe.execute()
+            if indexed:
+                logger.info("Đã đưa %s cache key cũ vào index theo user.", indexed)
+        except Exception as e:
+            logger.error("Lỗi index cache key cũ theo user: %s", e)
 
     async def close(self):
         """Đóng connection pool khi bot dừng."""
@@ -74,7 +115,17 @@ class RedisCache(BaseCache):
                 "timestamp": datetime.utcnow().isoformat(),
                 "data": value,
             }
-            await r.set(key, json.dumps(data_to_cache, ensure_ascii=False), ex=ttl)
+            payload = json.dumps(data_to_cache, ensure_ascii=False)
+            user_id = extract_user_id(key)
+            if user_id is None:
+                await r.set(key, payload, ex=ttl)
+            else:
+                index_key = f"{_USER_INDEX_PREFIX}{user_id}"
+                async with r.pipeline(transaction=False) as pipe:
+                    pipe.set(key, payload, ex=ttl)
+                    pipe.sadd(index_key, key)
+                    pipe.expire(index_key, max(ttl, _USER_INDEX_TTL))
+                    await pipe.execute()
             logger.debug("Đã lưu cache cho key: %s với TTL: %s giây.", key, ttl)
         except Exception as e:
             logger.error("Lỗi lưu cache cho key '%s': %s", key, e)
@@ -88,20 +139,27 @@ class RedisCache(BaseCache):
         except Exception as e:
             logger.error("Lỗi xóa cache cho key '%s': %s", key, e)
 
-    async def clear_user_cache(self, telegram_user_id: int, log_info: bool = True):
-        """Xóa tất cả cache keys có chứa `:{user_id}` trong tên.
-        Pattern này khớp với format key mà các handler dùng (vd `tkb:{user_id}:2024-1`)."""
+    async def clear_users_cache(self, telegram_user_ids: Iterable[int], log_info: bool = False):
+        """Xóa tất cả cache của nhiều user: 1 round-trip đọc index (SMEMBERS),
+        1 round-trip UNLINK toàn bộ key + index (pipeline, không transaction)."""
+        user_ids = list(telegram_user_ids)
+        if not user_ids:
+            return
         try:
             r = self.get_redis_client()
-            keys_to_delete = []
-            async for key in r.scan_iter(f"*:{telegram_user_id}*"):
-                keys_to_delete.append(key)
-            if keys_to_delete:
-                await r.delete(*keys_to_delete)
-                if log_info:
-                    logger.info(
-                        "Đã xóa %s cache keys cho người dùng %s.",
-                        len(keys_to_delete), telegram_user_id,
-                    )
+            index_keys = [f"{_USER_INDEX_PREFIX}{uid}" for uid in user_ids]
+            async with r.pipeline(transaction=False) as pipe:
+                for index_key in index_keys:
+                    pipe.smembers(index_key)
+                members = await pipe.execute()
+
+            keys = [k for member_set in members for k in member_set]
+            keys.extend(index_keys)
+            async with r.pipeline(transaction=False) as pipe:
+                for start in range(0, len(keys), _UNLINK_BATCH_SIZE):
+                    pipe.unlink(*keys[start:start + _UNLINK_BATCH_SIZE])
+                deleted = sum(await pipe.execute())
+            if log_info and deleted:
+                self._log_cleared(deleted, user_ids)
         except Exception as e:
-            logger.error("Lỗi xóa cache cho người dùng %s: %s", telegram_user_id, e)
\ No newline at end of file
+            logger.error("Lỗi xóa cache cho người dùng %s: %s", user_ids, e)
@@ -19,6 +19,7 @@ load env + log 1 lần. Các lần sau trả về instance đã cache.
 
 import os
 import logging
+import re
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -48,6 +49,25 @@ class Config:
         # Token của bot Telegram
         self.TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN", "")
 
+        # Connection pool HTTP (keep-alive) cho Telegram Bot API và API HUTECH.
+        # Pool Telegram mặc định theo số CPU (tối thiểu 16) để máy lớn không bị
+        # nghẽn chờ connection khi nhiều handler gửi tin cùng lúc.
+        self.TELEGRAM_CONNECTION_POOL_SIZE = self._env_int(
+            "TELEGRAM_CONNECTION_POOL_SIZE", max(16, (os.cpu_count() or 4) * 4), min_value=1
+        )
+        self.HUTECH_CONNECTION_POOL_SIZE = self._env_int("HUTECH_CONNECTION_POOL_SIZE", 32, min_value=1)
+        self.HTTP_KEEPALIVE_TIMEOUT = self._env_int("HTTP_KEEPALIVE_TIMEOUT", 30, min_value=1)
+
+        # Webhook (production): để trống TELEGRAM_WEBHOOK_URL → dùng long-polling.
+        # URL là địa chỉ public đầy đủ Telegram sẽ POST tới; bot lắng nghe đúng
+        # path của URL đó trên LISTEN:PORT (thường đứng sau reverse proxy HTTPS).
+        self.TELEGRAM_WEBHOOK_URL = os.getenv("TELEGRAM_WEBHOOK_URL", "").strip()
+        self.TELEGRAM_WEBHOOK_SECRET_TOKEN = os.getenv("TELEGRAM_WEBHOOK_SECRET_TOKEN", "").strip()
+        self.TELEGRAM_WEBHOOK_LISTEN = os.getenv("TELEGRAM_WEBHOOK_LISTEN", "0.0.0.0").strip() or "0.0.0.0"
+        self.TELEGRAM_WEBHOOK_PORT = self._env_int("TELEGRAM_WEBHOOK_PORT", 8080, min_value=1)
+        # Hàng đợi update có giới hạn: đầy → trả 503, Telegram tự gửi lại sau
+        self.TELEGRAM_WEBHOOK_QUEUE_SIZE = self._env_int("TELEGRAM_WEBHOOK_QUEUE_SIZE", 1000, min_value=1)
+
         # Cấu hình API HUTECH
         self.HUTECH_API_BASE_URL = "https://api.hutech.edu.vn"
         self.HUTECH_LOGIN_ENDPOINT = "/api-permission-v2-sinh-vien/api/authen/user/enter-system/login-normal"
@@ -87,6 +107,21 @@ class Config:
         if not self.CACHE_BACKEND:
             self.CACHE_BACKEND = "redis" if self.REDIS_URL else "memory"
 
+        # Kích thước pool Postgres (chỉ dùng khi STORAGE_BACKEND=postgres)
+        self.POSTGRES_POOL_MIN_SIZE = self._env_int("POSTGRES_POOL_MIN_SIZE", 5, min_value=1)
+        self.POSTGRES_POOL_MAX_SIZE = max(
+            self._env_int("POSTGRES_POOL_MAX_SIZE", 20, min_value=1),
+            self.POSTGRES_POOL_MIN_SIZE,
+        )
+        # Connection tự đóng + mở lại sau N query (tránh state phía server tích tụ)
+        self.POSTGRES_POOL_MAX_QUERIES = self._env_int("POSTGRES_POOL_MAX_QUERIES", 50000, min_value=1)
+        # Timeout (giây) cho mỗi query; 0 = không giới hạn
+        self.POSTGRES_COMMAND_TIMEOUT = self._env_int("POSTGRES_COMMAND_TIMEOUT", 10, min_value=0)
+
+        # Profile event loop (chỉ bật khi dev): log mọi callback chặn loop lâu hơn ngưỡng
+        self.BOT_PROFILE = self._env_bool("BOT_PROFILE", False)
+        self.BOT_PROFILE_SLOW_CALLBACK_MS = self._env_int("BOT_PROFILE_SLOW_CALLBACK_MS", 50, min_value=1)
+
         # Kiểm tra các biến môi trường cần thiết (chỉ 1 lần)
         self._validate_config()
 
@@ -99,6 +134,16 @@ class Config:
                 "Hãy đặt biến môi trường TELEGRAM_BOT_TOKEN hoặc kiểm tra file .env."
             )
 
+        if self.TELEGRAM_WEBHOOK_URL:
+            if not self.TELEGRAM_WEBHOOK_URL.startswith("https://"):
+                raise ValueError("TELEGRAM_WEBHOOK_URL phải là URL https:// (Telegram chỉ gửi webhook qua HTTPS).")
+            # Không có secret thì ai biết URL cũng gửi được update giả → bắt buộc
+            if not re.fullmatch(r"[A-Za-z0-9_-]{1,256}", self.TELEGRAM_WEBHOOK_SECRET_TOKEN):
+                raise ValueError(
+                    "TELEGRAM_WEBHOOK_SECRET_TOKEN bắt buộc khi dùng webhook "
+                    "(1-256 ký tự A-Z, a-z, 0-9, _ hoặc -)."
+                )
+
         if self.STORAGE_BACKEND not in ("postgres", "sqlite"):
             raise ValueError(
                 f"STORAGE_BACKEND không hợp lệ: {self.STORAGE_BACKEND!r}. "
@@ -136,6 +181,30 @@ class Config:
         logger.info("Storage backend: %s", storage_label)
         logger.info("Cache backend:   %s", cache_label)
 
+    @staticmethod
+    def _env_bool(name: str, default: bool) -> bool:
+        """Đọc biến môi trường kiểu bool (1/true/yes/on). Rỗng → default."""
+        raw = os.getenv(name, "").strip().lower()
+        if not raw:
+            return default
+        return raw in {"1", "true", "yes", "on"}
+
+    @staticmethod
+    def _env_int(name: str, default: int, min_value: "int | None" = None) -> int:
+        """Đọc biến môi trường kiểu int. Giá trị rỗng/không hợp lệ → dùng default."""
+        raw = os.getenv(name, "").strip()
+        if not raw:
+            return default
+        try:
+            value = int(raw)
+        except ValueError:
+            logger.warning("%s=%r không hợp lệ, dùng mặc định %s.", name, raw, default)
+            return default
+        if min_value is not None and value < min_value:
+            logger.warning("%s=%s nhỏ hơn %s, dùng mặc định %s.", name, value, min_value, default)
+            return default
+        return value
+
     @staticmethod
     def _redact_url(url: str) -> str:
         """Ẩn password trong URL khi log."""
@@ -42,9 +42,6 @@ class BaseDatabase(abc.ABC):
         self, telegram_user_id: int, username: str, password: str, device_uuid: str
     ) -> bool: ...
 
-    @abc.abstractmethod
-    async def get_user(self, telegram_user_id: int) -> Optional[Dict[str, Any]]: ...
-
     @abc.abstractmethod
     async def get_active_account(self, telegram_user_id: int) -> Optional[Dict[str, Any]]: ...
 
@@ -80,7 +77,9 @@ class BaseDatabase(abc.ABC):
     async def delete_user(self, telegram_user_id: int) -> bool: ...
 
     @abc.abstractmethod
-    async def is_user_logged_in(self, telegram_user_id: int) -> bool: ...
+    async def is_user_logged_in(self, telegram_user_id: int) -> Optional[bool]:
+        """True/False theo DB; None nếu truy vấn lỗi (không biết chắc → không được cache)."""
+        ...
 
     @abc.abstractmethod
     async def get_user_device_uuid_by_username(
@@ -11,6 +11,10 @@ Backend hiện hỗ trợ:
 Handler chỉ cần gọi method của `DatabaseManager` — không cần biết backend nào
 đang chạy. Mọi method đều delegate sang `self.backend` và trả về cùng kiểu dữ liệu
 (dict, list, bool) để tương thích với code cũ.
+
+Trạng thái đăng nhập, campus ưa thích, account active và login response (token)
+được cache ngắn hạn trong RAM (chạy trên hầu hết lệnh); mọi method ghi vào bảng
+user/account đều tự xoá entry cache của user đó.
 """
 
 import logging
@@ -20,9 +24,17 @@ from config.config import Config
 from database.base import BaseDatabase
 from database.postgres_backend import PostgresBackend
 from database.sqlite_backend import SqliteBackend
+from utils.ttl_cache import MISSING, TtlLruCache
 
 logger = logging.getLogger(__name__)
 
+LOGIN_STATE_CACHE_TTL = 10
+LOGIN_STATE_CACHE_MAX_SIZE = 10_000
+PREFERRED_CAMPUS_CACHE_TTL = 30
+PREFERRED_CAMPUS_CACHE_MAX_SIZE = 10_000
+ACTIVE_ACCOUNT_CACHE_TTL = 30
+ACTIVE_ACCOUNT_CACHE_MAX_SIZE = 10_000
+
 
 class DatabaseManager:
     """Facade chọn backend theo config, delegate mọi method sang backend tương ứng."""
@@ -34,6 +46,13 @@ class DatabaseManager:
         self.pool = getattr(self.backend, "pool", None)
         self._bot_lock_conn = getattr(self.backend, "_bot_lock_conn", None)
         self._bot_lock_key = getattr(self.backend, "_bot_lock_key", None)
+        self._login_state_cache = TtlLruCache(LOGIN_STATE_CACHE_TTL, LOGIN_STATE_CACHE_MAX_SIZE)
+        self._preferred_campus_cache = TtlLruCache(
+            PREFERRED_CAMPUS_CACHE_TTL, PREFERRED_CAMPUS_CACHE_MAX_SIZE
+        )
+        self._active_account_cache = TtlLruCache(ACTIVE_ACCOUNT_CACHE_TTL, ACTIVE_ACCOUNT_CACHE_MAX_SIZE)
+        # Login response của account active (chứa token) — mọi lệnh gọi API HUTECH đều cần
+        self._login_response_cache = TtlLruCache(ACTIVE_ACCOUNT_CACHE_TTL, ACTIVE_ACCOUNT_CACHE_MAX_SIZE)
 
     def _build_backend(self) -> BaseDatabase:
         """Khởi tạo backend theo `Config.STORAGE_BACKEND`."""
@@ -43,6 +62,15 @@ class DatabaseManager:
             return SqliteBackend()
         raise ValueError(f"STORAGE_BACKEND không hợp lệ: {self.config.STORAGE_BACKEND}")
 
+    # ==================== In-process cache ====================
+
+    def invalidate_user(self, telegram_user_id: int) -> None:
+        """Xoá mọi dữ liệu đã cache của user (gọi sau mọi thay đổi tài khoản)."""
+        self._login_state_cache.pop(telegram_user_id)
+        self._preferred_campus_cache.pop(telegram_user_id)
+        self._active_account_cache.pop(telegram_user_id)
+        self._login_response_cache.pop(telegram_user_id)
+
     # ==================== Lifecycle ====================
 
     async def connect(self):
@@ -64,15 +92,36 @@ class DatabaseManager:
     async def save_user(
         self, telegram_user_id: int, username: str, password: str, device_uuid: str
     ) -> bool:
-        return await self.backend.save_user(telegram_user_id, username, password, device_uuid)
+        result = await self.backend.save_user(telegram_user_id, username, password, device_uuid)
+        self.invalidate_user(telegram_user_id)
+        return result
 
     async def get_user(self, telegram_user_id: int) -> Optional[Dict[str, Any]]:
-        return await self.backend.get_user(telegram_user_id)
+        """Bản rút gọn của account active, dựng từ `get_active_account` (đã cache)."""
+        active = await self.get_active_account(telegram_user_id)
+        if active:
+            return {
+                "telegram_user_id": active["telegram_user_id"],
+                "username": active["username"],
+                "device_uuid": active["device_uuid"],
+                "is_active": bool(active["is_active"]),
+            }
+        return None
 
     async def get_active_account(self, telegram_user_id: int) -> Optional[Dict[str, Any]]:
-        return await self.backend.get_active_account(telegram_user_id)
+        cached = self._active_account_cache.get(telegram_user_id)
+        if cached is not MISSING:
+            return cached
+        account = await self.backend.get_active_account(telegram_user_id)
+        # Backend trả None cả khi lỗi DB → không cache None, tránh "mất đăng nhập" cả TTL
+        if account is not None:
+            self._active_account_cache.set(telegram_user_id, account)
+        return account
 
     async def get_active_user_token(self, telegram_user_id: int) -> Optional[str]:
+        cached = self._login_response_cache.get(telegram_user_id)
+        if cached is not MISSING:
+            return cached.get("token")
         return await self.backend.get_active_user_token(telegram_user_id)
 
     async def get_user_accounts(
@@ -89,24 +138,42 @@ class DatabaseManager:
         response_data: Dict[str, Any],
         ho_ten: Optional[str] = None,
     ) -> bool:
-        return await self.backend.add_account(
+        result = await self.backend.add_account(
             telegram_user_id, username, password, device_uuid, response_data, ho_ten
         )
+        self.invalidate_user(telegram_user_id)
+        return result
 
     async def set_active_account(self, telegram_user_id: int, username: str) -> bool:
-        return await self.backend.set_active_account(telegram_user_id, username)
+        result = await self.backend.set_active_account(telegram_user_id, username)
+        self.invalidate_user(telegram_user_id)
+        return result
 
     async def remove_account(self, telegram_user_id: int, username: str) -> bool:
-        return await self.backend.remove_account(telegram_user_id, username)
+        result = await self.backend.remove_account(telegram_user_id, username)
+        self.invalidate_user(telegram_user_id)
+        return result
 
     async def delete_all_accounts(self, telegram_user_id: int) -> bool:
-        return await self.backend.delete_all_accounts(telegram_user_id)
+        result = await self.backend.delete_all_accounts(telegram_user_id)
+        self.invalidate_user(telegram_user_id)
+        return result
 
     async def delete_user(self, telegram_user_id: int) -> bool:
-        return await self.backend.delete_user(telegram_user_id)
+        result = await self.backend.delete_user(telegram_user_id)
+        self.invalidate_user(telegram_user_id)
+        return result
 
     async def is_user_logged_in(self, telegram_user_id: int) -> bool:
-        return await self.backend.is_user_logged_in(telegram_user_id)
+        cached = self._login_state_cache.get(telegram_user_id)
+        if cached is not MISSING:
+            return cached
+        logged_in = await self.backend.is_user_logged_in(telegram_user_id)
+        if logged_in is None:
+            # Lỗi DB → coi như chưa đăng nhập nhưng không cache, lần sau hỏi lại DB
+            return False
+        self._login_state_cache.set(telegram_user_id, logged_in)
+        return logged_in
 
     async def get_user_device_uuid_by_username(
         self, telegram_user_id: int, username: str
@@ -114,7 +181,9 @@ class DatabaseManager:
         return await self.backend.get_user_device_uuid_by_username(telegram_user_id, username)
 
     async def set_user_login_status(self, telegram_user_id: int, is_logged_in: bool) -> bool:
-        return await self.backend.set_user_login_status(telegram_user_id, is_logged_in)
+        result = await self.backend.set_user_login_status(telegram_user_id, is_logged_in)
+        self.invalidate_user(telegram_user_id)
+        return result
 
     # ==================== Login responses ====================
 
@@ -125,12 +194,20 @@ class DatabaseManager:
         response_data: Dict[str, Any],
         ho_ten: Optional[str] = None,
     ) -> bool:
-        return await self.backend.save_login_response(
+        result = await self.backend.save_login_response(
             telegram_user_id, username, response_data, ho_ten
         )
+        self.invalidate_user(telegram_user_id)
+        return result
 
     async def get_user_login_response(self, telegram_user_id: int) -> Optional[Dict[str, Any]]:
-        return await self.backend.get_user_login_response(telegram_user_id)
+        cached = self._login_response_cache.get(telegram_user_id)
+        if cached is not MISSING:
+            return cached
+        response = await self.backend.get_user_login_response(telegram_user_id)
+        if response is not None:
+            self._login_response_cache.set(telegram_user_id, response)
+        return response
 
     async def get_user_login_response_by_username(
         self, telegram_user_id: int, username: str
@@ -153,12 +230,21 @@ class DatabaseManager:
     # ==================== Preferred campus ====================
 
     async def get_user_preferred_campus(self, telegram_user_id: int) -> Optional[str]:
-        return await self.backend.get_user_preferred_campus(telegram_user_id)
+        cached = self._preferred_campus_cache.get(telegram_user_id)
+        if cached is not MISSING:
+            return cached
+        campus = await self.backend.get_user_preferred_campus(telegram_user_id)
+        self._preferred_campus_cache.set(telegram_user_id, campus)
+        return campus
 
     async def set_user_preferred_campus(
         self, telegram_user_id: int, campus_name: str
     ) -> bool:
-        return await self.backend.set_user_preferred_campus(telegram_user_id, campus_name)
+        result = await self.backend.set_user_preferred_campus(telegram_user_id, campus_name)
+        self._preferred_campus_cache.pop(telegram_user_id)
+        return result
 
     async def delete_user_preferred_campus(self, telegram_user_id: int) -> bool:
-        return await self.backend.delete_user_preferred_campus(telegram_user_id)
+        result = await self.backend.delete_user_preferred_campus(telegram_user_id)
+        self._preferred_campus_cache.pop(telegram_user_id)
+        return result
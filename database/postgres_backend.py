@@ -21,7 +21,7 @@ logger = logging.getLogger(__name__)
 
 
 class PostgresBackend(BaseDatabase):
-    """Backend Postgres cho bot. Pool asyncpg 5–20 connection."""
+    """Backend Postgres cho bot. Pool asyncpg (mặc định 5–20 connection, chỉnh qua Config)."""
 
     def __init__(self):
         self.config = Config()
@@ -38,8 +38,15 @@ class PostgresBackend(BaseDatabase):
             try:
                 self.pool = await asyncpg.create_pool(
                     dsn=self.config.POSTGRES_URL,
-                    min_size=5,
-                    max_size=20,
+                    min_size=self.config.POSTGRES_POOL_MIN_SIZE,
+                    max_size=self.config.POSTGRES_POOL_MAX_SIZE,
+                    # asyncpg mở sẵn min_size connection lúc tạo pool; giữ chúng sống
+                    # (không đóng khi idle) để request đầu sau lúc rảnh không phải reconnect
+                    max_inactive_connection_lifetime=0,
+                    max_queries=self.config.POSTGRES_POOL_MAX_QUERIES,
+                    # Query treo (lock chờ, server quá tải) không giữ handler mãi
+                    command_timeout=self.config.POSTGRES_COMMAND_TIMEOUT or None,
+                    init=self._init_connection,
                 )
                 logger.info("Đã kết nối thành công đến PostgreSQL và tạo connection pool.")
                 await self._init_database()
@@ -47,6 +54,14 @@ class PostgresBackend(BaseDatabase):
                 logger.error("Lỗi không thể kết nối đến PostgreSQL: %s", e)
                 raise
 
+    @staticmethod
+    async def _init_connection(conn: asyncpg.Connection) -> None:
+        """Chạy 1 lần cho mỗi connection mới của pool: đăng ký codec JSONB ↔ dict
+        để query nhận/trả dict trực tiếp, không phải dumps/loads ở từng hàm."""
+        await conn.set_type_codec(
+            "jsonb", encoder=BaseDatabase.dump_json, decoder=json.loads, schema="pg_catalog"
+        )
+
     async def close(self):
         """Nhả advisory lock và đóng connection pool."""
         await self.release_bot_instance_lock()
@@ -120,6 +135,12 @@ class PostgresBackend(BaseDatabase):
                     UNIQUE(telegram_user_id, username)
                 )
             ''')
+            # Tra account active theo user (get_active_account, token, login response).
+            # Lookup chỉ theo telegram_user_id đã có UNIQUE(telegram_user_id, username) phục vụ.
+            await conn.execute('''
+                CREATE INDEX IF NOT EXISTS users_uid_active_idx
+                ON users (telegram_user_id) WHERE is_active = TRUE
+            ''')
             await conn.execute('''
                 CREATE TABLE IF NOT EXISTS login_responses (
                     id SERIAL PRIMARY KEY,
@@ -158,8 +179,7 @@ class PostgresBackend(BaseDatabase):
                 updated_at = CURRENT_TIMESTAMP
         '''
         try:
-            async with self.pool.acquire() as conn:
-                await conn.execute(query, telegram_user_id, username, password, device_uuid)
+            await self.pool.execute(query, telegram_user_id, username, password, device_uuid)
             logger.info("User %s/%s saved successfully", telegram_user_id, username)
             return True
         except Exception as e:
@@ -182,10 +202,7 @@ class PostgresBackend(BaseDatabase):
                 created_at = CURRENT_TIMESTAMP
         '''
         try:
-            async with self.pool.acquire() as conn:
-                await conn.execute(
-                    query, telegram_user_id, username, json.dumps(response_data), ho_ten
-                )
+            await self.pool.execute(query, telegram_user_id, username, response_data, ho_ten)
             logger.info("Login response for user %s/%s saved successfully", telegram_user_id, username)
             return True
         except Exception as e:
@@ -214,8 +231,7 @@ class PostgresBackend(BaseDatabase):
                 ORDER BY u.is_active DESC, u.created_at DESC
             '''
         try:
-            async with self.pool.acquire() as conn:
-                records = await conn.fetch(query, telegram_user_id)
+            records = await self.pool.fetch(query, telegram_user_id)
             return [dict(record) for record in records]
         except Exception as e:
             logger.error("Error getting accounts for user %s: %s", telegram_user_id, e)
@@ -230,44 +246,44 @@ class PostgresBackend(BaseDatabase):
         response_data: Dict[str, Any],
         ho_ten: Optional[str] = None,
     ) -> bool:
-        async with self.pool.acquire() as conn:
-            try:
-                await conn.execute(
-                    "UPDATE users SET is_active = FALSE WHERE telegram_user_id = $1",
-                    telegram_user_id,
-                )
-                await conn.execute(
-                    '''INSERT INTO users (telegram_user_id, username, password, device_uuid, is_active, updated_at)
-                       VALUES ($1, $2, $3, $4, TRUE, CURRENT_TIMESTAMP)
-                       ON CONFLICT (telegram_user_id, username) DO UPDATE SET
-                           password = EXCLUDED.password,
-                           device_uuid = EXCLUDED.device_uuid,
-                           is_active = TRUE,
-                           updated_at = CURRENT_TIMESTAMP''',
-                    telegram_user_id, username, password, device_uuid,
-                )
-                await conn.execute(
-                    '''INSERT INTO login_responses (telegram_user_id, username, response_data, ho_ten, created_at)
-                       VALUES ($1, $2, $3, $4, CURRENT_TIMESTAMP)
-                       ON CONFLICT (telegram_user_id, username) DO UPDATE SET
-                           response_data = EXCLUDED.response_data,
-                           ho_ten = EXCLUDED.ho_ten,
-                           created_at = CURRENT_TIMESTAMP''',
-                    telegram_user_id, username, json.dumps(response_data), ho_ten,
-                )
-                logger.info("Account %s added for user %s, set as active", username, telegram_user_id)
-                return True
-            except Exception as e:
-                logger.error("Error adding account for user %s/%s: %s", telegram_user_id, username, e)
-                return False
+        # 1 câu lệnh (data-modifying CTE) = 1 round-trip và tự atomic. Các CTE dùng
+        # chung snapshot nên không được đụng cùng 1 row 2 lần: `deact` bỏ qua
+        # chính account đang thêm, `up_user` sẽ đặt nó active.
+        query = '''
+            WITH deact AS (
+                UPDATE users SET is_active = FALSE
+                WHERE telegram_user_id = $1 AND username <> $2
+            ), up_user AS (
+                INSERT INTO users (telegram_user_id, username, password, device_uuid, is_active, updated_at)
+                VALUES ($1, $2, $3, $4, TRUE, CURRENT_TIMESTAMP)
+                ON CONFLICT (telegram_user_id, username) DO UPDATE SET
+                    password = EXCLUDED.password,
+                    device_uuid = EXCLUDED.device_uuid,
+                    is_active = TRUE,
+                    updated_at = CURRENT_TIMESTAMP
+            )
+            INSERT INTO login_responses (telegram_user_id, username, response_data, ho_ten, created_at)
+            VALUES ($1, $2, $5, $6, CURRENT_TIMESTAMP)
+            ON CONFLICT (telegram_user_id, username) DO UPDATE SET
+                response_data = EXCLUDED.response_data,
+                ho_ten = EXCLUDED.ho_ten,
+                created_at = CURRENT_TIMESTAMP
+        '''
+        try:
+            await self.pool.execute(
+                query, telegram_user_id, username, password, device_uuid,
+                response_data, ho_ten,
+            )
+            logger.info("Account %s added for user %s, set as active", username, telegram_user_id)
+            return True
+        except Exception as e:
+            logger.error("Error adding account for user %s/%s: %s", telegram_user_id, username, e)
+            return False
 
     async def set_active_account(self, telegram_user_id: int, username: str) -> bool:
-        query1 = 'UPDATE users SET is_active = FALSE WHERE telegram_user_id = $1'
-        query2 = 'UPDATE users SET is_active = TRUE WHERE telegram_user_id = $1 AND username = $2'
+        query = 'UPDATE users SET is_active = (username = $2) WHERE telegram_user_id = $1'
         try:
-            async with self.pool.acquire() as conn:
-                await conn.execute(query1, telegram_user_id)
-                await conn.execute(query2, telegram_user_id, username)
+            await self.pool.execute(query, telegram_user_id, username)
             logger.info("Account %s set as active for user %s", username, telegram_user_id)
             return True
         except Exception as e:
@@ -284,8 +300,7 @@ class PostgresBackend(BaseDatabase):
             LIMIT 1
         '''
         try:
-            async with self.pool.acquire() as conn:
-                record = await conn.fetchrow(query, telegram_user_id)
+            record = await self.pool.fetchrow(query, telegram_user_id)
             if record:
                 return dict(record)
             return None
@@ -323,42 +338,29 @@ class PostgresBackend(BaseDatabase):
             logger.error("Error deleting all accounts for user %s: %s", telegram_user_id, e)
             return False
 
-    async def get_user(self, telegram_user_id: int) -> Optional[Dict[str, Any]]:
-        active = await self.get_active_account(telegram_user_id)
-        if active:
-            return {
-                "telegram_user_id": active["telegram_user_id"],
-                "username": active["username"],
-                "device_uuid": active["device_uuid"],
-                "is_active": active["is_active"],
-            }
-        return None
-
-    async def is_user_logged_in(self, telegram_user_id: int) -> bool:
+    async def is_user_logged_in(self, telegram_user_id: int) -> Optional[bool]:
         query = "SELECT 1 FROM users WHERE telegram_user_id = $1 LIMIT 1"
         try:
-            async with self.pool.acquire() as conn:
-                record = await conn.fetchrow(query, telegram_user_id)
-            return record is not None
+            found = await self.pool.fetchval(query, telegram_user_id)
+            return found is not None
         except Exception as e:
             logger.error("Error checking login status for user %s: %s", telegram_user_id, e)
-            return False
+            return None
 
     async def set_user_login_status(self, telegram_user_id: int, is_logged_in: bool) -> bool:
         # Deprecated — giữ để tương thích
         return True
 
     async def get_user_login_response(self, telegram_user_id: int) -> Optional[Dict[str, Any]]:
-        active = await self.get_active_account(telegram_user_id)
-        if not active:
-            return None
-        query = "SELECT response_data FROM login_responses WHERE telegram_user_id = $1 AND username = $2"
+        query = '''
+            SELECT lr.response_data
+            FROM users u
+            JOIN login_responses lr USING (telegram_user_id, username)
+            WHERE u.telegram_user_id = $1 AND u.is_active = TRUE
+            LIMIT 1
+        '''
         try:
-            async with self.pool.acquire() as conn:
-                record = await conn.fetchrow(query, telegram_user_id, active["username"])
-            if record and record["response_data"]:
-                return json.loads(record["response_data"])
-            return None
+            return await self.pool.fetchval(query, telegram_user_id) or None
         except Exception as e:
             logger.error("Error getting login response for user %s: %s", telegram_user_id, e)
             return None
@@ -368,11 +370,7 @@ class PostgresBackend(BaseDatabase):
     ) -> Optional[Dict[str, Any]]:
         query = "SELECT response_data FROM login_responses WHERE telegram_user_id = $1 AND username = $2"
         try:
-            async with self.pool.acquire() as conn:
-                record = await conn.fetchrow(query, telegram_user_id, username)
-            if record and record["response_data"]:
-                return json.loads(record["response_data"])
-            return None
+            return await self.pool.fetchval(query, telegram_user_id, username) or None
         except Exception as e:
             logger.error("Error getting login response for user %s/%s: %s", telegram_user_id, username, e)
             return None
@@ -383,25 +381,23 @@ class PostgresBackend(BaseDatabase):
     async def get_all_logged_in_users(self) -> List[int]:
         query = "SELECT DISTINCT telegram_user_id FROM users"
         try:
-            async with self.pool.acquire() as conn:
-                records = await conn.fetch(query)
-            return [r["telegram_user_id"] for r in records]
+            records = await self.pool.fetch(query)
+            return [r[0] for r in records]
         except Exception as e:
             logger.error("Error getting all logged in users: %s", e)
             return []
 
     async def get_active_user_token(self, telegram_user_id: int) -> Optional[str]:
-        active = await self.get_active_account(telegram_user_id)
-        if not active:
-            return None
-        query = "SELECT response_data FROM login_responses WHERE telegram_user_id = $1 AND username = $2"
+        # Lấy thẳng field token trong JSONB → không phải tải + parse cả login response
+        query = '''
+            SELECT lr.response_data->>'token'
+            FROM users u
+            JOIN login_responses lr USING (telegram_user_id, username)
+            WHERE u.telegram_user_id = $1 AND u.is_active = TRUE
+            LIMIT 1
+        '''
         try:
-            async with self.pool.acquire() as conn:
-                record = await conn.fetchrow(query, telegram_user_id, active["username"])
-            if record and record["response_data"]:
-                response_data = json.loads(record["response_data"])
-                return response_data.get("token")
-            return None
+            return await self.pool.fetchval(query, telegram_user_id)
         except Exception as e:
             logger.error("Error getting token for user %s: %s", telegram_user_id, e)
             return None
@@ -411,11 +407,7 @@ class PostgresBackend(BaseDatabase):
     ) -> Optional[str]:
         query = "SELECT device_uuid FROM users WHERE telegram_user_id = $1 AND username = $2"
         try:
-            async with self.pool.acquire() as conn:
-                record = await conn.fetchrow(query, telegram_user_id, username)
-            if record:
-                return record["device_uuid"]
-            return None
+            return await self.pool.fetchval(query, telegram_user_id, username)
         except Exception as e:
             logger.error("Error getting device UUID for user %s/%s: %s", telegram_user_id, username, e)
             return None
@@ -425,9 +417,8 @@ class PostgresBackend(BaseDatabase):
     async def has_accepted_policy(self, telegram_user_id: int) -> bool:
         query = "SELECT accepted FROM user_consents WHERE telegram_user_id = $1 LIMIT 1"
         try:
-            async with self.pool.acquire() as conn:
-                record = await conn.fetchrow(query, telegram_user_id)
-            return bool(record and record["accepted"])
+            accepted = await self.pool.fetchval(query, telegram_user_id)
+            return bool(accepted)
         except Exception as e:
             logger.error("Error checking policy consent for user %s: %s", telegram_user_id, e)
             return False
@@ -442,8 +433,7 @@ class PostgresBackend(BaseDatabase):
                 updated_at = CURRENT_TIMESTAMP
         '''
         try:
-            async with self.pool.acquire() as conn:
-                await conn.execute(query, telegram_user_id, accepted)
+            await self.pool.execute(query, telegram_user_id, accepted)
             logger.info("Policy consent updated for user %s: accepted=%s", telegram_user_id, accepted)
             return True
         except Exception as e:
@@ -455,11 +445,7 @@ class PostgresBackend(BaseDatabase):
     async def get_user_preferred_campus(self, telegram_user_id: int) -> Optional[str]:
         query = "SELECT preferred_campus FROM users WHERE telegram_user_id = $1 LIMIT 1"
         try:
-            async with self.pool.acquire() as conn:
-                record = await conn.fetchrow(query, telegram_user_id)
-            if record and record["preferred_campus"]:
-                return record["preferred_campus"]
-            return None
+            return await self.pool.fetchval(query, telegram_user_id) or None
         except Exception as e:
             logger.error("Error getting preferred campus for user %s: %s", telegram_user_id, e)
             return None
@@ -469,8 +455,7 @@ class PostgresBackend(BaseDatabase):
     ) -> bool:
         query = "UPDATE users SET preferred_campus = $1 WHERE telegram_user_id = $2"
         try:
-            async with self.pool.acquire() as conn:
-                await conn.execute(query, campus_name, telegram_user_id)
+            await self.pool.execute(query, campus_name, telegram_user_id)
             logger.info("Preferred campus '%s' saved for user %s", campus_name, telegram_user_id)
             return True
         except Exception as e:
@@ -480,8 +465,7 @@ class PostgresBackend(BaseDatabase):
     async def delete_user_preferred_campus(self, telegram_user_id: int) -> bool:
         query = "UPDATE users SET preferred_campus = NULL WHERE telegram_user_id = $1"
         try:
-            async with self.pool.acquire() as conn:
-                await conn.execute(query, telegram_user_id)
+            await self.pool.execute(query, telegram_user_id)
             logger.info("Preferred campus deleted for user %s", telegram_user_id)
             return True
         except Exception as e:
@@ -18,7 +18,6 @@ Cú pháp khác Postgres ở vài điểm:
 import asyncio
 import logging
 import os
-import time
 from typing import Any, Dict, List, Optional
 
 import aiosqlite
@@ -174,6 +173,10 @@ class SqliteBackend(BaseDatabase):
                 UNIQUE(telegram_user_id, username)
             );
 
+            -- Tra account active theo user; lookup chỉ theo telegram_user_id đã có UNIQUE phục vụ
+            CREATE INDEX IF NOT EXISTS users_uid_active_idx
+                ON users (telegram_user_id) WHERE is_active = 1;
+
             CREATE TABLE IF NOT EXISTS login_responses (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 telegram_user_id INTEGER NOT NULL,
@@ -327,12 +330,8 @@ class SqliteBackend(BaseDatabase):
     async def set_active_account(self, telegram_user_id: int, username: str) -> bool:
         try:
             await self._execute(
-                "UPDATE users SET is_active = 0 WHERE telegram_user_id = ?",
-                (telegram_user_id,),
-            )
-            await self._execute(
-                "UPDATE users SET is_active = 1 WHERE telegram_user_id = ? AND username = ?",
-                (telegram_user_id, username),
+                "UPDATE users SET is_active = (username = ?) WHERE telegram_user_id = ?",
+                (username, telegram_user_id),
             )
             await self._conn.commit()
             logger.info("Account %s set as active for user %s", username, telegram_user_id)
@@ -397,18 +396,7 @@ class SqliteBackend(BaseDatabase):
             logger.error("Error deleting all accounts for user %s: %s", telegram_user_id, e)
             return False
 
-    async def get_user(self, telegram_user_id: int) -> Optional[Dict[str, Any]]:
-        active = await self.get_active_account(telegram_user_id)
-        if active:
-            return {
-                "telegram_user_id": active["telegram_user_id"],
-                "username": active["username"],
-                "device_uuid": active["device_uuid"],
-                "is_active": bool(active["is_active"]),
-            }
-        return None
-
-    async def is_user_logged_in(self, telegram_user_id: int) -> bool:
+    async def is_user_logged_in(self, telegram_user_id: int) -> Optional[bool]:
         try:
             row = await self._fetchone(
                 "SELECT 1 AS x FROM users WHERE telegram_user_id = ? LIMIT 1",
@@ -417,19 +405,20 @@ class SqliteBackend(BaseDatabase):
             return row is not None
         except Exception as e:
             logger.error("Error checking login status for user %s: %s", telegram_user_id, e)
-            return False
+            return None
 
     async def set_user_login_status(self, telegram_user_id: int, is_logged_in: bool) -> bool:
         # Deprecated — giữ để tương thích
         return True
 
     async def get_user_login_response(self, telegram_user_id: int) -> Optional[Dict[str, Any]]:
-        active = await self.get_active_account(telegram_user_id)
-        if not active:
-            return None
         row = await self._fetchone(
-            "SELECT response_data FROM login_responses WHERE telegram_user_id = ? AND username = ?",
-            (telegram_user_id, active["username"]),
+            '''SELECT lr.response_data
+               FROM users u
+               JOIN login_responses lr USING (telegram_user_id, username)
+               WHERE u.telegram_user_id = ? AND u.is_active = 1
+               LIMIT 1''',
+            (telegram_user_id,),
         )
         if row and row["response_data"]:
             return self.parse_json(row["response_data"])
@@ -5,7 +5,8 @@
 Handler chính sách bảo mật + guard chấp nhận.
 
 Bot yêu cầu user chấp nhận chính sách trước khi dùng lệnh (trừ `/start`,
-`/trogiup`, `/chinhsach`). Trạng thái chấp nhận lưu trong DB.
+`/trogiup`, `/chinhsach`). Trạng thái chấp nhận lưu trong DB; user đã chấp
+nhận được nhớ trong RAM (TTL ngắn) để guard không phải hỏi DB mỗi update.
 
 Cú pháp callback:
     consent_accept  - chấp nhận chính sách
@@ -13,7 +14,9 @@ Cú pháp callback:
 """
 
 import logging
-from typing import Optional
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
 
 from utils.button_style import make_inline_button, build_inline_keyboard
 from utils.telegram_api import TelegramAPI
@@ -24,6 +27,31 @@ logger = logging.getLogger(__name__)
 # Các lệnh được phép dùng khi chưa chấp nhận chính sách
 ALLOWED_COMMANDS_WITHOUT_CONSENT = {"start", "trogiup", "chinhsach"}
 
+# Cache user đã chấp nhận chính sách: TTL (giây) và số user tối đa giữ trong RAM
+CONSENT_CACHE_TTL = 300
+CONSENT_CACHE_MAX_SIZE = 10_000
+
+POLICY_MESSAGE = (
+    "🔐 <b>Chính sách bảo mật & điều khoản sử dụng</b>\n\n"
+    "Khi sử dụng bot này, bạn xác nhận và đồng ý:\n"
+    "<blockquote>"
+    "1. Bot sẽ lưu trữ thông tin tài khoản để cung cấp tính năng.\n"
+    "2. Dữ liệu được lưu trên hệ thống máy chủ và có thể tồn tại rủi ro bảo mật ngoài ý muốn.\n"
+    "3. Chủ bot không chịu trách nhiệm cho các thiệt hại phát sinh do rò rỉ dữ liệu, truy cập trái phép hoặc sự cố từ bên thứ ba.\n"
+    "4. Bạn tự chịu trách nhiệm với quyết định cung cấp thông tin tài khoản cho bot."
+    "</blockquote>\n\n"
+    "Nhấn nút bên dưới để tiếp tục."
+)
+
+# Keyboard chỉ có 2 dạng (đã / chưa chấp nhận) → dựng 1 lần lúc import
+_POLICY_KEYBOARD_CONSENTED = build_inline_keyboard([
+    [make_inline_button("Từ chối", "consent_decline", tone="danger")],
+])
+_POLICY_KEYBOARD_PENDING = build_inline_keyboard([[
+    make_inline_button("Chấp nhận", "consent_accept", tone="success"),
+    make_inline_button("Từ chối", "consent_decline", tone="danger"),
+]])
+
 
 class ChinhSachHandler:
     """Handler cho `/chinhsach` — hiển thị và xử lý chấp nhận chính sách."""
@@ -33,48 +61,51 @@ class ChinhSachHandler:
         self.cache_manager = cache_manager
         self.config = Config()
         self.telegram = telegram_api or TelegramAPI(self.config)
+        # user_id -> thời điểm (monotonic) xác nhận đã chấp nhận. Chỉ cache kết quả
+        # "đã chấp nhận" — user chưa chấp nhận luôn được kiểm tra lại từ DB.
+        self._consented: "OrderedDict[int, float]" = OrderedDict()
 
     # ==================== Helpers ====================
 
     @staticmethod
-    def extract_command_name(message_text: str) -> str:
-        """Tách tên command từ message text. Vd: `/tkb@bot_name` → `tkb`."""
+    def split_command(message_text: str) -> Tuple[str, str]:
+        """Tách `(tên command, phần tham số thô)` từ message text.
+
+        Vd: `/tkb@bot_name 1` → `("tkb", "1")`. Không phải command → `("", "")`.
+        """
         if not message_text or not message_text.startswith("/"):
-            return ""
-        first = message_text.split()[0]
-        command = first[1:]
-        if "@" in command:
-            command = command.split("@")[0]
-        return command.lower()
+            return "", ""
+        # maxsplit=1: chỉ tách token đầu; phần tham số giữ nguyên khoảng trắng bên trong
+        parts = message_text.split(maxsplit=1)
+        command = parts[0][1:].partition("@")[0].lower()
+        return command, parts[1] if len(parts) > 1 else ""
 
     async def has_user_consented(self, user_id: int) -> bool:
-        """Kiểm tra user đã chấp nhận chính sách hay chưa."""
-        return await self.db_manager.has_accepted_policy(user_id)
+        """Kiểm tra user đã chấp nhận chính sách hay chưa (cache trong RAM `CONSENT_CACHE_TTL` giây)."""
+        now = time.monotonic()
+        checked_at = self._consented.get(user_id)
+        if checked_at is not None and now - checked_at < CONSENT_CACHE_TTL:
+            return True
+        consented = await self.db_manager.has_accepted_policy(user_id)
+        if consented:
+            self._remember_consent(user_id, now)
+        else:
+            self._consented.pop(user_id, None)
+        return consented
+
+    def _remember_consent(self, user_id: int, now: float) -> None:
+        self._consented[user_id] = now
+        self._consented.move_to_end(user_id)
+        while len(self._consented) > CONSENT_CACHE_MAX_SIZE:
+            self._consented.popitem(last=False)
 
     # ==================== Public API ====================
 
     def get_policy_message(self) -> str:
-        return (
-            "🔐 <b>Chính sách bảo mật & điều khoản sử dụng</b>\n\n"
-            "Khi sử dụng bot này, bạn xác nhận và đồng ý:\n"
-            "<blockquote>"
-            "1. Bot sẽ lưu trữ thông tin tài khoản để cung cấp tính năng.\n"
-            "2. Dữ liệu được lưu trên hệ thống máy chủ và có thể tồn tại rủi ro bảo mật ngoài ý muốn.\n"
-            "3. Chủ bot không chịu trách nhiệm cho các thiệt hại phát sinh do rò rỉ dữ liệu, truy cập trái phép hoặc sự cố từ bên thứ ba.\n"
-            "4. Bạn tự chịu trách nhiệm với quyết định cung cấp thông tin tài khoản cho bot."
-            "</blockquote>\n\n"
-            "Nhấn nút bên dưới để tiếp tục."
-        )
+        return POLICY_MESSAGE
 
     def get_policy_keyboard(self, has_consented: bool) -> dict:
-        if has_consented:
-            rows = [[make_inline_button("Từ chối", "consent_decline", tone="danger")]]
-        else:
-            rows = [[
-                make_inline_button("Chấp nhận", "consent_accept", tone="success"),
-                make_inline_button("Từ chối", "consent_decline", tone="danger"),
-            ]]
-        return build_inline_keyboard(rows)
+        return _POLICY_KEYBOARD_CONSENTED if has_consented else _POLICY_KEYBOARD_PENDING
 
     async def cmd_chinhsach(self, chat_id: int, user_id: int, reply_to_message_id: Optional[int]) -> None:
         has_consented = await self.has_user_consented(user_id)
@@ -92,11 +123,13 @@ class ChinhSachHandler:
 
         if callback_data == "consent_accept":
             await self.db_manager.set_policy_consent(user_id, True)
+            self._remember_consent(user_id, time.monotonic())
             new_text = (
                 "✅ Bạn đã chấp nhận chính sách.\n\n"
                 "Bây giờ bạn có thể sử dụng các lệnh chính như /dangnhap, /tkb, /diemdanh..."
             )
         elif callback_data == "consent_decline":
+            self._consented.pop(user_id, None)
             await self.db_manager.set_policy_consent(user_id, False)
             await self.db_manager.delete_all_accounts(user_id)
             await self.cache_manager.clear_user_cache(user_id)
@@ -8,11 +8,13 @@ Hiển thị danh sách tất cả tài khoản user đã đăng nhập, cho ph
 account active bằng callback.
 
 Cú pháp callback:
-    switch_account_<username>  - chuyển account active
+    sa:<index>                 - chuyển account active (index trong menu đã gửi)
+    switch_account_<username>  - format cũ, vẫn nhận cho các menu gửi trước đây
 """
 
 import logging
-from typing import List, Dict, Any, Optional
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Tuple
 
 from utils.button_style import make_inline_button, build_inline_keyboard
 from utils.telegram_api import TelegramAPI, TelegramAPIError
@@ -20,6 +22,9 @@ from config.config import Config
 
 logger = logging.getLogger(__name__)
 
+# Số menu `/danhsach` tối đa được nhớ (LRU theo (chat_id, message_id))
+MENU_CACHE_MAX_SIZE = 10_000
+
 
 class DanhSachHandler:
     """Handler cho `/danhsach` — liệt kê tài khoản, chuyển active."""
@@ -30,15 +35,61 @@ class DanhSachHandler:
         self.logout_handler = logout_handler
         self.config = Config()
         self.telegram = telegram_api or TelegramAPI(self.config)
+        # (chat_id, message_id) -> (etag, danh sách account theo thứ tự nút) của menu đang hiển thị
+        self._menus: "OrderedDict[Tuple[int, int], Tuple[int, List[Dict[str, Any]]]]" = OrderedDict()
+
+    # ==================== Helpers ====================
+
+    @staticmethod
+    def _active_of(accounts: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """Lấy account active từ list (mỗi row đã có `is_active`) — khỏi query riêng."""
+        return next((acc for acc in accounts if acc.get("is_active")), None)
+
+    @staticmethod
+    def _accounts_etag(accounts: List[Dict[str, Any]]) -> int:
+        return hash(tuple(
+            (acc.get("username"), acc.get("ho_ten"), bool(acc.get("is_active")))
+            for acc in accounts
+        ))
+
+    def _remember_menu(self, chat_id: int, message_id: int, accounts: List[Dict[str, Any]]) -> None:
+        key = (chat_id, message_id)
+        self._menus[key] = (self._accounts_etag(accounts), accounts)
+        self._menus.move_to_end(key)
+        while len(self._menus) > MENU_CACHE_MAX_SIZE:
+            self._menus.popitem(last=False)
+
+    def _resolve_username(self, chat_id: int, message_id: int, callback_data: str) -> Optional[str]:
+        """Đổi `sa:<index>` về username theo menu đã gửi. None nếu menu đã hết hạn."""
+        if callback_data.startswith("switch_account_"):
+            return callback_data.removeprefix("switch_account_")
+        menu = self._menus.get((chat_id, message_id))
+        try:
+            index = int(callback_data.removeprefix("sa:"))
+        except ValueError:
+            return None
+        if menu is None or not 0 <= index < len(menu[1]):
+            return None
+        return menu[1][index].get("username")
+
+    def _render_menu(self, accounts: List[Dict[str, Any]]) -> Tuple[str, Dict[str, Any]]:
+        """Dựng text + keyboard cho menu `/danhsach` (dùng chung cho lệnh và callback)."""
+        active_account = self._active_of(accounts)
+        active_username = active_account.get("username") if active_account else None
+        return (
+            self._format_message(active_account),
+            self._build_keyboard(accounts, active_username),
+        )
 
     def _build_keyboard(self, accounts: List[Dict[str, Any]], active_username: Optional[str]) -> Dict[str, Any]:
-        rows = []
-        for acc in accounts:
-            ho_ten = acc.get("ho_ten") or acc.get("username", "Unknown")
-            username = acc.get("username", "")
-            tone = "success" if username == active_username else None
-            rows.append([make_inline_button(ho_ten, f"switch_account_{username}", tone=tone)])
-        return build_inline_keyboard(rows)
+        return build_inline_keyboard([
+            [make_inline_button(
+                acc.get("ho_ten") or acc.get("username", "Unknown"),
+                f"sa:{i}",
+                tone="success" if acc.get("username", "") == active_username else None,
+            )]
+            for i, acc in enumerate(accounts)
+        ])
 
     def _format_message(self, active_account: Optional[Dict[str, Any]]) -> str:
         lines = ["📋 *Danh sách tài khoản*"]
@@ -50,6 +101,22 @@ class DanhSachHandler:
         lines.append("Chọn tài khoản để chuyển đổi:")
         return "\n".join(lines)
 
+    async def _redraw_menu(self, chat_id: int, message_id: int, accounts: List[Dict[str, Any]]) -> None:
+        """Edit menu theo `accounts` (bỏ qua lỗi "message is not modified")."""
+        text, keyboard = self._render_menu(accounts)
+        try:
+            await self.telegram.edit_message_text_plain(
+                chat_id=chat_id,
+                message_id=message_id,
+                text=text,
+                reply_markup=keyboard,
+                parse_mode="Markdown",
+            )
+        except TelegramAPIError as e:
+            if "message is not modified" not in e.description.lower():
+                raise
+        self._remember_menu(chat_id, message_id, accounts)
+
     async def cmd_danhsach(self, chat_id: int, user_id: int, reply_to_message_id: Optional[int]) -> None:
         accounts = await self.db_manager.get_user_accounts(user_id, order_by_login_time=True)
         if not accounts:
@@ -59,48 +126,88 @@ class DanhSachHandler:
                 reply_to_message_id=reply_to_message_id,
             )
             return
-        active_account = await self.db_manager.get_active_account(user_id)
-        active_username = active_account.get("username") if active_account else None
-        await self.telegram.send_message(
+        text, keyboard = self._render_menu(accounts)
+        sent = await self.telegram.send_message(
             chat_id=chat_id,
-            text=self._format_message(active_account),
-            reply_markup=self._build_keyboard(accounts, active_username),
+            text=text,
+            reply_markup=keyboard,
             parse_mode="Markdown",
             reply_to_message_id=reply_to_message_id,
         )
+        if sent and sent.get("message_id"):
+            self._remember_menu(chat_id, sent["message_id"], accounts)
 
     async def cb_switch(self, callback_id: str, chat_id: int, message_id: int,
                        user_id: int, callback_data: str) -> None:
-        if not callback_data.startswith("switch_account_"):
+        username = self._resolve_username(chat_id, message_id, callback_data)
+        if not username:
+            await self.telegram.answer_callback_query(
+                callback_id, text="Menu đã hết hạn, vui lòng gửi lại /danhsach.", show_alert=True
+            )
             return
-        username = callback_data[len("switch_account_"):]
 
-        await self.db_manager.set_active_account(user_id, username)
-        await self.cache_manager.clear_user_cache(user_id)
+        # Bấm lại account đang active (vd double-tap) → không ghi DB, không xóa cache, không edit.
+        # Menu có thể đã cũ (đổi account qua menu khác / `/dangnhap`) → đối chiếu account
+        # active thật (đã cache trong DatabaseManager) trước khi bỏ qua.
+        menu = self._menus.get((chat_id, message_id))
+        if menu is not None and any(
+            acc.get("username") == username and acc.get("is_active") for acc in menu[1]
+        ):
+            active = await self.db_manager.get_active_account(user_id)
+            if active and active.get("username") == username:
+                await self.telegram.answer_callback_query(
+                    callback_id, text=f"Đang sử dụng: {username}"
+                )
+                return
 
-        accounts = await self.db_manager.get_user_accounts(user_id, order_by_login_time=True)
-        active_account = await self.db_manager.get_active_account(user_id)
-        active_username = active_account.get("username") if active_account else None
+        if not await self.db_manager.set_active_account(user_id, username):
+            # Ghi DB lỗi → menu có thể đang sai, vẽ lại theo dữ liệu thật
+            await self.telegram.answer_callback_query(
+                callback_id, text=f"Không thể chuyển sang tài khoản {username}. Vui lòng thử lại.",
+                show_alert=True,
+            )
+            accounts = await self.db_manager.get_user_accounts(user_id, order_by_login_time=True)
+            if accounts:
+                await self._redraw_menu(chat_id, message_id, accounts)
+            return
+        await self.cache_manager.clear_user_cache(user_id)
 
+        # Đã biết chính xác thay đổi (chỉ đổi `is_active`) → cập nhật list của menu
+        # trong RAM thay vì đọc lại từ DB. Menu không còn trong cache thì mới query.
+        if menu is not None and any(acc.get("username") == username for acc in menu[1]):
+            accounts = [{**acc, "is_active": acc.get("username") == username} for acc in menu[1]]
+        else:
+            accounts = await self.db_manager.get_user_accounts(user_id, order_by_login_time=True)
         if not accounts:
             await self.telegram.answer_callback_query(
                 callback_id, text="Không còn tài khoản nào.", show_alert=True
             )
             return
 
+        # Danh sách hiển thị không đổi (vd bấm lại account đang active) → khỏi edit
+        etag = self._accounts_etag(accounts)
+        if menu is not None and menu[0] == etag:
+            await self.telegram.answer_callback_query(
+                callback_id, text=f"Đang sử dụng: {username}"
+            )
+            return
+
+        text, keyboard = self._render_menu(accounts)
         try:
             await self.telegram.edit_message_text_plain(
                 chat_id=chat_id,
                 message_id=message_id,
-                text=self._format_message(active_account),
-                reply_markup=self._build_keyboard(accounts, active_username),
+                text=text,
+                reply_markup=keyboard,
                 parse_mode="Markdown",
             )
+            self._remember_menu(chat_id, message_id, accounts)
             await self.telegram.answer_callback_query(
                 callback_id, text=f"Đã chuyển sang tài khoản: {username}"
             )
         except TelegramAPIError as e:
             if "message is not modified" in e.description.lower():
+                self._remember_menu(chat_id, message_id, accounts)
                 await self.telegram.answer_callback_query(
                     callback_id, text=f"Đang sử dụng: {username}"
                 )
@@ -19,7 +19,7 @@ State tạm per user (lưu trong cache):
     input: chuỗi số đã nhập
 
 Cú pháp callback:
-    diemdanh_campus_<campus>  - chọn campus
+    diemdanh_campus_<index>   - chọn campus (index trong `CAMPUS_NAMES`)
     num_<digit>               - nhập 1 số
     num_exit                  - thoát
     num_delete                - xóa 1 số
@@ -28,11 +28,10 @@ Cú pháp callback:
 import asyncio
 import json
 import logging
-import os
+import re
 from typing import Any, Dict, List, Optional
 
 import aiohttp
-from datetime import datetime, timedelta
 
 from config.config import Config
 from utils.button_style import make_inline_button, build_inline_keyboard
@@ -43,14 +42,53 @@ from utils.rich_message import (
     p_html,
     section_heading,
 )
+from utils.debounce import Debouncer
 from utils.state_store import StateStore
+from utils.http_client import HttpClient
 from utils.telegram_api import TelegramAPI, TelegramAPIError
-from handlers.vi_tri_handler import CAMPUS_LOCATIONS, build_campus_map_block
+from utils.utils import NOT_LOGGED_IN_MESSAGE
+from handlers.vi_tri_handler import (
+    CAMPUS_LOCATIONS,
+    build_campus_keyboard,
+    build_campus_map_block,
+    campus_from_token,
+)
 
 logger = logging.getLogger(__name__)
 
 # Số chữ số cần nhập cho mã điểm danh
 CODE_LENGTH = 4
+# Chỉ nhận chữ số ASCII: `str.isdigit()` cũng True với chữ số Unicode (vd `١٢٣٤`)
+# mà API HUTECH sẽ từ chối → chặn luôn từ phía bot.
+DIGIT_RE = re.compile(r"[0-9]")
+CODE_RE = re.compile(rf"[0-9]{{{CODE_LENGTH}}}")
+
+# Các key state của flow điểm danh (dùng chung với /diemdanhtatca). Kết thúc flow
+# chỉ xoá các key này, không đụng state của flow khác (vd /tkb đang chọn môn xuất).
+DIEMDANH_STATE_KEYS = ("feature", "campus", "input", "accounts_count")
+
+# Thời gian (giây) gộp các lần bấm keypad liên tiếp trước khi edit message.
+# Telegram chỉ cho ~1 edit/giây mỗi chat → gộp rộng tay để bấm nhanh không dính 429.
+NUMERIC_EDIT_DEBOUNCE = 0.25
+
+
+def build_numeric_keyboard(callback_prefix: str) -> Dict[str, Any]:
+    """Dựng bàn phím số 3x4 (1-9, Thoát / 0 / Xoá), callback là `<callback_prefix><phím>`."""
+    rows: List[List[Dict[str, Any]]] = [
+        [make_inline_button(d, f"{callback_prefix}{d}", tone=None) for d in digits]
+        for digits in ("123", "456", "789")
+    ]
+    rows.append([
+        make_inline_button("Thoát", f"{callback_prefix}exit", tone="danger"),
+        make_inline_button("0", f"{callback_prefix}0", tone=None),
+        make_inline_button("Xoá", f"{callback_prefix}delete", tone="warning"),
+    ])
+    return build_inline_keyboard(rows)
+
+
+# Keyboard tĩnh — dựng 1 lần lúc import, dùng lại cho mọi lần gửi / edit
+NUMERIC_KEYBOARD = build_numeric_keyboard("num_")
+CAMPUS_KEYBOARD = build_campus_keyboard("diemdanh_campus_")
 
 
 class DiemDanhHandler:
@@ -60,21 +98,28 @@ class DiemDanhHandler:
         self.db_manager = db_manager
         self.cache_manager = cache_manager
         self.config = Config()
+        self.http = HttpClient()
         self.telegram = telegram_api or TelegramAPI(self.config)
         self.state = StateStore(self.cache_manager)
+        # Gộp các lần vẽ lại keypad khi user bấm số liên tục (key: (chat_id, message_id))
+        self._numeric_edits = Debouncer(NUMERIC_EDIT_DEBOUNCE)
 
     # ==================== Command ====================
 
     async def cmd_diemdanh(self, chat_id: int, user_id: int, reply_to_message_id: Optional[int]) -> None:
-        if not await self.db_manager.is_user_logged_in(user_id):
+        # 2 query độc lập → chạy song song thay vì check login rồi mới lấy campus
+        logged_in, preferred = await asyncio.gather(
+            self.db_manager.is_user_logged_in(user_id),
+            self.db_manager.get_user_preferred_campus(user_id),
+        )
+        if not logged_in:
             await self.telegram.send_message(
                 chat_id=chat_id,
-                text="Bạn chưa đăng nhập. Vui lòng /dangnhap để đăng nhập.",
+                text=NOT_LOGGED_IN_MESSAGE,
                 reply_to_message_id=reply_to_message_id,
             )
             return
 
-        preferred = await self.db_manager.get_user_preferred_campus(user_id)
         if preferred:
             await self._start_numeric_input(chat_id, user_id, preferred, reply_to_message_id)
         else:
@@ -86,16 +131,20 @@ class DiemDanhHandler:
                        user_id: int, callback_data: str) -> None:
         if not callback_data.startswith("diemdanh_campus_"):
             return
-        campus_name = callback_data[len("diemdanh_campus_"):]
-        await self.state.set_state(user_id, {
+        campus_name = campus_from_token(callback_data.removeprefix("diemdanh_campus_"))
+        if not campus_name:
+            await self.telegram.answer_callback_query(callback_id, text="Vị trí không hợp lệ.")
+            return
+        await self.state.update_state(user_id, {
             "feature": "diemdanh",
             "campus": campus_name,
             "input": "",
         })
-        await self.telegram.answer_callback_query(
-            callback_id, text=f"Bạn đang chọn: {campus_name}"
+        # answer và edit độc lập nhau → gửi song song, bớt 1 RTT
+        await asyncio.gather(
+            self.telegram.answer_callback_query(callback_id, text=f"Bạn đang chọn: {campus_name}"),
+            self._edit_numeric(chat_id, message_id, campus_name, ""),
         )
-        await self._render_numeric(chat_id, message_id, user_id, edit=True)
 
     async def cb_numeric(self, callback_id: str, chat_id: int, message_id: int,
                         user_id: int, callback_data: str) -> None:
@@ -108,7 +157,11 @@ class DiemDanhHandler:
         current = st.get("input", "")
 
         if callback_data == "num_exit":
-            await self.state.clear_state(user_id)
+            await asyncio.gather(
+                self.telegram.answer_callback_query(callback_id),
+                self._numeric_edits.cancel((chat_id, message_id)),
+                self.state.discard_keys(user_id, *DIEMDANH_STATE_KEYS),
+            )
             try:
                 await self.telegram.edit_message_text_rich(
                     chat_id=chat_id,
@@ -122,18 +175,32 @@ class DiemDanhHandler:
         if callback_data == "num_delete":
             current = current[:-1]
         elif callback_data.startswith("num_"):
-            num = callback_data[len("num_"):]
-            if len(current) < CODE_LENGTH:
+            num = callback_data.removeprefix("num_")
+            if DIGIT_RE.fullmatch(num) and len(current) < CODE_LENGTH:
                 current += num
         else:
             return
 
-        await self.state.set_state(user_id, {**st, "input": current})
+        # Bấm Xoá khi chưa nhập / bấm số khi đã đủ → input không đổi, khỏi ghi state + edit
+        if current == st.get("input", ""):
+            await self.telegram.answer_callback_query(callback_id)
+            return
+
+        # Tắt spinner của nút song song với ghi state, không chờ nhau
+        await asyncio.gather(
+            self.telegram.answer_callback_query(callback_id),
+            self.state.set_state(user_id, {**st, "input": current}),
+        )
 
         if len(current) == CODE_LENGTH:
+            # Lần bấm cuối submit ngay, bỏ lần vẽ lại đang chờ
+            await self._numeric_edits.cancel((chat_id, message_id))
             await self._do_submit(chat_id, message_id, user_id, campus, current)
         else:
-            await self._render_numeric(chat_id, message_id, user_id, edit=True)
+            self._numeric_edits.schedule(
+                (chat_id, message_id),
+                lambda: self._edit_numeric(chat_id, message_id, campus, current),
+            )
 
     # ==================== Internal ====================
 
@@ -143,24 +210,16 @@ class DiemDanhHandler:
             p("Chọn campus để bắt đầu điểm danh."),
             p_html("<i>💡 Tip: Dùng /vitri để lưu vị trí mặc định và bỏ qua bước này.</i>"),
         ])
-        rows: List[List[Dict[str, Any]]] = []
-        row: List[Dict[str, Any]] = []
-        keys = list(CAMPUS_LOCATIONS.keys())
-        for i, name in enumerate(keys):
-            row.append(make_inline_button(name, f"diemdanh_campus_{name}", tone=None, emoji="📍"))
-            if len(row) == 2 or i == len(keys) - 1:
-                rows.append(row)
-                row = []
         await self.telegram.send_rich_message(
             chat_id=chat_id,
             html=html,
-            reply_markup=build_inline_keyboard(rows),
+            reply_markup=CAMPUS_KEYBOARD,
             reply_to_message_id=reply_to_message_id,
         )
 
     async def _start_numeric_input(self, chat_id: int, user_id: int, campus_name: str,
                                     reply_to_message_id: Optional[int]) -> None:
-        await self.state.set_state(user_id, {
+        await self.state.update_state(user_id, {
             "feature": "diemdanh",
             "campus": campus_name,
             "input": "",
@@ -168,26 +227,23 @@ class DiemDanhHandler:
         await self.telegram.send_rich_message(
             chat_id=chat_id,
             html=self._numeric_rich_html(campus_name, ""),
-            reply_markup=build_inline_keyboard(self._numeric_keyboard_rows()),
+            reply_markup=NUMERIC_KEYBOARD,
             reply_to_message_id=reply_to_message_id,
         )
 
-    async def _render_numeric(self, chat_id: int, message_id: int, user_id: int, edit: bool = True) -> None:
-        st = await self.state.get_state(user_id)
-        campus = st.get("campus", "")
-        current = st.get("input", "")
-        html = self._numeric_rich_html(campus, current)
-        if edit:
-            try:
-                await self.telegram.edit_message_text_rich(
-                    chat_id=chat_id,
-                    message_id=message_id,
-                    html=html,
-                    reply_markup=build_inline_keyboard(self._numeric_keyboard_rows()),
-                )
-            except TelegramAPIError as e:
-                if "message is not modified" not in e.description.lower():
-                    raise
+    async def _edit_numeric(self, chat_id: int, message_id: int, campus: str, current: str) -> None:
+        # Vẽ từ giá trị caller đang giữ (lần hẹn debounce mới nhất luôn mang input
+        # mới nhất) thay vì đọc lại state; keypad là hằng dựng sẵn
+        try:
+            await self.telegram.edit_message_text_rich(
+                chat_id=chat_id,
+                message_id=message_id,
+                html=self._numeric_rich_html(campus, current),
+                reply_markup=NUMERIC_KEYBOARD,
+            )
+        except TelegramAPIError as e:
+            if "message is not modified" not in e.description.lower():
+                raise
 
     @staticmethod
     def _code_display(current: str) -> str:
@@ -211,60 +267,41 @@ class DiemDanhHandler:
             p("Dùng /diemdanh để bắt đầu lại."),
         ])
 
-    @staticmethod
-    def _numeric_keyboard_rows() -> List[List[Dict[str, Any]]]:
-        return [
-            [
-                make_inline_button("1", "num_1", tone=None),
-                make_inline_button("2", "num_2", tone=None),
-                make_inline_button("3", "num_3", tone=None),
-            ],
-            [
-                make_inline_button("4", "num_4", tone=None),
-                make_inline_button("5", "num_5", tone=None),
-                make_inline_button("6", "num_6", tone=None),
-            ],
-            [
-                make_inline_button("7", "num_7", tone=None),
-                make_inline_button("8", "num_8", tone=None),
-                make_inline_button("9", "num_9", tone=None),
-            ],
-            [
-                make_inline_button("Thoát", "num_exit", tone="danger"),
-                make_inline_button("0", "num_0", tone=None),
-                make_inline_button("Xoá", "num_delete", tone="warning"),
-            ],
-        ]
-
     async def _do_submit(self, chat_id: int, message_id: int, user_id: int,
                          campus_name: str, code: str) -> None:
-        # Hiển thị "Đang điểm danh..." ngay khi nhập đủ (giữ map + keypad)
+        # Hiển thị "Đang điểm danh..." song song với request điểm danh: placeholder
+        # không cần xong trước khi gửi mã, chỉ cần xong trước khi edit ra kết quả
+        _, result = await asyncio.gather(
+            self._show_submitting(chat_id, message_id, self._submitting_rich_html(campus_name, code)),
+            self.handle_submit_diem_danh(user_id, code, campus_name),
+        )
+        await self.state.discard_keys(user_id, *DIEMDANH_STATE_KEYS)
+
+        result_html = self._result_rich_html(campus_name, result)
         try:
             await self.telegram.edit_message_text_rich(
                 chat_id=chat_id,
                 message_id=message_id,
-                html=self._submitting_rich_html(campus_name, code),
+                html=result_html,
             )
         except TelegramAPIError as e:
             if "message is not modified" not in e.description.lower():
-                raise
-
-        result = await self.handle_submit_diem_danh(user_id, code, campus_name)
-        await self.state.clear_state(user_id)
+                # Fallback: gửi text thường nếu rich không khả thi
+                await self.telegram.send_message(
+                    chat_id=chat_id, text=result["message"], parse_mode="HTML"
+                )
 
-        result_html = self._result_rich_html(campus_name, result)
+    async def _show_submitting(self, chat_id: int, message_id: int, html: str) -> None:
+        # Placeholder chỉ để hiển thị → lỗi edit không được chặn việc gửi mã
         try:
             await self.telegram.edit_message_text_rich(
                 chat_id=chat_id,
                 message_id=message_id,
-                html=result_html,
+                html=html,
             )
         except TelegramAPIError as e:
             if "message is not modified" not in e.description.lower():
-                # Fallback: gửi text thường nếu rich không khả thi
-                await self.telegram.send_message(
-                    chat_id=chat_id, text=result["message"], parse_mode="HTML"
-                )
+                logger.debug("Không thể hiển thị trạng thái đang điểm danh: %s", e.description)
 
     @classmethod
     def _submitting_rich_html(cls, campus: str, code: str) -> str:
@@ -294,6 +331,8 @@ class DiemDanhHandler:
     # ==================== HUTECH API ====================
 
     async def handle_submit_diem_danh(self, telegram_user_id: int, code: str, campus_name: str) -> Dict[str, Any]:
+        if not CODE_RE.fullmatch(code):
+            return {"success": False, "message": f"🚫 Lỗi: Mã điểm danh phải gồm {CODE_LENGTH} chữ số."}
         try:
             token = await self._get_user_token(telegram_user_id)
             if not token:
@@ -349,21 +388,20 @@ class DiemDanhHandler:
                 "diuu": device_uuid,
                 "location": {"lat": location["lat"], "long": location["long"]},
             }
-            async with aiohttp.ClientSession() as session:
-                async with session.post(url, headers=headers, json=body) as response:
-                    if response.status == 200:
-                        return await response.json()
-                    error_text = await response.text()
-                    logger.error("Điểm danh API error: %s - %s", response.status, error_text)
-                    try:
-                        err = await response.json()
-                        return {
-                            "error": True,
-                            "status_code": response.status,
-                            "message": err.get("reasons", {}).get("message", error_text),
-                        }
-                    except Exception:
-                        return {"error": True, "status_code": response.status, "message": error_text}
+            async with self.http.session.post(url, headers=headers, json=body) as response:
+                if response.status == 200:
+                    return await response.json()
+                error_text = await response.text()
+                logger.error("Điểm danh API error: %s - %s", response.status, error_text)
+                try:
+                    err = await response.json()
+                    return {
+                        "error": True,
+                        "status_code": response.status,
+                        "message": err.get("reasons", {}).get("message", error_text),
+                    }
+                except Exception:
+                    return {"error": True, "status_code": response.status, "message": error_text}
         except aiohttp.ClientError as e:
             logger.error("HTTP client error: %s", e)
             return {"error": True, "message": f"Lỗi kết nối: {str(e)}"}
@@ -18,7 +18,7 @@ State tạm per user (lưu trong cache):
     accounts: danh sách accounts (cache lại lúc bắt đầu)
 
 Cú pháp callback:
-    diemdanhtatca_campus_<campus>  - chọn campus
+    diemdanhtatca_campus_<index>   - chọn campus (index trong `CAMPUS_NAMES`)
     num_tatca_<digit>              - nhập 1 số
     num_tatca_exit                 - thoát
     num_tatca_delete               - xóa 1 số
@@ -30,10 +30,8 @@ import logging
 from typing import Any, Dict, List, Optional
 
 import aiohttp
-from datetime import datetime, timedelta
 
 from config.config import Config
-from utils.button_style import make_inline_button, build_inline_keyboard
 from utils.rich_message import (
     escape_html,
     join_blocks,
@@ -42,13 +40,30 @@ from utils.rich_message import (
     section_heading,
     table,
 )
+from utils.debounce import Debouncer
 from utils.state_store import StateStore
+from utils.http_client import HttpClient
 from utils.telegram_api import TelegramAPI, TelegramAPIError
-from handlers.vi_tri_handler import CAMPUS_LOCATIONS, build_campus_map_block
+from handlers.vi_tri_handler import (
+    CAMPUS_LOCATIONS,
+    build_campus_keyboard,
+    build_campus_map_block,
+    campus_from_token,
+)
+from handlers.diem_danh_handler import (
+    CODE_LENGTH,
+    CODE_RE,
+    DIEMDANH_STATE_KEYS,
+    DIGIT_RE,
+    NUMERIC_EDIT_DEBOUNCE,
+    build_numeric_keyboard,
+)
 
 logger = logging.getLogger(__name__)
 
-CODE_LENGTH = 4
+# Keyboard tĩnh — dựng 1 lần lúc import, dùng lại cho mọi lần gửi / edit
+NUMERIC_KEYBOARD = build_numeric_keyboard("num_tatca_")
+CAMPUS_KEYBOARD = build_campus_keyboard("diemdanhtatca_campus_")
 
 
 class DiemDanhTatCaHandler:
@@ -58,13 +73,19 @@ class DiemDanhTatCaHandler:
         self.db_manager = db_manager
         self.cache_manager = cache_manager
         self.config = Config()
+        self.http = HttpClient()
         self.telegram = telegram_api or TelegramAPI(self.config)
         self.state = StateStore(self.cache_manager)
+        # Gộp các lần vẽ lại keypad khi user bấm số liên tục (key: (chat_id, message_id))
+        self._numeric_edits = Debouncer(NUMERIC_EDIT_DEBOUNCE)
 
     # ==================== Command ====================
 
     async def cmd_diemdanhtatca(self, chat_id: int, user_id: int, reply_to_message_id: Optional[int]) -> None:
-        accounts = await self.db_manager.get_user_accounts(user_id)
+        accounts, preferred = await asyncio.gather(
+            self.db_manager.get_user_accounts(user_id),
+            self.db_manager.get_user_preferred_campus(user_id),
+        )
         if not accounts:
             await self.telegram.send_message(
                 chat_id=chat_id,
@@ -74,7 +95,6 @@ class DiemDanhTatCaHandler:
             )
             return
 
-        preferred = await self.db_manager.get_user_preferred_campus(user_id)
         if preferred:
             await self._start_numeric(chat_id, user_id, preferred, len(accounts), reply_to_message_id)
         else:
@@ -86,18 +106,23 @@ class DiemDanhTatCaHandler:
                        user_id: int, callback_data: str) -> None:
         if not callback_data.startswith("diemdanhtatca_campus_"):
             return
-        campus = callback_data[len("diemdanhtatca_campus_"):]
+        campus = campus_from_token(callback_data.removeprefix("diemdanhtatca_campus_"))
+        if not campus:
+            await self.telegram.answer_callback_query(callback_id, text="Vị trí không hợp lệ.")
+            return
         accounts = await self.db_manager.get_user_accounts(user_id)
-        await self.state.set_state(user_id, {
+        accounts_count = len(accounts)
+        await self.state.update_state(user_id, {
             "feature": "diemdanhtatca",
             "campus": campus,
             "input": "",
-            "accounts_count": len(accounts),
+            "accounts_count": accounts_count,
         })
-        await self.telegram.answer_callback_query(
-            callback_id, text=f"Bạn đang chọn: {campus}"
+        # answer và edit độc lập nhau → gửi song song, bớt 1 RTT
+        await asyncio.gather(
+            self.telegram.answer_callback_query(callback_id, text=f"Bạn đang chọn: {campus}"),
+            self._edit_numeric(chat_id, message_id, campus, accounts_count, ""),
         )
-        await self._render_numeric(chat_id, message_id, user_id, edit=True)
 
     async def cb_numeric(self, callback_id: str, chat_id: int, message_id: int,
                         user_id: int, callback_data: str) -> None:
@@ -110,7 +135,11 @@ class DiemDanhTatCaHandler:
         current = st.get("input", "")
 
         if callback_data == "num_tatca_exit":
-            await self.state.clear_state(user_id)
+            await asyncio.gather(
+                self.telegram.answer_callback_query(callback_id),
+                self._numeric_edits.cancel((chat_id, message_id)),
+                self.state.discard_keys(user_id, *DIEMDANH_STATE_KEYS),
+            )
             try:
                 await self.telegram.edit_message_text_rich(
                     chat_id=chat_id,
@@ -124,18 +153,32 @@ class DiemDanhTatCaHandler:
         if callback_data == "num_tatca_delete":
             current = current[:-1]
         elif callback_data.startswith("num_tatca_"):
-            num = callback_data[len("num_tatca_"):]
-            if num.isdigit() and len(current) < CODE_LENGTH:
+            num = callback_data.removeprefix("num_tatca_")
+            if DIGIT_RE.fullmatch(num) and len(current) < CODE_LENGTH:
                 current += num
         else:
             return
 
-        await self.state.set_state(user_id, {**st, "input": current})
+        # Bấm Xoá khi chưa nhập / bấm số khi đã đủ → input không đổi, khỏi ghi state + edit
+        if current == st.get("input", ""):
+            await self.telegram.answer_callback_query(callback_id)
+            return
+
+        # Tắt spinner của nút song song với ghi state, không chờ nhau
+        await asyncio.gather(
+            self.telegram.answer_callback_query(callback_id),
+            self.state.set_state(user_id, {**st, "input": current}),
+        )
 
         if len(current) == CODE_LENGTH:
+            # Lần bấm cuối submit ngay, bỏ lần vẽ lại đang chờ
+            await self._numeric_edits.cancel((chat_id, message_id))
             await self._do_submit(chat_id, message_id, user_id, campus, current)
         else:
-            await self._render_numeric(chat_id, message_id, user_id, edit=True)
+            self._numeric_edits.schedule(
+                (chat_id, message_id),
+                lambda: self._edit_numeric(chat_id, message_id, campus, accounts_count, current),
+            )
 
     # ==================== Internal ====================
 
@@ -146,24 +189,16 @@ class DiemDanhTatCaHandler:
             p("Chọn campus để bắt đầu điểm danh."),
             p_html("<i>💡 Tip: Dùng /vitri để lưu vị trí mặc định và bỏ qua bước này.</i>"),
         ])
-        rows: List[List[Dict[str, Any]]] = []
-        row: List[Dict[str, Any]] = []
-        keys = list(CAMPUS_LOCATIONS.keys())
-        for i, name in enumerate(keys):
-            row.append(make_inline_button(name, f"diemdanhtatca_campus_{name}", tone=None, emoji="📍"))
-            if len(row) == 2 or i == len(keys) - 1:
-                rows.append(row)
-                row = []
         await self.telegram.send_rich_message(
             chat_id=chat_id,
             html=html,
-            reply_markup=build_inline_keyboard(rows),
+            reply_markup=CAMPUS_KEYBOARD,
             reply_to_message_id=reply_to_message_id,
         )
 
     async def _start_numeric(self, chat_id: int, user_id: int, campus: str,
                              accounts_count: int, reply_to_message_id: Optional[int]) -> None:
-        await self.state.set_state(user_id, {
+        await self.state.update_state(user_id, {
             "feature": "diemdanhtatca",
             "campus": campus,
             "input": "",
@@ -172,27 +207,23 @@ class DiemDanhTatCaHandler:
         await self.telegram.send_rich_message(
             chat_id=chat_id,
             html=self._numeric_rich_html(campus, accounts_count, ""),
-            reply_markup=build_inline_keyboard(self._numeric_rows()),
+            reply_markup=NUMERIC_KEYBOARD,
             reply_to_message_id=reply_to_message_id,
         )
 
-    async def _render_numeric(self, chat_id: int, message_id: int, user_id: int, edit: bool = True) -> None:
-        st = await self.state.get_state(user_id)
-        campus = st.get("campus", "")
-        accounts_count = st.get("accounts_count", 0)
-        current = st.get("input", "")
-        html = self._numeric_rich_html(campus, accounts_count, current)
-        if edit:
-            try:
-                await self.telegram.edit_message_text_rich(
-                    chat_id=chat_id,
-                    message_id=message_id,
-                    html=html,
-                    reply_markup=build_inline_keyboard(self._numeric_rows()),
-                )
-            except TelegramAPIError as e:
-                if "message is not modified" not in e.description.lower():
-                    raise
+    async def _edit_numeric(self, chat_id: int, message_id: int, campus: str,
+                            accounts_count: int, current: str) -> None:
+        # Vẽ từ giá trị caller đang giữ thay vì đọc lại state; keypad là hằng dựng sẵn
+        try:
+            await self.telegram.edit_message_text_rich(
+                chat_id=chat_id,
+                message_id=message_id,
+                html=self._numeric_rich_html(campus, accounts_count, current),
+                reply_markup=NUMERIC_KEYBOARD,
+            )
+        except TelegramAPIError as e:
+            if "message is not modified" not in e.description.lower():
+                raise
 
     @staticmethod
     def _code_display(current: str) -> str:
@@ -217,60 +248,41 @@ class DiemDanhTatCaHandler:
             p("Dùng /diemdanhtatca để bắt đầu lại."),
         ])
 
-    @staticmethod
-    def _numeric_rows() -> List[List[Dict[str, Any]]]:
-        return [
-            [
-                make_inline_button("1", "num_tatca_1", tone=None),
-                make_inline_button("2", "num_tatca_2", tone=None),
-                make_inline_button("3", "num_tatca_3", tone=None),
-            ],
-            [
-                make_inline_button("4", "num_tatca_4", tone=None),
-                make_inline_button("5", "num_tatca_5", tone=None),
-                make_inline_button("6", "num_tatca_6", tone=None),
-            ],
-            [
-                make_inline_button("7", "num_tatca_7", tone=None),
-                make_inline_button("8", "num_tatca_8", tone=None),
-                make_inline_button("9", "num_tatca_9", tone=None),
-            ],
-            [
-                make_inline_button("Thoát", "num_tatca_exit", tone="danger"),
-                make_inline_button("0", "num_tatca_0", tone=None),
-                make_inline_button("Xoá", "num_tatca_delete", tone="warning"),
-            ],
-        ]
-
     async def _do_submit(self, chat_id: int, message_id: int, user_id: int,
                          campus: str, code: str) -> None:
         st = await self.state.get_state(user_id)
         accounts_count = st.get("accounts_count", 0)
+        # Placeholder "Đang điểm danh..." chạy song song với request điểm danh
+        _, result = await asyncio.gather(
+            self._show_submitting(chat_id, message_id, self._submitting_rich_html(campus, accounts_count, code)),
+            self.handle_submit_all(user_id, code, campus),
+        )
+        await self.state.discard_keys(user_id, *DIEMDANH_STATE_KEYS)
+
         try:
             await self.telegram.edit_message_text_rich(
                 chat_id=chat_id,
                 message_id=message_id,
-                html=self._submitting_rich_html(campus, accounts_count, code),
+                html=self._result_rich_html(campus, result),
             )
         except TelegramAPIError as e:
             if "message is not modified" not in e.description.lower():
-                raise
-
-        result = await self.handle_submit_all(user_id, code, campus)
-        await self.state.clear_state(user_id)
+                # Fallback: gửi text thường nếu rich không khả thi
+                await self.telegram.send_message(
+                    chat_id=chat_id, text=result["message"], parse_mode="HTML"
+                )
 
+    async def _show_submitting(self, chat_id: int, message_id: int, html: str) -> None:
+        # Placeholder chỉ để hiển thị → lỗi edit không được chặn việc gửi mã
         try:
             await self.telegram.edit_message_text_rich(
                 chat_id=chat_id,
                 message_id=message_id,
-                html=self._result_rich_html(campus, result),
+                html=html,
             )
         except TelegramAPIError as e:
             if "message is not modified" not in e.description.lower():
-                # Fallback: gửi text thường nếu rich không khả thi
-                await self.telegram.send_message(
-                    chat_id=chat_id, text=result["message"], parse_mode="HTML"
-                )
+                logger.debug("Không thể hiển thị trạng thái đang điểm danh: %s", e.description)
 
     @classmethod
     def _submitting_rich_html(cls, campus: str, accounts_count: int, code: str) -> str:
@@ -305,6 +317,8 @@ class DiemDanhTatCaHandler:
     # ==================== HUTECH API ====================
 
     async def handle_submit_all(self, telegram_user_id: int, code: str, campus_name: str) -> Dict[str, Any]:
+        if not CODE_RE.fullmatch(code):
+            return {"success": False, "message": f"🚫 Lỗi: Mã điểm danh phải gồm {CODE_LENGTH} chữ số."}
         try:
             accounts = await self.db_manager.get_user_accounts(telegram_user_id)
             if not accounts:
@@ -403,17 +417,16 @@ class DiemDanhTatCaHandler:
                 "diuu": device_uuid,
                 "location": {"lat": location["lat"], "long": location["long"]},
             }
-            async with aiohttp.ClientSession() as session:
-                async with session.post(url, headers=headers, json=body) as response:
-                    if response.status == 200:
-                        return await response.json()
-                    error_text = await response.text()
-                    logger.error("Điểm danh API error: %s - %s", response.status, error_text)
-                    try:
-                        err = await response.json()
-                        return {"error": True, "status_code": response.status, "message": err.get("reasons", {}).get("message", error_text)}
-                    except Exception:
-                        return {"error": True, "status_code": response.status, "message": error_text}
+            async with self.http.session.post(url, headers=headers, json=body) as response:
+                if response.status == 200:
+                    return await response.json()
+                error_text = await response.text()
+                logger.error("Điểm danh API error: %s - %s", response.status, error_text)
+                try:
+                    err = await response.json()
+                    return {"error": True, "status_code": response.status, "message": err.get("reasons", {}).get("message", error_text)}
+                except Exception:
+                    return {"error": True, "status_code": response.status, "message": error_text}
         except aiohttp.ClientError as e:
             logger.error("HTTP client error: %s", e)
             return {"error": True, "message": f"Lỗi kết nối: {str(e)}"}
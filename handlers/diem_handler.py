@@ -11,7 +11,7 @@ Sử dụng Rich Message (Bot API 10.1):
   (STT, Mã HP, Tên, STC, KT1, KT2, Thi, Điểm 10, Điểm 4, Điểm chữ).
 - Menu học kỳ: `<h2>` cho mỗi học kỳ.
 
-Cú pháp callback:
+Cú pháp callback (bot route thẳng theo prefix tới từng `cb_*`):
     diem_<hocky_key>         - xem chi tiết học kỳ
     diem_more                - danh sách học kỳ cũ hơn
     diem_back                - quay lại menu chính
@@ -23,34 +23,44 @@ import asyncio
 import io
 import json
 import logging
-from datetime import datetime, timedelta
+from datetime import datetime
 from typing import Any, Dict, List, Optional
 
 import aiohttp
 import openpyxl
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
 
+from cache.base import USER_DATA_MAX_AGE
 from config.config import Config
+from utils import background
 from utils.button_style import make_inline_button, build_inline_keyboard
 from utils.rich_message import (
     escape_html,
     section_heading,
     h2,
-    h1,
     hr,
     p,
-    p_bold,
-    code,
-    footer,
     footer_updated_at,
     table,
     join_blocks,
-    kv_line,
 )
+from utils.http_client import HttpClient
 from utils.telegram_api import TelegramAPI, TelegramAPIError
+from utils.ttl_cache import MISSING, TtlLruCache
+from utils.utils import NOT_LOGGED_IN, NOT_LOGGED_IN_MESSAGE
 
 logger = logging.getLogger(__name__)
 
+# Nút "Quay lại" không đổi → dựng 1 lần, dùng chung cho mọi callback
+_BACK_BUTTON = make_inline_button("Quay lại", "diem_back", tone="neutral")
+
+# File Excel bảng điểm đã tạo, key theo (user, loại xuất, timestamp dữ liệu điểm).
+# Dữ liệu điểm được làm mới / xoá cache (đăng nhập lại, đổi tài khoản) thì
+# timestamp đổi → tự tạo file mới.
+XLSX_CACHE_TTL = 300
+XLSX_CACHE_MAX_SIZE = 256
+
 
 class DiemHandler:
     """Handler cho `/diem` — xem bảng điểm, xuất Excel."""
@@ -59,18 +69,13 @@ class DiemHandler:
         self.db_manager = db_manager
         self.cache_manager = cache_manager
         self.config = Config()
+        self.http = HttpClient()
         self.telegram = telegram_api or TelegramAPI(self.config)
+        self._xlsx_cache = TtlLruCache(XLSX_CACHE_TTL, XLSX_CACHE_MAX_SIZE)
 
     # ==================== Command ====================
 
     async def cmd_diem(self, chat_id: int, user_id: int, reply_to_message_id: Optional[int]) -> None:
-        if not await self.db_manager.is_user_logged_in(user_id):
-            await self.telegram.send_message(
-                chat_id=chat_id,
-                text="Bạn chưa đăng nhập. Vui lòng /dangnhap để đăng nhập.",
-                reply_to_message_id=reply_to_message_id,
-            )
-            return
         result = await self.handle_diem(user_id)
         if result["success"]:
             await self.telegram.send_rich_message(
@@ -85,90 +90,109 @@ class DiemHandler:
                 reply_to_message_id=reply_to_message_id,
             )
 
-    # ==================== Callback router ====================
+    # ==================== Callbacks ====================
 
-    async def cb_route(self, callback_id: str, chat_id: int, message_id: int,
-                       user_id: int, callback_data: str) -> None:
-        if not callback_data.startswith("diem_"):
+    async def cb_more(self, callback_id: str, chat_id: int, message_id: int,
+                      user_id: int, callback_data: str) -> None:
+        """`diem_more` — danh sách học kỳ cũ hơn."""
+        _, result = await asyncio.gather(
+            self.telegram.answer_callback_query(callback_id, text="Đang tải điểm..."),
+            self.handle_diem(user_id),
+        )
+        if not result["success"]:
+            await self._safe_edit(chat_id, message_id, result["message"], parse_mode="HTML")
             return
-        hocky_key = callback_data[len("diem_"):]
-
-        if hocky_key == "more":
-            await self.telegram.answer_callback_query(callback_id, text="Đang tải điểm...")
-            result = await self.handle_diem(user_id)
-            if not result["success"]:
-                await self._safe_edit(chat_id, message_id, result["message"], parse_mode="HTML")
-                return
-            older = self.get_older_hocky_list(result["data"])
-            if not older:
-                await self._safe_edit(chat_id, message_id, "Không có học kỳ cũ hơn để hiển thị.")
-                return
-            rows: List[List[Dict[str, Any]]] = []
-            for h in older:
-                rows.append([make_inline_button(h["name"], f"diem_{h['key']}", tone=None)])
-            rows.append([make_inline_button("Quay lại", "diem_back", tone="neutral")])
-            try:
-                await self.telegram.edit_message_text_rich(
-                    chat_id=chat_id,
-                    message_id=message_id,
-                    html=self.format_older_hocky_menu_message(result["data"]),
-                    reply_markup=build_inline_keyboard(rows),
-                )
-            except TelegramAPIError as e:
-                if "message is not modified" not in e.description.lower():
-                    raise
+        older = self.get_older_hocky_list(result["data"])
+        if not older:
+            await self._safe_edit(chat_id, message_id, "Không có học kỳ cũ hơn để hiển thị.")
             return
+        rows: List[List[Dict[str, Any]]] = []
+        for h in older:
+            rows.append([make_inline_button(h["name"], f"diem_{h['key']}", tone=None)])
+        rows.append([_BACK_BUTTON])
+        try:
+            await self.telegram.edit_message_text_rich(
+                chat_id=chat_id,
+                message_id=message_id,
+                html=self.format_older_hocky_menu_message(result["data"]),
+                reply_markup=build_inline_keyboard(rows),
+            )
+        except TelegramAPIError as e:
+            if "message is not modified" not in e.description.lower():
+                raise
 
-        if hocky_key == "back":
-            await self.telegram.answer_callback_query(callback_id, text="Đang tải điểm...")
-            result = await self.handle_diem(user_id)
-            if not result["success"]:
-                await self._safe_edit(chat_id, message_id, result["message"], parse_mode="HTML")
-                return
-            try:
-                await self.telegram.edit_message_text_rich(
-                    chat_id=chat_id,
-                    message_id=message_id,
-                    html=self.format_diem_menu_message(result["data"]),
-                    reply_markup=self.create_main_diem_keyboard(result["data"]),
-                )
-            except TelegramAPIError as e:
-                if "message is not modified" not in e.description.lower():
-                    raise
+    async def cb_back(self, callback_id: str, chat_id: int, message_id: int,
+                      user_id: int, callback_data: str) -> None:
+        """`diem_back` — quay lại menu điểm chính."""
+        _, result = await asyncio.gather(
+            self.telegram.answer_callback_query(callback_id, text="Đang tải điểm..."),
+            self.handle_diem(user_id),
+        )
+        if not result["success"]:
+            await self._safe_edit(chat_id, message_id, result["message"], parse_mode="HTML")
             return
+        try:
+            await self.telegram.edit_message_text_rich(
+                chat_id=chat_id,
+                message_id=message_id,
+                html=self.format_diem_menu_message(result["data"]),
+                reply_markup=self.create_main_diem_keyboard(result["data"]),
+            )
+        except TelegramAPIError as e:
+            if "message is not modified" not in e.description.lower():
+                raise
 
-        if hocky_key.startswith("export_"):
-            export_type = hocky_key[len("export_"):]
-            await self.telegram.answer_callback_query(callback_id, text="Đang tạo file Excel...")
-            result = await self.handle_diem(user_id)
-            if not result["success"]:
-                await self._safe_edit(chat_id, message_id, result["message"], parse_mode="HTML")
-                return
-            try:
-                if export_type == "all":
-                    excel_bytes = await asyncio.to_thread(self.generate_diem_xlsx, result["data"])
-                    filename = "diem_toan_bo.xlsx"
-                    caption = "📄 Bảng điểm toàn bộ"
-                else:
-                    excel_bytes = await asyncio.to_thread(
-                        self.generate_diem_xlsx, result["data"], export_type
-                    )
-                    hocky_name = (
-                        result["data"].get("hocky_data", {}).get(export_type, {}).get("hocky_name", export_type)
-                    )
-                    filename = f"diem_{hocky_name}.xlsx"
-                    caption = f"📄 Bảng điểm {hocky_name}"
-                await self.telegram.send_document(
-                    chat_id=chat_id, file=excel_bytes, filename=filename, caption=caption
-                )
-            except Exception as e:
-                logger.error("Lỗi tạo file Excel: %s", e, exc_info=True)
-                await self._safe_edit(chat_id, message_id, f"Lỗi tạo file Excel: {str(e)}")
+    async def cb_export(self, callback_id: str, chat_id: int, message_id: int,
+                        user_id: int, callback_data: str) -> None:
+        """`diem_export_all` / `diem_export_<hocky_key>` — xuất Excel."""
+        export_type = callback_data.removeprefix("diem_export_")
+        _, result = await asyncio.gather(
+            self.telegram.answer_callback_query(callback_id, text="Đang tạo file Excel..."),
+            self.handle_diem(user_id),
+        )
+        if not result["success"]:
+            await self._safe_edit(chat_id, message_id, result["message"], parse_mode="HTML")
             return
-
-        # Xem điểm chi tiết học kỳ
-        await self.telegram.answer_callback_query(callback_id, text="Đang tải điểm...")
-        result = await self.handle_diem(user_id, hocky_key)
+        # Tạo + upload file chạy nền để vòng polling nhận update tiếp ngay
+        background.spawn(
+            self._send_diem_xlsx(chat_id, message_id, user_id, result["data"], export_type),
+            name=f"diem_export:{user_id}",
+        )
+
+    async def _send_diem_xlsx(self, chat_id: int, message_id: int, user_id: int,
+                              diem_data: Dict[str, Any], export_type: str) -> None:
+        try:
+            xlsx_key = (user_id, export_type, diem_data.get("timestamp"))
+            excel_bytes = self._xlsx_cache.get(xlsx_key)
+            if excel_bytes is MISSING:
+                excel_bytes = await asyncio.to_thread(
+                    self.generate_diem_xlsx, diem_data, None if export_type == "all" else export_type
+                )
+                self._xlsx_cache.set(xlsx_key, excel_bytes)
+            if export_type == "all":
+                filename = "diem_toan_bo.xlsx"
+                caption = "📄 Bảng điểm toàn bộ"
+            else:
+                hocky_name = (
+                    diem_data.get("hocky_data", {}).get(export_type, {}).get("hocky_name", export_type)
+                )
+                filename = f"diem_{hocky_name}.xlsx"
+                caption = f"📄 Bảng điểm {hocky_name}"
+            await background.retry_on_flood(lambda: self.telegram.send_document(
+                chat_id=chat_id, file=excel_bytes, filename=filename, caption=caption
+            ))
+        except Exception as e:
+            logger.error("Lỗi tạo file Excel: %s", e, exc_info=True)
+            await self._safe_edit(chat_id, message_id, f"Lỗi tạo file Excel: {str(e)}")
+
+    async def cb_detail(self, callback_id: str, chat_id: int, message_id: int,
+                        user_id: int, callback_data: str) -> None:
+        """`diem_<hocky_key>` — xem điểm chi tiết 1 học kỳ."""
+        hocky_key = callback_data.removeprefix("diem_")
+        _, result = await asyncio.gather(
+            self.telegram.answer_callback_query(callback_id, text="Đang tải điểm..."),
+            self.handle_diem(user_id, hocky_key),
+        )
         if not result["success"]:
             await self._safe_edit(chat_id, message_id, result["message"], parse_mode="HTML")
             return
@@ -180,7 +204,7 @@ class DiemHandler:
                 reply_markup=build_inline_keyboard([
                     [
                         make_inline_button("Xuất Excel", f"diem_export_{hocky_key}", tone="warning", emoji="📄"),
-                        make_inline_button("Quay lại", "diem_back", tone="neutral"),
+                        _BACK_BUTTON,
                     ]
                 ]),
             )
@@ -201,7 +225,7 @@ class DiemHandler:
 
             token = await self._get_user_token(telegram_user_id)
             if not token:
-                return {"success": False, "message": "Bạn chưa đăng nhập. Vui lòng /dangnhap.", "data": None}
+                return {"success": False, "reason": NOT_LOGGED_IN, "message": NOT_LOGGED_IN_MESSAGE, "data": None}
 
             response = await self._call_diem_api(token)
             if isinstance(response, dict) and response.get("error"):
@@ -213,7 +237,7 @@ class DiemHandler:
                     "status_code": response.get("status_code"),
                 }
             if response and isinstance(response, list):
-                await self.cache_manager.set(cache_key, response, ttl=86400)
+                await self.cache_manager.set(cache_key, response, ttl=USER_DATA_MAX_AGE)
                 processed = self._process_diem_data(response, hocky_key)
                 cached_data = await self.cache_manager.get(cache_key)
                 processed["timestamp"] = (
@@ -240,11 +264,10 @@ class DiemHandler:
             url = f"{self.config.HUTECH_API_BASE_URL}{self.config.HUTECH_DIEM_ENDPOINT}"
             headers = self.config.HUTECH_MOBILE_HEADERS.copy()
             headers["authorization"] = f"JWT {token}"
-            async with aiohttp.ClientSession() as session:
-                async with session.post(url, headers=headers, json={}) as response:
-                    if response.status == 201:
-                        return await response.json()
-                    return {"error": True, "status_code": response.status, "message": await response.text()}
+            async with self.http.session.post(url, headers=headers, json={}) as response:
+                if response.status == 201:
+                    return await response.json()
+                return {"error": True, "status_code": response.status, "message": await response.text()}
         except aiohttp.ClientError as e:
             return {"error": True, "message": f"Lỗi kết nối: {str(e)}"}
         except json.JSONDecodeError as e:
@@ -499,8 +522,8 @@ class DiemHandler:
 
     def generate_diem_xlsx(self, diem_data: Dict[str, Any], hocky_key: Optional[str] = None) -> bytes:
         try:
-            wb = openpyxl.Workbook()
-            ws = wb.active
+            # write-only: từng hàng được ghi thẳng ra stream thay vì giữ cả sheet trong RAM
+            wb = openpyxl.Workbook(write_only=True)
             title_font = Font(name="Arial", size=16, bold=True)
             header_font = Font(name="Arial", size=12, bold=True, color="FFFFFF")
             cell_font = Font(name="Arial", size=11)
@@ -517,20 +540,23 @@ class DiemHandler:
             if hocky_key and hocky_key in hocky_data:
                 data = hocky_data[hocky_key]
                 hocky_name = data.get("hocky_name", "")
-                ws.title = hocky_name
+                ws = self._create_diem_sheet(wb, hocky_name)
                 self._write_hocky_to_sheet(ws, hocky_name, data, title_font, header_font, cell_font, tich_luy_font, header_fill, center, left, border)
             else:
-                ws.title = "Điểm Toàn Bộ"
-                sorted_keys = sorted(hocky_data.keys())
+                ws = self._create_diem_sheet(wb, "Điểm Toàn Bộ")
                 current_row = 1
-                for key in sorted_keys:
+                for i, key in enumerate(sorted(hocky_data.keys())):
+                    if i:
+                        # 2 hàng trống giữa các học kỳ
+                        ws.append([])
+                        ws.append([])
+                        current_row += 2
                     data = hocky_data[key]
                     hocky_name = data.get("hocky_name", "")
                     current_row = self._write_hocky_to_sheet(
                         ws, hocky_name, data, title_font, header_font, cell_font, tich_luy_font,
                         header_fill, center, left, border, start_row=current_row,
                     )
-                    current_row += 2
             buf = io.BytesIO()
             wb.save(buf)
             return buf.getvalue()
@@ -538,25 +564,41 @@ class DiemHandler:
             logger.error("Error generating điểm XLSX: %s", e, exc_info=True)
             raise
 
+    @staticmethod
+    def _create_diem_sheet(wb, title: str):
+        ws = wb.create_sheet(title=title)
+        # Sheet write-only phải đặt độ rộng cột trước khi ghi hàng đầu tiên
+        for col, width in zip("ABCDEFGHIJ", (5, 15, 40, 5, 8, 8, 8, 10, 10, 10)):
+            ws.column_dimensions[col].width = width
+        return ws
+
+    @staticmethod
+    def _cell(ws, value: Any, font, alignment, fill=None, border=None) -> WriteOnlyCell:
+        c = WriteOnlyCell(ws, value=value)
+        c.font = font
+        c.alignment = alignment
+        if fill is not None:
+            c.fill = fill
+        if border is not None:
+            c.border = border
+        return c
+
     def _write_hocky_to_sheet(self, ws, hocky_name, data, title_font, header_font, cell_font,
                                tich_luy_font, header_fill, center, left, border, start_row=1) -> int:
-        ws.merge_cells(start_row=start_row, start_column=1, end_row=start_row, end_column=10)
-        cell = ws.cell(row=start_row, column=1, value=f"BẢNG ĐIỂM HỌC KỲ: {hocky_name.upper()}")
-        cell.font = title_font
-        cell.alignment = center
+        """Ghi 1 học kỳ vào sheet write-only, bắt đầu ở `start_row` (hàng kế tiếp của sheet).
+
+        Trả về số thứ tự hàng kế tiếp sau phần vừa ghi.
+        """
+        current_row = start_row
+        ws.merged_cells.add(f"A{current_row}:J{current_row}")
+        ws.append([self._cell(ws, f"BẢNG ĐIỂM HỌC KỲ: {hocky_name.upper()}", title_font, center)])
+        current_row += 1
 
         headers = ["STT", "Mã HP", "Tên học phần", "STC", "KT1", "KT2", "Thi", "Điểm 10", "Điểm 4", "Điểm chữ"]
-        header_row = start_row + 1
-        for col, h in enumerate(headers, 1):
-            c = ws.cell(row=header_row, column=col, value=h)
-            c.font = header_font
-            c.fill = header_fill
-            c.alignment = center
-            c.border = border
+        ws.append([self._cell(ws, h, header_font, center, header_fill, border) for h in headers])
+        current_row += 1
 
-        diem_chi_tiet = data.get("diem_chi_tiet", [])
-        current_row = header_row + 1
-        for i, mon in enumerate(diem_chi_tiet, 1):
+        for i, mon in enumerate(data.get("diem_chi_tiet", []), 1):
             values = [
                 i,
                 mon.get("ma_hp", ""),
@@ -569,11 +611,10 @@ class DiemHandler:
                 mon.get("diem_he_4", ""),
                 mon.get("diem_chu", ""),
             ]
-            for col, val in enumerate(values, 1):
-                c = ws.cell(row=current_row, column=col, value=val)
-                c.font = cell_font
-                c.border = border
-                c.alignment = center if col in (1, 4, 5, 6, 7, 8, 9, 10) else left
+            ws.append([
+                self._cell(ws, val, cell_font, left if col in (2, 3) else center, border=border)
+                for col, val in enumerate(values, 1)
+            ])
             current_row += 1
 
         diem_tich_luy = data.get("diem_tich_luy", {})
@@ -584,27 +625,17 @@ class DiemHandler:
                 ("Số TC đạt", diem_tich_luy.get("so_tin_chi_dat", "")),
                 ("Tổng TC tích lũy", diem_tich_luy.get("so_tin_chi_tich_luy", "")),
             ]
-            for i, (label, value) in enumerate(tich_luy_data):
-                ws.merge_cells(start_row=current_row + i, start_column=1, end_row=current_row + i, end_column=3)
-                lbl = ws.cell(row=current_row + i, column=1, value=label)
-                lbl.font = tich_luy_font
-                lbl.alignment = left
-                val = ws.cell(row=current_row + i, column=4, value=value)
-                val.font = tich_luy_font
-                val.alignment = center
-
-        ws.column_dimensions["A"].width = 5
-        ws.column_dimensions["B"].width = 15
-        ws.column_dimensions["C"].width = 40
-        ws.column_dimensions["D"].width = 5
-        ws.column_dimensions["E"].width = 8
-        ws.column_dimensions["F"].width = 8
-        ws.column_dimensions["G"].width = 8
-        ws.column_dimensions["H"].width = 10
-        ws.column_dimensions["I"].width = 10
-        ws.column_dimensions["J"].width = 10
-
-        return current_row + len(tich_luy_data) if diem_tich_luy else current_row
+            for label, value in tich_luy_data:
+                ws.merged_cells.add(f"A{current_row}:C{current_row}")
+                ws.append([
+                    self._cell(ws, label, tich_luy_font, left),
+                    None,
+                    None,
+                    self._cell(ws, value, tich_luy_font, center),
+                ])
+                current_row += 1
+
+        return current_row
 
     # ==================== Utils ====================
 
@@ -9,6 +9,7 @@ học, danh sách sinh viên, lịch sử điểm danh của lớp).
 
 Cú pháp callback:
     namhoc_<ma_hoc_ky>                    - chọn học kỳ
+    namhoc_<ma_hoc_ky>|<page>             - trang học phần thứ <page> (từ 0)
     hocphan_<ma_hoc_ky>|<key_check>       - xem chi tiết học phần
                                              (embed học kỳ để tra cứu đúng)
     hocphan_back                          - quay lại
@@ -22,32 +23,75 @@ import json
 import logging
 import unicodedata
 from datetime import datetime
-from typing import Any, Dict, List, Optional
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
 
-import aiohttp
 import openpyxl
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.styles import Font, Alignment, PatternFill
 
+from cache.base import USER_DATA_MAX_AGE
 from config.config import Config
+from utils import background
 from utils.button_style import make_inline_button, build_inline_keyboard
 from utils.rich_message import (
-    escape_html,
     section_heading,
-    h1,
     h2,
     p,
     p_bold,
-    code,
     hr,
     footer_updated_at,
     join_blocks,
-    kv_line,
     table,
 )
+from utils.http_client import HttpClient
 from utils.telegram_api import TelegramAPI, TelegramAPIError
+from utils.ttl_cache import MISSING, TtlLruCache
+from utils.utils import NOT_LOGGED_IN, NOT_LOGGED_IN_MESSAGE
 
 logger = logging.getLogger(__name__)
 
+# Danh sách học phần của học kỳ user vừa chọn, giữ trong RAM để bấm xem chi
+# tiết không phải đọc lại cache backend + sort lại toàn bộ danh sách
+HOC_PHAN_CACHE_TTL = 120
+HOC_PHAN_CACHE_MAX_SIZE = 10_000
+
+# File Excel danh sách sinh viên đã tạo, key theo (token, lớp học phần): bấm
+# xuất lại trong vài phút thì gửi lại file cũ, không gọi API + dựng workbook.
+# Key theo token để đổi tài khoản / đăng nhập lại không dính file của phiên cũ.
+XLSX_CACHE_TTL = 300
+XLSX_CACHE_MAX_SIZE = 256
+
+# Nút / keyboard "Quay lại" không đổi → dựng 1 lần, dùng chung cho mọi callback
+_BACK_BUTTON = make_inline_button("Quay lại", "hocphan_back", tone="neutral")
+_BACK_KEYBOARD = build_inline_keyboard([[_BACK_BUTTON]])
+
+# Số học phần mỗi trang của menu chọn học phần (2 nút / hàng)
+HOC_PHAN_PAGE_SIZE = 20
+
+
+@lru_cache(maxsize=128)
+def _hocphan_page_keyboard(nam_hoc_key: str, page: int, page_count: int,
+                           buttons: Tuple[Tuple[str, str], ...]) -> Dict[str, Any]:
+    """Keyboard 1 trang học phần. `buttons` là các cặp (nhãn, callback_data) của trang.
+
+    Cùng học kỳ thì danh sách giống nhau giữa các user → cache theo nội dung trang.
+    Kết quả dùng chung, caller không được sửa.
+    """
+    rows: List[List[Dict[str, Any]]] = [
+        [make_inline_button(label, cb_data, tone=None) for label, cb_data in buttons[i:i + 2]]
+        for i in range(0, len(buttons), 2)
+    ]
+    if page_count > 1:
+        nav: List[Dict[str, Any]] = []
+        if page > 0:
+            nav.append(make_inline_button("Trang trước", f"namhoc_{nam_hoc_key}|{page - 1}", tone=None, emoji="◀️"))
+        if page < page_count - 1:
+            nav.append(make_inline_button("Trang sau", f"namhoc_{nam_hoc_key}|{page + 1}", tone=None, emoji="▶️"))
+        rows.append(nav)
+    rows.append([_BACK_BUTTON])
+    return build_inline_keyboard(rows)
+
 
 class HocPhanHandler:
     """Handler cho `/hocphan` — tra cứu học phần, danh sách lớp, điểm danh của lớp."""
@@ -56,18 +100,15 @@ class HocPhanHandler:
         self.db_manager = db_manager
         self.cache_manager = cache_manager
         self.config = Config()
+        self.http = HttpClient()
         self.telegram = telegram_api or TelegramAPI(self.config)
+        # user_id -> (ma_hoc_ky, {key_check: học phần})
+        self._hoc_phan_cache = TtlLruCache(HOC_PHAN_CACHE_TTL, HOC_PHAN_CACHE_MAX_SIZE)
+        self._xlsx_cache = TtlLruCache(XLSX_CACHE_TTL, XLSX_CACHE_MAX_SIZE)
 
     # ==================== Command ====================
 
     async def cmd_hocphan(self, chat_id: int, user_id: int, reply_to_message_id: Optional[int]) -> None:
-        if not await self.db_manager.is_user_logged_in(user_id):
-            await self.telegram.send_message(
-                chat_id=chat_id,
-                text="Bạn chưa đăng nhập. Vui lòng /dangnhap để đăng nhập.",
-                reply_to_message_id=reply_to_message_id,
-            )
-            return
         result = await self.handle_hoc_phan(user_id)
         if result["success"]:
             await self.telegram.send_rich_message(
@@ -84,27 +125,22 @@ class HocPhanHandler:
                 reply_to_message_id=reply_to_message_id,
             )
 
-    # ==================== Callback router ====================
-
-    async def cb_route(self, callback_id: str, chat_id: int, message_id: int,
-                       user_id: int, callback_data: str) -> None:
-        if callback_data.startswith("namhoc_"):
-            await self._cb_namhoc(callback_id, chat_id, message_id, user_id, callback_data)
-        elif callback_data.startswith("hocphan_"):
-            await self._cb_hocphan(callback_id, chat_id, message_id, user_id, callback_data)
-        elif callback_data.startswith("danhsach_"):
-            await self._cb_danhsach(callback_id, chat_id, message_id, user_id, callback_data)
-        elif callback_data.startswith("diemdanh_lop_hoc_phan_"):
-            await self._cb_diemdanh_lop(callback_id, chat_id, message_id, user_id, callback_data)
-
-    # ==================== Callback implementations ====================
+    # ==================== Callbacks ====================
 
-    async def _cb_namhoc(self, callback_id: str, chat_id: int, message_id: int,
+    async def cb_namhoc(self, callback_id: str, chat_id: int, message_id: int,
                         user_id: int, callback_data: str) -> None:
-        nam_hoc_key = callback_data[len("namhoc_"):]
-        await self.telegram.answer_callback_query(callback_id, text="Đang tìm kiếm học phần...")
-
-        result = await self.handle_hoc_phan(user_id)
+        nam_hoc_key = callback_data.removeprefix("namhoc_")
+        page = 0
+        if "|" in nam_hoc_key:
+            nam_hoc_key, page_str = nam_hoc_key.split("|", 1)
+            try:
+                page = int(page_str)
+            except ValueError:
+                page = 0
+        _, result = await asyncio.gather(
+            self.telegram.answer_callback_query(callback_id, text="Đang tìm kiếm học phần..."),
+            self.handle_hoc_phan(user_id),
+        )
         if not result["success"]:
             try:
                 await self.telegram.edit_message_text_plain(
@@ -121,31 +157,35 @@ class HocPhanHandler:
                     chat_id=chat_id,
                     message_id=message_id,
                     text=search_result["message"],
-                    reply_markup=build_inline_keyboard([[
-                        make_inline_button("Quay lại", "hocphan_back", tone="neutral")
-                    ]]),
+                    reply_markup=_BACK_KEYBOARD,
                     parse_mode="HTML",
                 )
             except TelegramAPIError:
                 pass
             return
 
+        self._remember_hoc_phan_list(
+            user_id, nam_hoc_key, search_result["data"].get("hoc_phan_list", [])
+        )
         try:
             await self.telegram.edit_message_text_rich(
                 chat_id=chat_id,
                 message_id=message_id,
                 html=self._format_search(search_result["data"]),
-                reply_markup=self._build_hocphan_keyboard(self.get_hoc_phan_list(search_result["data"])),
+                reply_markup=self._build_hocphan_keyboard(search_result["data"], nam_hoc_key, page),
             )
         except TelegramAPIError as e:
             if "message is not modified" not in e.description.lower():
                 raise
 
-    async def _cb_hocphan(self, callback_id: str, chat_id: int, message_id: int,
+    async def cb_hocphan(self, callback_id: str, chat_id: int, message_id: int,
                          user_id: int, callback_data: str) -> None:
         if callback_data == "hocphan_back":
-            await self.telegram.answer_callback_query(callback_id)
-            result = await self.handle_hoc_phan(user_id)
+            self._hoc_phan_cache.pop(user_id)
+            _, result = await asyncio.gather(
+                self.telegram.answer_callback_query(callback_id),
+                self.handle_hoc_phan(user_id),
+            )
             if result["success"]:
                 try:
                     await self.telegram.edit_message_text_rich(
@@ -159,7 +199,7 @@ class HocPhanHandler:
                         raise
             return
 
-        key_lop_hoc_phan = callback_data[len("hocphan_"):]
+        key_lop_hoc_phan = callback_data.removeprefix("hocphan_")
         await self.telegram.answer_callback_query(callback_id)
 
         # Tách ma_hoc_ky và key_check. Định dạng callback: hocphan_<ma_hoc_ky>|<key_check>
@@ -178,14 +218,11 @@ class HocPhanHandler:
                 )
                 return
 
-        search_result = await self.handle_search_hoc_phan(user_id, [nam_hoc_key])
+        search_result = await self._find_hoc_phan(user_id, nam_hoc_key, key_lop_hoc_phan)
         if not search_result["success"]:
             await self._safe_edit(chat_id, message_id, search_result["message"], parse_mode="HTML")
             return
-        hoc_phan_list = search_result["data"].get("hoc_phan_list", [])
-        selected = next(
-            (hp for hp in hoc_phan_list if hp.get("key_check") == key_lop_hoc_phan), None
-        )
+        selected = search_result["data"]
         if not selected:
             await self._safe_edit(chat_id, message_id, "Không tìm thấy học phần được chọn.")
             return
@@ -199,51 +236,76 @@ class HocPhanHandler:
                         make_inline_button("Danh sách sinh viên", f"danhsach_{key_lop_hoc_phan}", tone="primary", emoji="📋"),
                         make_inline_button("Điểm danh", f"diemdanh_lop_hoc_phan_{key_lop_hoc_phan}", tone="success", emoji="📝"),
                     ],
-                    [make_inline_button("Quay lại", "hocphan_back", tone="neutral")],
+                    [_BACK_BUTTON],
                 ]),
             )
         except TelegramAPIError as e:
             if "message is not modified" not in e.description.lower():
                 raise
 
-    async def _cb_danhsach(self, callback_id: str, chat_id: int, message_id: int,
+    async def cb_danhsach(self, callback_id: str, chat_id: int, message_id: int,
                           user_id: int, callback_data: str) -> None:
-        key = callback_data[len("danhsach_"):]
-        await self.telegram.answer_callback_query(callback_id, text="Đang tải danh sách sinh viên...")
-        result = await self.handle_danh_sach_sinh_vien(user_id, key)
+        key = callback_data.removeprefix("danhsach_")
+        token = await self._get_user_token(user_id)
+        xlsx_key = (token, key)
+        cached_bytes = self._xlsx_cache.get(xlsx_key) if token else MISSING
+        if cached_bytes is not MISSING:
+            await self.telegram.answer_callback_query(callback_id, text="Đang gửi danh sách sinh viên...")
+            background.spawn(
+                self._send_danh_sach_xlsx(chat_id, key, xlsx_key, file_bytes=cached_bytes),
+                name=f"danhsach_export:{user_id}",
+            )
+            return
+        _, result = await asyncio.gather(
+            self.telegram.answer_callback_query(callback_id, text="Đang tải danh sách sinh viên..."),
+            self.handle_danh_sach_sinh_vien(user_id, key),
+        )
         if not result["success"]:
             await self._safe_edit(chat_id, message_id, result["message"], parse_mode="HTML")
             return
+        # Tạo + upload file chạy nền để vòng polling nhận update tiếp ngay.
+        # Giữ nguyên menu chi tiết học phần (vẫn dùng được để xuất lại / quay lại)
+        # thay vì xoá → bớt 1 request mỗi lần xuất
+        background.spawn(
+            self._send_danh_sach_xlsx(chat_id, key, xlsx_key, data=result["data"]),
+            name=f"danhsach_export:{user_id}",
+        )
+
+    async def _send_danh_sach_xlsx(self, chat_id: int, key: str, xlsx_key: Tuple[Optional[str], str], *,
+                                   data: Optional[Dict[str, Any]] = None,
+                                   file_bytes: Optional[bytes] = None) -> None:
+        """Gửi file Excel danh sách sinh viên: `file_bytes` lấy từ cache, hoặc tạo từ `data`."""
         try:
-            file_bytes = await asyncio.to_thread(self.generate_danh_sach_sinh_vien_xlsx, result["data"])
-            await self.telegram.send_document(
+            if file_bytes is None:
+                file_bytes = await asyncio.to_thread(self.generate_danh_sach_sinh_vien_xlsx, data)
+                if xlsx_key[0]:
+                    self._xlsx_cache.set(xlsx_key, file_bytes)
+            await background.retry_on_flood(lambda: self.telegram.send_document(
                 chat_id=chat_id,
                 file=file_bytes,
                 filename=f"danh_sach_sinh_vien_{key}.xlsx",
                 caption="📋 Danh sách sinh viên lớp học phần",
-            )
+            ))
         except Exception as e:
             logger.error("Lỗi tạo/gửi file Excel: %s", e)
             await self.telegram.send_message(
                 chat_id=chat_id, text=f"Lỗi tạo file Excel: {str(e)}"
             )
-        # Xoá menu cũ
-        await self.telegram.delete_message(chat_id, message_id)
 
-    async def _cb_diemdanh_lop(self, callback_id: str, chat_id: int, message_id: int,
+    async def cb_diemdanh_lop(self, callback_id: str, chat_id: int, message_id: int,
                               user_id: int, callback_data: str) -> None:
-        key = callback_data[len("diemdanh_lop_hoc_phan_"):]
-        await self.telegram.answer_callback_query(callback_id, text="Đang tải lịch sử điểm danh...")
-        result = await self.handle_diem_danh(user_id, key)
+        key = callback_data.removeprefix("diemdanh_lop_hoc_phan_")
+        _, result = await asyncio.gather(
+            self.telegram.answer_callback_query(callback_id, text="Đang tải lịch sử điểm danh..."),
+            self.handle_diem_danh(user_id, key),
+        )
         if result["success"]:
             try:
                 await self.telegram.edit_message_text_rich(
                     chat_id=chat_id,
                     message_id=message_id,
                     html=self._format_diem_danh(result["data"]),
-                    reply_markup=build_inline_keyboard([
-                        [make_inline_button("Quay lại", "hocphan_back", tone="neutral")]
-                    ]),
+                    reply_markup=_BACK_KEYBOARD,
                 )
             except TelegramAPIError as e:
                 if "message is not modified" not in e.description.lower():
@@ -253,6 +315,35 @@ class HocPhanHandler:
 
     # ==================== Data layer ====================
 
+    def _remember_hoc_phan_list(self, telegram_user_id: int, nam_hoc_key: str,
+                                hoc_phan_list: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        """Nhớ danh sách học phần của học kỳ vừa tra cứu, index theo `key_check`."""
+        index: Dict[str, Dict[str, Any]] = {}
+        for hp in hoc_phan_list:
+            # Giữ học phần đầu tiên nếu trùng key, giống thứ tự hiển thị trên menu
+            index.setdefault(hp.get("key_check"), hp)
+        self._hoc_phan_cache.set(telegram_user_id, (nam_hoc_key, index))
+        return index
+
+    async def _find_hoc_phan(self, telegram_user_id: int, nam_hoc_key: str,
+                             key_check: str) -> Dict[str, Any]:
+        """Tìm học phần `key_check` trong học kỳ `nam_hoc_key`.
+
+        Ưu tiên danh sách đã nhớ từ lần chọn học kỳ trước đó; chỉ tra cứu lại khi
+        user đổi học kỳ hoặc entry đã hết hạn. `data` là None nếu không tìm thấy.
+        """
+        cached = self._hoc_phan_cache.get(telegram_user_id)
+        if cached is not MISSING and cached[0] == nam_hoc_key:
+            return {"success": True, "message": "OK (cache)", "data": cached[1].get(key_check)}
+
+        search_result = await self.handle_search_hoc_phan(telegram_user_id, [nam_hoc_key])
+        if not search_result["success"]:
+            return search_result
+        index = self._remember_hoc_phan_list(
+            telegram_user_id, nam_hoc_key, search_result["data"].get("hoc_phan_list", [])
+        )
+        return {"success": True, "message": search_result["message"], "data": index.get(key_check)}
+
     async def handle_hoc_phan(self, telegram_user_id: int) -> Dict[str, Any]:
         try:
             cache_key = f"nam_hoc_hoc_ky:{telegram_user_id}"
@@ -264,10 +355,10 @@ class HocPhanHandler:
 
             token = await self._get_user_token(telegram_user_id)
             if not token:
-                return {"success": False, "message": "Bạn chưa đăng nhập. Vui lòng /dangnhap.", "data": None}
+                return {"success": False, "reason": NOT_LOGGED_IN, "message": NOT_LOGGED_IN_MESSAGE, "data": None}
             response = await self._call_nam_hoc_hoc_ky_api(token)
             if response and isinstance(response, list):
-                await self.cache_manager.set(cache_key, response, ttl=86400)
+                await self.cache_manager.set(cache_key, response, ttl=USER_DATA_MAX_AGE)
                 processed = self._process_nam_hoc_hoc_ky_data(response)
                 processed["timestamp"] = datetime.utcnow().isoformat()
                 return {"success": True, "message": "OK", "data": processed}
@@ -285,14 +376,14 @@ class HocPhanHandler:
 
             token = await self._get_user_token(telegram_user_id)
             if not token:
-                return {"success": False, "message": "Bạn chưa đăng nhập. Vui lòng /dangnhap.", "data": None}
+                return {"success": False, "reason": NOT_LOGGED_IN, "message": NOT_LOGGED_IN_MESSAGE, "data": None}
 
             response = await self._call_search_hoc_phan_api(token, nam_hoc_hoc_ky_list)
             if not (response and isinstance(response, list)):
                 logger.warning("Search học phần thất bại lần 1, retry với renew=true")
                 response = await self._call_search_hoc_phan_api(token, nam_hoc_hoc_ky_list, use_renew=True)
             if response and isinstance(response, list):
-                await self.cache_manager.set(cache_key, response, ttl=3600)
+                await self.cache_manager.set(cache_key, response, ttl=USER_DATA_MAX_AGE)
                 processed = self._process_search_hoc_phan_data(response)
                 processed["timestamp"] = datetime.utcnow().isoformat()
                 return {"success": True, "message": "OK", "data": processed}
@@ -309,10 +400,10 @@ class HocPhanHandler:
                 return {"success": True, "message": "OK (cache)", "data": self._process_diem_danh_data(cached.get("data", []))}
             token = await self._get_user_token(telegram_user_id)
             if not token:
-                return {"success": False, "message": "Bạn chưa đăng nhập. Vui lòng /dangnhap.", "data": None}
+                return {"success": False, "reason": NOT_LOGGED_IN, "message": NOT_LOGGED_IN_MESSAGE, "data": None}
             response = await self._call_diem_danh_api(token, key_lop_hoc_phan)
             if response and isinstance(response, dict) and "result" in response:
-                await self.cache_manager.set(cache_key, response["result"], ttl=3600)
+                await self.cache_manager.set(cache_key, response["result"], ttl=USER_DATA_MAX_AGE)
                 processed = self._process_diem_danh_data(response["result"])
                 processed["timestamp"] = datetime.utcnow().isoformat()
                 return {"success": True, "message": "OK", "data": processed}
@@ -335,7 +426,7 @@ class HocPhanHandler:
         try:
             token = await self._get_user_token(telegram_user_id)
             if not token:
-                return {"success": False, "message": "Bạn chưa đăng nhập. Vui lòng /dangnhap.", "data": None}
+                return {"success": False, "reason": NOT_LOGGED_IN, "message": NOT_LOGGED_IN_MESSAGE, "data": None}
             response = await self._call_danh_sach_sinh_vien_api(token, key_lop_hoc_phan)
             if response and isinstance(response, dict):
                 return {"success": True, "message": "OK", "data": self._process_danh_sach_sinh_vien_data(response)}
@@ -351,11 +442,10 @@ class HocPhanHandler:
             url = f"{self.config.HUTECH_API_BASE_URL}{self.config.HUTECH_HOC_PHAN_NAM_HOC_HOC_KY_ENDPOINT}"
             headers = self.config.HUTECH_MOBILE_HEADERS.copy()
             headers["authorization"] = f"JWT {token}"
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, headers=headers) as response:
-                    if response.status == 200:
-                        return await response.json()
-                    return {"error": True, "status_code": response.status, "message": await response.text()}
+            async with self.http.session.get(url, headers=headers) as response:
+                if response.status == 200:
+                    return await response.json()
+                return {"error": True, "status_code": response.status, "message": await response.text()}
         except Exception as e:
             logger.error("Lỗi gọi nam_hoc_hoc_ky API: %s", e)
             return {"error": True, "message": f"Lỗi: {str(e)}"}
@@ -368,11 +458,10 @@ class HocPhanHandler:
             body = {"nam_hoc_hoc_ky": nam_hoc_hoc_ky_list}
             if use_renew:
                 body = {"renew": True, "nam_hoc_hoc_ky": nam_hoc_hoc_ky_list}
-            async with aiohttp.ClientSession() as session:
-                async with session.post(url, headers=headers, json=body) as response:
-                    if response.status == 200:
-                        return await response.json()
-                    return {"error": True, "status_code": response.status, "message": await response.text()}
+            async with self.http.session.post(url, headers=headers, json=body) as response:
+                if response.status == 200:
+                    return await response.json()
+                return {"error": True, "status_code": response.status, "message": await response.text()}
         except Exception as e:
             logger.error("Lỗi gọi search hoc_phan API: %s", e)
             return {"error": True, "message": f"Lỗi: {str(e)}"}
@@ -383,11 +472,10 @@ class HocPhanHandler:
             headers = self.config.HUTECH_MOBILE_HEADERS.copy()
             headers["authorization"] = f"JWT {token}"
             params = {"key_lop_hoc_phan": key_lop_hoc_phan}
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, headers=headers, params=params) as response:
-                    if response.status == 200:
-                        return await response.json()
-                    return {"error": True, "status_code": response.status, "message": await response.text()}
+            async with self.http.session.get(url, headers=headers, params=params) as response:
+                if response.status == 200:
+                    return await response.json()
+                return {"error": True, "status_code": response.status, "message": await response.text()}
         except Exception as e:
             logger.error("Lỗi gọi diem_danh API: %s", e, exc_info=True)
             return {"error": True, "message": f"Lỗi: {str(e)}"}
@@ -398,11 +486,10 @@ class HocPhanHandler:
             headers = self.config.HUTECH_MOBILE_HEADERS.copy()
             headers["authorization"] = f"JWT {token}"
             params = {"key_lop_hoc_phan": key_lop_hoc_phan}
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, headers=headers, params=params) as response:
-                    if response.status == 200:
-                        return await response.json()
-                    return {"error": True, "status_code": response.status, "message": await response.text()}
+            async with self.http.session.get(url, headers=headers, params=params) as response:
+                if response.status == 200:
+                    return await response.json()
+                return {"error": True, "status_code": response.status, "message": await response.text()}
         except Exception as e:
             logger.error("Lỗi gọi danh_sach_sinh_vien API: %s", e)
             return {"error": True, "message": f"Lỗi: {str(e)}"}
@@ -723,17 +810,22 @@ class HocPhanHandler:
                 row = []
         return build_inline_keyboard(rows)
 
-    def _build_hocphan_keyboard(self, items: List[Dict[str, str]]) -> Dict[str, Any]:
-        rows: List[List[Dict[str, Any]]] = []
-        row: List[Dict[str, Any]] = []
-        for i, it in enumerate(items):
-            cb_data = f"hocphan_{it['ma_hoc_ky']}|{it['key']}" if it.get("ma_hoc_ky") else f"hocphan_{it['key']}"
-            row.append(make_inline_button(it["name"], cb_data, tone=None))
-            if len(row) == 2 or i == len(items) - 1:
-                rows.append(row)
-                row = []
-        rows.append([make_inline_button("Quay lại", "hocphan_back", tone="neutral")])
-        return build_inline_keyboard(rows)
+    def _build_hocphan_keyboard(self, data: Dict[str, Any], nam_hoc_key: str, page: int) -> Dict[str, Any]:
+        """Keyboard trang `page` của danh sách học phần (tối đa `HOC_PHAN_PAGE_SIZE` nút)."""
+        hoc_phan_list = data.get("hoc_phan_list", [])
+        page_count = max(1, -(-len(hoc_phan_list) // HOC_PHAN_PAGE_SIZE))
+        page = min(max(page, 0), page_count - 1)
+        start = page * HOC_PHAN_PAGE_SIZE
+        # Chỉ dựng nhãn cho học phần của trang này
+        items = self.get_hoc_phan_list({"hoc_phan_list": hoc_phan_list[start:start + HOC_PHAN_PAGE_SIZE]})
+        buttons = tuple(
+            (
+                it["name"],
+                f"hocphan_{it['ma_hoc_ky']}|{it['key']}" if it.get("ma_hoc_ky") else f"hocphan_{it['key']}",
+            )
+            for it in items
+        )
+        return _hocphan_page_keyboard(nam_hoc_key, page, page_count, buttons)
 
     # ==================== Excel ====================
 
@@ -741,9 +833,9 @@ class HocPhanHandler:
         try:
             lop_info = data.get("lop_info", {})
             sinh_vien_list = data.get("sinh_vien_list", [])
-            wb = openpyxl.Workbook()
-            ws = wb.active
-            ws.title = "Danh sách sinh viên"
+            # write-only: từng hàng được ghi thẳng ra stream thay vì giữ cả sheet trong RAM
+            wb = openpyxl.Workbook(write_only=True)
+            ws = wb.create_sheet(title="Danh sách sinh viên")
             title_font = Font(name='Arial', size=14, bold=True)
             header_font = Font(name='Arial', size=12, bold=True)
             cell_font = Font(name='Arial', size=11)
@@ -760,41 +852,38 @@ class HocPhanHandler:
             nhom = tt.get("nhom_hoc", "")
             hoc_ky_label = self._format_hoc_ky_excel_label(hoc_ky)
 
-            ws.merge_cells('A1:E1')
-            ws['A1'] = "DANH SÁCH SINH VIÊN LỚP HỌC PHẦN"
-            ws['A1'].font = title_font
-            ws['A1'].alignment = Alignment(horizontal='center', vertical='center')
-            ws.merge_cells('A2:E2')
-            ws['A2'] = f"{ten_mon} ({ma_mon})"
-            ws['A2'].font = header_font
-            ws['A2'].alignment = Alignment(horizontal='center', vertical='center')
-            ws.merge_cells('A3:E3')
-            ws['A3'] = f"Năm học: {nam_hoc} - Học kỳ: {hoc_ky_label} - Nhóm học: {nhom}"
-            ws['A3'].font = cell_font
-            ws['A3'].alignment = Alignment(horizontal='center', vertical='center')
-
-            headers = ['STT', 'MSSV', 'Họ', 'Tên', 'Lớp']
-            for col, h in enumerate(headers, 1):
-                cell = ws.cell(row=5, column=col, value=h)
-                cell.font = header_font
-                cell.fill = header_fill
-                cell.alignment = header_align
-            for row_num, sv in enumerate(sinh_vien_list, 6):
-                ws.cell(row=row_num, column=1, value=row_num - 5).font = cell_font
-                ws.cell(row=row_num, column=1).alignment = stt_align
-                ws.cell(row=row_num, column=2, value=sv["mssv"]).font = cell_font
-                ws.cell(row=row_num, column=2).alignment = cell_align
-                ws.cell(row=row_num, column=3, value=sv["ho"]).font = cell_font
-                ws.cell(row=row_num, column=3).alignment = cell_align
-                ws.cell(row=row_num, column=4, value=sv["ten"]).font = cell_font
-                ws.cell(row=row_num, column=4).alignment = cell_align
-                ws.cell(row=row_num, column=5, value=sv["lop"]).font = cell_font
-                ws.cell(row=row_num, column=5).alignment = cell_align
-            ws.column_dimensions['A'].width = 5
-            ws.column_dimensions['B'].width = 15
-            ws.column_dimensions['C'].width = 25
-            ws.column_dimensions['D'].width = 15
-            ws.column_dimensions['E'].width = 15
+            # Sheet write-only phải đặt độ rộng cột / vùng merge trước khi ghi hàng
+            for col, width in zip("ABCDE", (5, 15, 25, 15, 15)):
+                ws.column_dimensions[col].width = width
+            for merged in ("A1:E1", "A2:E2", "A3:E3"):
+                ws.merged_cells.add(merged)
+
+            def cell(value: Any, font: Font, alignment: Alignment, fill: Optional[PatternFill] = None) -> WriteOnlyCell:
+                c = WriteOnlyCell(ws, value=value)
+                c.font = font
+                c.alignment = alignment
+                if fill is not None:
+                    c.fill = fill
+                return c
+
+            ws.append([cell("DANH SÁCH SINH VIÊN LỚP HỌC PHẦN", title_font, header_align)])
+            ws.append([cell(f"{ten_mon} ({ma_mon})", header_font, header_align)])
+            ws.append([cell(
+                f"Năm học: {nam_hoc} - Học kỳ: {hoc_ky_label} - Nhóm học: {nhom}", cell_font, header_align
+            )])
+            ws.append([])
+            ws.append([
+                cell(h, header_font, header_align, header_fill)
+                for h in ('STT', 'MSSV', 'Họ', 'Tên', 'Lớp')
+            ])
+            for stt, sv in enumerate(sinh_vien_list, 1):
+                ws.append([
+                    cell(stt, cell_font, stt_align),
+                    cell(sv["mssv"], cell_font, cell_align),
+                    cell(sv["ho"], cell_font, cell_align),
+                    cell(sv["ten"], cell_font, cell_align),
+                    cell(sv["lop"], cell_font, cell_align),
+                ])
 
             buf = io.BytesIO()
             wb.save(buf)
@@ -12,22 +12,24 @@ Cú pháp: gửi `/lichthi` để xem tất cả lịch thi sắp tới.
 
 import json
 import logging
-from datetime import datetime, timedelta
+from datetime import datetime
 from typing import Any, Dict, List, Optional
 
 import aiohttp
 
+from cache.base import USER_DATA_MAX_AGE
 from config.config import Config
 from utils.rich_message import (
     section_heading,
     p,
     p_with_emoji,
-    hr,
     footer_updated_at,
     table,
     join_blocks,
 )
+from utils.http_client import HttpClient
 from utils.telegram_api import TelegramAPI
+from utils.utils import NOT_LOGGED_IN, NOT_LOGGED_IN_MESSAGE
 
 logger = logging.getLogger(__name__)
 
@@ -39,19 +41,12 @@ class LichThiHandler:
         self.db_manager = db_manager
         self.cache_manager = cache_manager
         self.config = Config()
+        self.http = HttpClient()
         self.telegram = telegram_api or TelegramAPI(self.config)
 
     # ==================== Command ====================
 
     async def cmd_lichthi(self, chat_id: int, user_id: int, reply_to_message_id: Optional[int]) -> None:
-        if not await self.db_manager.is_user_logged_in(user_id):
-            await self.telegram.send_message(
-                chat_id=chat_id,
-                text="Bạn chưa đăng nhập. Vui lòng /dangnhap để đăng nhập.",
-                reply_to_message_id=reply_to_message_id,
-            )
-            return
-
         result = await self.handle_lich_thi(user_id)
         if result["success"]:
             await self.telegram.send_rich_message(
@@ -59,6 +54,12 @@ class LichThiHandler:
                 html=self._format_message(result["data"]),
                 reply_to_message_id=reply_to_message_id,
             )
+        elif result.get("reason") == NOT_LOGGED_IN:
+            await self.telegram.send_message(
+                chat_id=chat_id,
+                text=NOT_LOGGED_IN_MESSAGE,
+                reply_to_message_id=reply_to_message_id,
+            )
         else:
             await self.telegram.send_message(
                 chat_id=chat_id,
@@ -82,13 +83,14 @@ class LichThiHandler:
             if not token:
                 return {
                     "success": False,
-                    "message": "Bạn chưa đăng nhập. Vui lòng sử dụng /dangnhap để đăng nhập.",
+                    "reason": NOT_LOGGED_IN,
+                    "message": NOT_LOGGED_IN_MESSAGE,
                     "data": None,
                 }
 
             response = await self._call_api(token)
             if response and isinstance(response, list):
-                await self.cache_manager.set(cache_key, response, ttl=86400)
+                await self.cache_manager.set(cache_key, response, ttl=USER_DATA_MAX_AGE)
                 processed = self._process(response)
                 cached_data = await self.cache_manager.get(cache_key)
                 processed["timestamp"] = (
@@ -117,13 +119,12 @@ class LichThiHandler:
             url = f"{self.config.HUTECH_API_BASE_URL}{self.config.HUTECH_LICHTHI_ENDPOINT}"
             headers = self.config.HUTECH_MOBILE_HEADERS.copy()
             headers["authorization"] = f"JWT {token}"
-            async with aiohttp.ClientSession() as session:
-                async with session.post(url, headers=headers, json={}) as response:
-                    if response.status == 201:
-                        return await response.json()
-                    error_text = await response.text()
-                    logger.error("Lịch thi API error: %s - %s", response.status, error_text)
-                    return {"error": True, "status_code": response.status, "message": error_text}
+            async with self.http.session.post(url, headers=headers, json={}) as response:
+                if response.status == 201:
+                    return await response.json()
+                error_text = await response.text()
+                logger.error("Lịch thi API error: %s - %s", response.status, error_text)
+                return {"error": True, "status_code": response.status, "message": error_text}
         except aiohttp.ClientError as e:
             logger.error("HTTP client error: %s", e)
             return {"error": True, "message": f"Lỗi kết nối: {str(e)}"}
@@ -9,6 +9,9 @@ Luồng đăng nhập 2 bước, dùng state tạm để nhớ user đang ở b
 2. User nhập username → hỏi password.
 3. User nhập password → gọi API HUTECH, lưu account vào DB, xóa state.
 
+Fast path: `/dangnhap <username> <password>` đăng nhập luôn trong 1 bước
+(xóa message chứa mật khẩu song song với gọi API), không qua state.
+
 State per user (lưu trong cache qua `utils/state_store`):
     {
         "step": "awaiting_username" | "awaiting_password",
@@ -19,6 +22,7 @@ State per user (lưu trong cache qua `utils/state_store`):
     }
 """
 
+import asyncio
 import json
 import logging
 from typing import Any, Dict, Optional
@@ -26,10 +30,10 @@ from typing import Any, Dict, Optional
 import aiohttp
 
 from config.config import Config
-from utils.state_store import StateStore
-from utils.telegram_api import TelegramAPI, TelegramAPIError
+from utils.state_store import BotState, StateStore
+from utils.http_client import HttpClient
+from utils.telegram_api import TelegramAPI
 from utils.utils import generate_uuid
-from utils.rich_message import p, b, code, section_heading
 
 logger = logging.getLogger(__name__)
 
@@ -45,15 +49,25 @@ class LoginHandler:
         self.db_manager = db_manager
         self.cache_manager = cache_manager
         self.config = Config()
+        self.http = HttpClient()
         self.telegram = telegram_api or TelegramAPI(self.config)
         self.state = StateStore(self.cache_manager)
 
     # ==================== Public API ====================
 
-    async def start(self, chat_id: int, user_id: int, reply_to_message_id: Optional[int]) -> None:
+    async def start(self, chat_id: int, user_id: int, reply_to_message_id: Optional[int],
+                    arg_text: str = "") -> None:
         """
         Bắt đầu luồng đăng nhập: gửi prompt hỏi username, lưu state.
+
+        Nếu lệnh kèm sẵn `<username> <password>` thì đăng nhập ngay (fast path).
+        Mật khẩu là toàn bộ phần còn lại, giữ nguyên khoảng trắng bên trong.
         """
+        parts = arg_text.split(maxsplit=1)
+        if len(parts) == 2:
+            await self._login_from_args(chat_id, user_id, parts[0], parts[1], reply_to_message_id)
+            return
+
         # Nếu user đã trong state login (vd: gõ /dangnhap 2 lần), hủy state cũ.
         await self.state.clear_state(user_id)
 
@@ -90,34 +104,30 @@ class LoginHandler:
     async def cancel(self, chat_id: int, user_id: int, message_id: Optional[int] = None) -> None:
         """Hủy luồng login, xóa state và message prompt nếu có."""
         st = await self.state.get_state(user_id)
-        prompt_id = st.get("username_prompt_message_id")
-        if prompt_id:
-            await self.telegram.delete_message(chat_id, prompt_id)
-        await self.state.clear_state(user_id)
-        if message_id:
-            await self.telegram.delete_message(chat_id, message_id)
+        await asyncio.gather(
+            self._delete_messages(chat_id, st.get("username_prompt_message_id"), message_id),
+            self.state.clear_state(user_id),
+        )
         await self.telegram.send_message(chat_id=chat_id, text="Đã hủy đăng nhập.")
 
     # ==================== Internal ====================
 
     async def _handle_username(
-        self, chat_id: int, user_id: int, username: str, message_id: int, st: Dict[str, Any]
+        self, chat_id: int, user_id: int, username: str, message_id: int, st: BotState
     ) -> None:
         """User vừa gửi username. Xoá message user + prompt, hỏi password."""
         login_command_message_id = st.get("login_command_message_id")
         username_prompt_message_id = st.get("username_prompt_message_id")
 
-        # Xoá message user chứa username
-        await self.telegram.delete_message(chat_id, message_id)
-        # Xoá message prompt hỏi username
-        if username_prompt_message_id:
-            await self.telegram.delete_message(chat_id, username_prompt_message_id)
-
-        # Gửi prompt hỏi password
-        sent = await self.telegram.send_message(
-            chat_id=chat_id,
-            text="Vui lòng nhập mật khẩu của bạn:",
-            reply_to_message_id=login_command_message_id,
+        # Xoá message user chứa username + prompt hỏi username, đồng thời gửi prompt
+        # hỏi password — các call độc lập nên chạy song song
+        _, sent = await asyncio.gather(
+            self._delete_messages(chat_id, message_id, username_prompt_message_id),
+            self.telegram.send_message(
+                chat_id=chat_id,
+                text="Vui lòng nhập mật khẩu của bạn:",
+                reply_to_message_id=login_command_message_id,
+            ),
         )
         await self.state.set_state(user_id, {
             "step": STEP_AWAITING_PASSWORD,
@@ -127,40 +137,70 @@ class LoginHandler:
         })
 
     async def _handle_password(
-        self, chat_id: int, user_id: int, password: str, message_id: int, st: Dict[str, Any]
+        self, chat_id: int, user_id: int, password: str, message_id: int, st: BotState
     ) -> None:
         """User vừa gửi password. Xoá message user + prompt, gọi API đăng nhập."""
         username = st.get("username", "")
         login_command_message_id = st.get("login_command_message_id")
         password_prompt_message_id = st.get("password_prompt_message_id")
 
-        # Xoá message chứa password và prompt ngay để tránh lộ
-        await self.telegram.delete_message(chat_id, message_id)
-        if password_prompt_message_id:
-            await self.telegram.delete_message(chat_id, password_prompt_message_id)
-
+        # Xoá message chứa password và prompt ngay để tránh lộ, song song với gọi API
         device_uuid = generate_uuid()
-        result = await self.handle_login(user_id, username, password, device_uuid)
+        _, result = await asyncio.gather(
+            self._delete_messages(chat_id, message_id, password_prompt_message_id),
+            self.handle_login(user_id, username, password, device_uuid),
+        )
 
         # Xóa state
         await self.state.clear_state(user_id)
+        await self._send_login_result(chat_id, result, login_command_message_id)
+
+    async def _login_from_args(
+        self, chat_id: int, user_id: int, username: str, password: str, command_message_id: Optional[int]
+    ) -> None:
+        """`/dangnhap <username> <password>`: xoá message lệnh (chứa mật khẩu) song song với gọi API."""
+        deleted, _, result = await asyncio.gather(
+            self._delete_messages(chat_id, command_message_id),
+            self.state.clear_state(user_id),
+            self.handle_login(user_id, username, password, generate_uuid()),
+        )
+        # Message lệnh đã bị xoá thì không reply vào nó được
+        await self._send_login_result(chat_id, result, None if deleted else command_message_id)
+        if not deleted:
+            # Vd trong group bot không có quyền xoá → mật khẩu vẫn còn hiển thị
+            await self.telegram.send_message(
+                chat_id=chat_id,
+                text="⚠️ Không thể xoá tin nhắn chứa mật khẩu. Vui lòng tự xoá tin nhắn /dangnhap của bạn.",
+                reply_to_message_id=command_message_id,
+            )
 
+    async def _send_login_result(
+        self, chat_id: int, result: Dict[str, Any], reply_to_message_id: Optional[int]
+    ) -> None:
         if result["success"]:
             ho_ten = result.get("ho_ten")
             text = f"Đăng nhập thành công! ({ho_ten})" if ho_ten else "Đăng nhập thành công!"
             await self.telegram.send_message(
                 chat_id=chat_id,
                 text=text,
-                reply_to_message_id=login_command_message_id,
+                reply_to_message_id=reply_to_message_id,
             )
         else:
             await self.telegram.send_message(
                 chat_id=chat_id,
                 text=result["message"],
-                reply_to_message_id=login_command_message_id,
+                reply_to_message_id=reply_to_message_id,
                 parse_mode="HTML",
             )
 
+    async def _delete_messages(self, chat_id: int, *message_ids: Optional[int]) -> bool:
+        """Xóa nhiều message trong 1 request (bỏ qua id rỗng). Lỗi chỉ được log, trả về False."""
+        try:
+            return await self.telegram.delete_messages(chat_id, message_ids)
+        except Exception as e:
+            logger.warning("Không thể xóa message trong luồng đăng nhập: %s", e)
+            return False
+
     # ==================== HUTECH login ====================
 
     async def handle_login(
@@ -230,17 +270,16 @@ class LoginHandler:
         try:
             url = f"{self.config.HUTECH_API_BASE_URL}{self.config.HUTECH_LOGIN_ENDPOINT}"
             headers = self.config.HUTECH_STUDENT_HEADERS.copy()
-            async with aiohttp.ClientSession() as session:
-                async with session.post(url, headers=headers, json=request_data) as response:
-                    if response.status == 200:
-                        return await response.json()
-                    error_text = await response.text()
-                    logger.error("Login API error: %s - %s", response.status, error_text)
-                    return {
-                        "error": True,
-                        "status_code": response.status,
-                        "message": error_text,
-                    }
+            async with self.http.session.post(url, headers=headers, json=request_data) as response:
+                if response.status == 200:
+                    return await response.json()
+                error_text = await response.text()
+                logger.error("Login API error: %s - %s", response.status, error_text)
+                return {
+                    "error": True,
+                    "status_code": response.status,
+                    "message": error_text,
+                }
         except aiohttp.ClientError as e:
             logger.error("HTTP client error: %s", e)
             return {"error": True, "message": f"Lỗi kết nối: {str(e)}"}
@@ -11,11 +11,8 @@ Luồng `/dangxuat`:
 4. Nếu còn account khác → chuyển sang account đó.
 """
 
-import json
 import logging
-from typing import Any, Dict, Optional
-
-import aiohttp
+from typing import Optional
 
 from config.config import Config
 from utils.telegram_api import TelegramAPI
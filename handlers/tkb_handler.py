@@ -13,6 +13,7 @@ Cú pháp callback:
     tkb_subject_toggle_<ma_hp>   - bật/tắt chọn môn
     tkb_subject_confirm          - xác nhận xuất
     tkb_subject_cancel           - hủy chọn môn
+    tkb_noop                     - nút đếm số môn đã chọn (không làm gì)
     tkb_time_all                 - xuất toàn bộ thời gian
     tkb_time_current             - xuất từ tuần hiện tại
     tkb_time_back                - quay lại menu chọn môn
@@ -21,46 +22,98 @@ State tạm per user (lưu trong cache):
     tkb_week_offset: int
     tkb_subjects: list
     selected_subjects: list
-    tkb_subjects_dict: dict
+    tkb_subject_names: dict
     tkb_command_message_id: int
 """
 
 import asyncio
 import json
 import logging
-import os
 from datetime import datetime, timedelta
-from typing import Any, Dict, List, Optional
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional
 
 import aiohttp
 import pytz
 from icalendar import Calendar, Event
 
+from cache.base import USER_DATA_MAX_AGE
 from config.config import Config
+from utils import background
 from utils.button_style import make_inline_button, build_inline_keyboard
 from utils.rich_message import (
-    escape_html,
     section_heading,
     p_with_emoji,
-    h2,
-    p_bold,
     p,
-    code,
-    hr,
-    footer,
     footer_updated_at,
     join_blocks,
-    kv_line,
     table,
 )
 from utils.state_store import StateStore
+from utils.http_client import HttpClient
 from utils.telegram_api import TelegramAPI, TelegramAPIError
+from utils.utils import NOT_LOGGED_IN, NOT_LOGGED_IN_MESSAGE
 
 logger = logging.getLogger(__name__)
 
 # Key prefix cho TKB state
 TKB_STATE_KEY = "tkb"
 TKB_TTL = 1800  # 30 phút
+# Các key state của flow xuất .ics — xóa cùng lúc khi hủy / xuất xong
+TKB_EXPORT_STATE_KEYS = ("tkb_subjects", "selected_subjects", "tkb_subject_names", "tkb_week_offset")
+
+
+# Nút / hàng nút không đổi → dựng 1 lần, dùng chung cho mọi keyboard
+_CURRENT_WEEK_BUTTON = make_inline_button("Tuần hiện tại", "tkb_0", tone=None)
+_SUBJECT_ACTION_ROW = [
+    make_inline_button("Xác nhận", "tkb_subject_confirm", tone="success"),
+    make_inline_button("Hủy", "tkb_subject_cancel", tone="danger"),
+]
+
+
+@lru_cache(maxsize=64)
+def _week_keyboard(week_offset: int) -> Dict[str, Any]:
+    """Keyboard điều hướng tuần — chỉ phụ thuộc `week_offset` nên cache theo offset."""
+    return build_inline_keyboard([
+        [
+            make_inline_button("Tuần trước", f"tkb_{week_offset - 1}", tone=None),
+            _CURRENT_WEEK_BUTTON,
+            make_inline_button("Tuần tới", f"tkb_{week_offset + 1}", tone=None),
+        ],
+        [
+            make_inline_button("Xuất iCalendar (.ics)", f"tkb_export_ics_{week_offset}", tone="warning", emoji="🗓️"),
+        ],
+    ])
+
+
+@lru_cache(maxsize=2048)
+def _subject_row(ma_hp: str, ten_hp: str, selected: bool) -> List[Dict[str, Any]]:
+    """Hàng nút 1 môn trong menu chọn môn. Mỗi lần bấm chọn/bỏ chọn chỉ 1 môn đổi
+    trạng thái → các hàng còn lại lấy lại từ cache thay vì dựng lại."""
+    return [make_inline_button(
+        f"{ten_hp} ({ma_hp})", f"tkb_subject_toggle_{ma_hp}", tone="primary" if selected else None
+    )]
+
+
+def _subject_picker_text(total: int) -> str:
+    """Text của menu chọn môn. Số môn đã chọn nằm trên keyboard (nút đầu) nên
+    text không đổi khi bấm chọn/bỏ chọn → chỉ cần edit reply_markup."""
+    return (
+        f"📚 <b>Chọn môn học để xuất</b>\n\n"
+        f"Tổng số môn học: <code>{total}</code>\n\n"
+        f"Vui lòng chọn các môn học bên dưới:"
+    )
+
+
+_TIME_KEYBOARD = build_inline_keyboard([
+    [
+        make_inline_button("Toàn bộ thời gian", "tkb_time_all", tone=None, emoji="📅"),
+        make_inline_button("Từ tuần hiện tại", "tkb_time_current", tone=None, emoji="📆"),
+    ],
+    [
+        make_inline_button("Quay lại", "tkb_time_back", tone="neutral"),
+    ],
+])
 
 
 class TkbHandler:
@@ -70,6 +123,7 @@ class TkbHandler:
         self.db_manager = db_manager
         self.cache_manager = cache_manager
         self.config = Config()
+        self.http = HttpClient()
         self.telegram = telegram_api or TelegramAPI(self.config)
         self.state = StateStore(self.cache_manager)
 
@@ -77,14 +131,6 @@ class TkbHandler:
 
     async def cmd_tkb(self, chat_id: int, user_id: int, args: List[str],
                       reply_to_message_id: Optional[int]) -> None:
-        if not await self.db_manager.is_user_logged_in(user_id):
-            await self.telegram.send_message(
-                chat_id=chat_id,
-                text="Bạn chưa đăng nhập. Vui lòng /dangnhap để đăng nhập.",
-                reply_to_message_id=reply_to_message_id,
-            )
-            return
-
         week_offset = 0
         if args:
             try:
@@ -107,30 +153,18 @@ class TkbHandler:
             reply_to_message_id=reply_to_message_id,
         )
 
-    # ==================== Callback router ====================
-
-    async def cb_route(self, callback_id: str, chat_id: int, message_id: int,
-                       user_id: int, callback_data: str) -> None:
-        if callback_data.startswith("tkb_subject_"):
-            await self._cb_subject(callback_id, chat_id, message_id, user_id, callback_data)
-        elif callback_data.startswith("tkb_time_"):
-            await self._cb_time(callback_id, chat_id, message_id, user_id, callback_data)
-        elif callback_data.startswith("tkb_export_ics_"):
-            await self._cb_export(callback_id, chat_id, message_id, user_id, callback_data)
-        elif callback_data.startswith("tkb_"):
-            await self._cb_week(callback_id, chat_id, message_id, user_id, callback_data)
+    # ==================== Callbacks ====================
 
-    # ==================== Callback implementations ====================
-
-    async def _cb_week(self, callback_id: str, chat_id: int, message_id: int,
-                       user_id: int, callback_data: str) -> None:
+    async def cb_week(self, callback_id: str, chat_id: int, message_id: int,
+                      user_id: int, callback_data: str) -> None:
         try:
-            week_offset = int(callback_data.split("_")[1])
-        except (ValueError, IndexError):
+            week_offset = int(callback_data.removeprefix("tkb_"))
+        except ValueError:
             week_offset = 0
-        await self.telegram.answer_callback_query(callback_id, text="Đang tải thời khóa biểu...")
-
-        result = await self.handle_tkb(user_id, week_offset)
+        _, result = await asyncio.gather(
+            self.telegram.answer_callback_query(callback_id, text="Đang tải thời khóa biểu..."),
+            self.handle_tkb(user_id, week_offset),
+        )
         if not result["success"]:
             try:
                 await self.telegram.edit_message_text_plain(
@@ -151,15 +185,16 @@ class TkbHandler:
             if "message is not modified" not in e.description.lower():
                 raise
 
-    async def _cb_export(self, callback_id: str, chat_id: int, message_id: int,
+    async def cb_export(self, callback_id: str, chat_id: int, message_id: int,
                         user_id: int, callback_data: str) -> None:
         try:
-            week_offset = int(callback_data.split("_")[3])
-        except (ValueError, IndexError):
+            week_offset = int(callback_data.removeprefix("tkb_export_ics_"))
+        except ValueError:
             week_offset = 0
-        await self.telegram.answer_callback_query(callback_id, text="Đang tải danh sách môn học...")
-
-        result = await self.handle_export_tkb_ics(user_id, week_offset)
+        _, result = await asyncio.gather(
+            self.telegram.answer_callback_query(callback_id, text="Đang tải danh sách môn học..."),
+            self.handle_export_tkb_ics(user_id, week_offset),
+        )
         if not result.get("success"):
             await self.telegram.answer_callback_query(
                 callback_id, text=f"Lỗi: {result.get('message', 'Không rõ')}", show_alert=True
@@ -171,113 +206,104 @@ class TkbHandler:
             "tkb_week_offset": week_offset,
             "tkb_subjects": subjects,
             "selected_subjects": [],
-            "tkb_subjects_dict": {s.get("ma_hp"): s for s in subjects},
+            # Chỉ cần tên môn để liệt kê lúc xác nhận / ghi caption — không lưu
+            # cả object môn (kèm lịch học) thêm 1 lần nữa vào state
+            "tkb_subject_names": {s.get("ma_hp"): s.get("ten_hp", s.get("ma_hp")) for s in subjects},
         })
 
-        message = (
-            f"📚 <b>Chọn môn học để xuất</b>\n\n"
-            f"Tổng số môn học: <code>{len(subjects)}</code>\n"
-            f"Đã chọn: 0 môn\n\n"
-            f"Vui lòng chọn các môn học bên dưới:"
-        )
         try:
             await self.telegram.edit_message_text_plain(
                 chat_id=chat_id,
                 message_id=message_id,
-                text=message,
+                text=_subject_picker_text(len(subjects)),
                 reply_markup=self._subject_keyboard(subjects, []),
                 parse_mode="HTML",
             )
         except TelegramAPIError:
             pass
 
-    async def _cb_subject(self, callback_id: str, chat_id: int, message_id: int,
-                         user_id: int, callback_data: str) -> None:
+    async def cb_subject_confirm(self, callback_id: str, chat_id: int, message_id: int,
+                                 user_id: int, callback_data: str) -> None:
         st = await self.state.get_state(user_id)
-        subjects = st.get("tkb_subjects", [])
-        subjects_dict = st.get("tkb_subjects_dict", {})
-        selected = list(st.get("selected_subjects", []))
-
-        if callback_data == "tkb_subject_confirm":
-            if not selected:
-                await self.telegram.answer_callback_query(
-                    callback_id, text="Vui lòng chọn ít nhất một môn học!", show_alert=True
-                )
-                return
-            names = [subjects_dict.get(ma, {}).get("ten_hp", ma) for ma in selected if ma in subjects_dict]
-            msg = f"✅ <b>Đã chọn {len(selected)} môn học:</b>\n\n" + "\n".join(f"- {n}" for n in names)
-            try:
-                await self.telegram.edit_message_text_plain(
-                    chat_id=chat_id,
-                    message_id=message_id,
-                    text=msg,
-                    reply_markup=self._time_keyboard(),
-                    parse_mode="HTML",
-                )
-            except TelegramAPIError:
-                pass
-            return
-
-        if callback_data == "tkb_subject_cancel":
-            for k in ("tkb_subjects", "selected_subjects", "tkb_subjects_dict", "tkb_week_offset"):
-                await self.state.update_state(user_id, {k: None})
-            try:
-                await self.telegram.edit_message_text_plain(
-                    chat_id=chat_id, message_id=message_id,
-                    text="❌ <b>Đã hủy xuất file.</b>", parse_mode="HTML",
-                )
-            except TelegramAPIError:
-                pass
+        subject_names = st.get("tkb_subject_names", {})
+        selected = st.get("selected_subjects", [])
+        if not selected:
+            await self.telegram.answer_callback_query(
+                callback_id, text="Vui lòng chọn ít nhất một môn học!", show_alert=True
+            )
             return
+        names = [subject_names[ma] for ma in selected if ma in subject_names]
+        msg = f"✅ <b>Đã chọn {len(selected)} môn học:</b>\n\n" + "\n".join(f"- {n}" for n in names)
+        try:
+            await self.telegram.edit_message_text_plain(
+                chat_id=chat_id,
+                message_id=message_id,
+                text=msg,
+                reply_markup=self._time_keyboard(),
+                parse_mode="HTML",
+            )
+        except TelegramAPIError:
+            pass
 
-        if callback_data.startswith("tkb_subject_toggle_"):
-            ma_hp = callback_data[len("tkb_subject_toggle_"):]
-            if ma_hp in selected:
-                selected.remove(ma_hp)
-            else:
-                selected.append(ma_hp)
-            await self.state.update_state(user_id, {"selected_subjects": selected})
-            message = (
-                f"📚 <b>Chọn môn học để xuất</b>\n\n"
-                f"Tổng số môn học: <code>{len(subjects)}</code>\n"
-                f"Đã chọn: {len(selected)} môn\n\n"
-                f"Vui lòng chọn các môn học bên dưới:"
+    async def cb_subject_cancel(self, callback_id: str, chat_id: int, message_id: int,
+                                user_id: int, callback_data: str) -> None:
+        await self.state.discard_keys(user_id, *TKB_EXPORT_STATE_KEYS)
+        try:
+            await self.telegram.edit_message_text_plain(
+                chat_id=chat_id, message_id=message_id,
+                text="❌ <b>Đã hủy xuất file.</b>", parse_mode="HTML",
             )
-            try:
-                await self.telegram.edit_message_text_plain(
-                    chat_id=chat_id,
-                    message_id=message_id,
-                    text=message,
-                    reply_markup=self._subject_keyboard(subjects, selected),
-                    parse_mode="HTML",
-                )
-            except TelegramAPIError as e:
-                if "message is not modified" not in e.description.lower():
-                    raise
+        except TelegramAPIError:
+            pass
+
+    async def cb_subject_toggle(self, callback_id: str, chat_id: int, message_id: int,
+                                user_id: int, callback_data: str) -> None:
+        st = await self.state.get_state(user_id)
+        subjects = st.get("tkb_subjects", [])
+        # dict làm "ordered set": tra cứu O(1), vẫn giữ thứ tự chọn để liệt kê
+        selected = dict.fromkeys(st.get("selected_subjects", []))
+        ma_hp = callback_data.removeprefix("tkb_subject_toggle_")
+        if ma_hp in selected:
+            del selected[ma_hp]
+        else:
+            selected[ma_hp] = None
+        # State đi qua JSON → lưu dạng list
+        # Text không đổi → chỉ edit keyboard (có nút đếm số môn đã chọn)
+        await asyncio.gather(
+            self.telegram.answer_callback_query(callback_id),
+            self.state.update_state(user_id, {"selected_subjects": list(selected)}),
+            self.telegram.edit_message_reply_markup(
+                chat_id=chat_id,
+                message_id=message_id,
+                reply_markup=self._subject_keyboard(subjects, selected),
+            ),
+        )
 
-    async def _cb_time(self, callback_id: str, chat_id: int, message_id: int,
+    async def cb_noop(self, callback_id: str, chat_id: int, message_id: int,
                       user_id: int, callback_data: str) -> None:
+        """Nút chỉ để hiển thị (vd đếm số môn đã chọn) — chỉ tắt loading."""
+        await self.telegram.answer_callback_query(callback_id)
+
+    async def cb_time_back(self, callback_id: str, chat_id: int, message_id: int,
+                           user_id: int, callback_data: str) -> None:
         st = await self.state.get_state(user_id)
+        subjects = st.get("tkb_subjects", [])
         selected = st.get("selected_subjects", [])
-        subjects_dict = st.get("tkb_subjects_dict", {})
-
-        if callback_data == "tkb_time_back":
-            subjects = st.get("tkb_subjects", [])
-            message = (
-                f"📚 <b>Chọn môn học để xuất</b>\n\n"
-                f"Tổng số môn học: <code>{len(subjects)}</code>\n"
-                f"Đã chọn: {len(selected)} môn\n\n"
-                f"Vui lòng chọn các môn học bên dưới:"
-            )
-            try:
-                await self.telegram.edit_message_text_plain(
-                    chat_id=chat_id, message_id=message_id, text=message,
+        # Hàng nút từng môn lấy từ cache `_subject_row` → chỉ ghép lại list
+        try:
+            await asyncio.gather(
+                self.telegram.answer_callback_query(callback_id),
+                self.telegram.edit_message_text_plain(
+                    chat_id=chat_id, message_id=message_id, text=_subject_picker_text(len(subjects)),
                     reply_markup=self._subject_keyboard(subjects, selected), parse_mode="HTML",
-                )
-            except TelegramAPIError:
-                pass
-            return
+                ),
+            )
+        except TelegramAPIError:
+            pass
 
+    async def cb_time_export(self, callback_id: str, chat_id: int, message_id: int,
+                             user_id: int, callback_data: str) -> None:
+        """`tkb_time_all` / `tkb_time_current` — tạo và gửi file .ics."""
         if callback_data == "tkb_time_all":
             time_range = "all"
             time_label = "toàn bộ thời gian"
@@ -287,30 +313,53 @@ class TkbHandler:
         else:
             return
 
-        await self.telegram.answer_callback_query(
-            callback_id, text="Đang tạo file .ics, vui lòng chờ...", show_alert=False
+        st, cached = await asyncio.gather(
+            self.state.get_state(user_id),
+            self.cache_manager.get(f"tkb:{user_id}"),
         )
-
-        cache_key = f"tkb:{user_id}"
-        cached = await self.cache_manager.get(cache_key)
+        if "tkb_subject_names" not in st:
+            # Đã xuất / hủy rồi (vd bấm lại nút khi file đang được tạo)
+            await self.telegram.answer_callback_query(
+                callback_id, text="Phiên chọn môn đã kết thúc. Gửi /tkb để xuất lại."
+            )
+            return
         if not cached:
-            await self.telegram.send_message(
-                chat_id=chat_id, text="⚠️ Không tìm thấy dữ liệu TKB. Vui lòng thử lại."
+            # Dữ liệu TKB đã hết hạn trong cache → phải tải lại qua /tkb
+            await self.telegram.answer_callback_query(
+                callback_id, text="Dữ liệu TKB đã hết hạn. Gửi /tkb để tải lại rồi xuất file."
             )
             return
 
-        tkb_raw = cached.get("data")
-        all_data = self.get_all_tkb_data(tkb_raw)
+        # Xóa state ngay trong handler: lần bấm sau rơi vào nhánh trên thay vì
+        # xuất thêm 1 file. Tạo + gửi file chạy nền để vòng nhận update đi tiếp.
+        await asyncio.gather(
+            self.telegram.answer_callback_query(
+                callback_id, text="Đang tạo file .ics, vui lòng chờ...", show_alert=False
+            ),
+            self.state.discard_keys(user_id, *TKB_EXPORT_STATE_KEYS),
+        )
+        background.spawn(
+            self._send_ics(chat_id, message_id, user_id, st, cached, time_range, time_label),
+            name=f"tkb_ics:{user_id}",
+        )
+
+    async def _send_ics(self, chat_id: int, message_id: int, user_id: int, st: Dict[str, Any],
+                        cached: Dict[str, Any], time_range: str, time_label: str) -> None:
+        selected = st.get("selected_subjects", [])
+        subject_names = st.get("tkb_subject_names", {})
         week_offset = st.get("tkb_week_offset", 0)
-        file_path = self.create_ics_file(all_data, user_id, week_offset, selected, time_range)
+        # Parse ngày + dựng VEVENT cho cả học kỳ tốn CPU → chạy ở thread riêng
+        file_bytes = await asyncio.to_thread(
+            self._export_ics_bytes, cached.get("data"), user_id, week_offset, selected, time_range
+        )
 
-        if not file_path or not os.path.exists(file_path):
+        if not file_bytes:
             await self.telegram.send_message(
                 chat_id=chat_id, text="⚠️ Không có lịch học nào phù hợp với bộ lọc đã chọn."
             )
             return
 
-        names = [subjects_dict.get(ma, {}).get("ten_hp", ma) for ma in selected if ma in subjects_dict]
+        names = [subject_names[ma] for ma in selected if ma in subject_names]
         subject_list = ", ".join(names) if names else "tất cả các môn"
         caption = (
             f"🗓️ <b>File iCalendar thời khóa biểu</b>\n\n"
@@ -318,30 +367,21 @@ class TkbHandler:
             f"Thời gian: {time_label}"
         )
         try:
-            with open(file_path, "rb") as f:
-                file_bytes = f.read()
-            await self.telegram.send_document(
+            await background.retry_on_flood(lambda: self.telegram.send_document(
                 chat_id=chat_id,
                 file=file_bytes,
                 filename=f"tkb_{user_id}.ics",
                 caption=caption,
                 parse_mode="HTML",
-            )
+            ))
         except Exception as e:
             logger.error("Lỗi gửi file ICS cho user %s: %s", user_id, e)
             await self.telegram.send_message(
                 chat_id=chat_id, text="Có lỗi xảy ra khi gửi file."
             )
         finally:
-            try:
-                os.remove(file_path)
-            except OSError:
-                pass
             await self.telegram.delete_message(chat_id, message_id)
 
-        for k in ("tkb_subjects", "selected_subjects", "tkb_subjects_dict", "tkb_week_offset"):
-            await self.state.update_state(user_id, {k: None})
-
     # ==================== Data layer ====================
 
     async def handle_tkb(self, telegram_user_id: int, week_offset: int = 0) -> Dict[str, Any]:
@@ -357,11 +397,11 @@ class TkbHandler:
 
             token = await self._get_user_token(telegram_user_id)
             if not token:
-                return {"success": False, "message": "Bạn chưa đăng nhập. Vui lòng /dangnhap.", "data": None}
+                return {"success": False, "reason": NOT_LOGGED_IN, "message": NOT_LOGGED_IN_MESSAGE, "data": None}
 
             response = await self._call_tkb_api(token)
             if response and isinstance(response, list):
-                await self.cache_manager.set(cache_key, response, ttl=3600)
+                await self.cache_manager.set(cache_key, response, ttl=USER_DATA_MAX_AGE)
                 processed = self._process_tkb_data(response, week_offset)
                 cached_data = await self.cache_manager.get(cache_key)
                 processed["timestamp"] = (
@@ -386,7 +426,7 @@ class TkbHandler:
                     return {"success": False, "message": "Bạn chưa đăng nhập."}
                 response = await self._call_tkb_api(token)
                 if response and isinstance(response, list):
-                    await self.cache_manager.set(cache_key, response, ttl=3600)
+                    await self.cache_manager.set(cache_key, response, ttl=USER_DATA_MAX_AGE)
                     tkb_raw = response
                 else:
                     return {"success": False, "message": "Không thể lấy dữ liệu TKB từ API."}
@@ -398,7 +438,6 @@ class TkbHandler:
                 return {"success": False, "message": "Không có môn học nào để xuất."}
             return {
                 "success": True, "message": "Chọn môn học để xuất",
-                "keyboard": self._subject_keyboard(subjects, []),
                 "subjects": subjects, "week_offset": week_offset,
             }
         except Exception as e:
@@ -410,11 +449,10 @@ class TkbHandler:
             url = f"{self.config.HUTECH_API_BASE_URL}{self.config.HUTECH_TKB_ENDPOINT}"
             headers = self.config.HUTECH_MOBILE_HEADERS.copy()
             headers["authorization"] = f"JWT {token}"
-            async with aiohttp.ClientSession() as session:
-                async with session.post(url, headers=headers, json={}) as response:
-                    if response.status == 201:
-                        return await response.json()
-                    return {"error": True, "status_code": response.status, "message": await response.text()}
+            async with self.http.session.post(url, headers=headers, json={}) as response:
+                if response.status == 201:
+                    return await response.json()
+                return {"error": True, "status_code": response.status, "message": await response.text()}
         except aiohttp.ClientError as e:
             return {"error": True, "message": f"Lỗi kết nối: {str(e)}"}
         except json.JSONDecodeError as e:
@@ -619,8 +657,16 @@ class TkbHandler:
 
     # ==================== ICS export ====================
 
-    def create_ics_file(self, tkb_data: Dict[str, Any], telegram_user_id: int, week_offset: int = 0,
-                        selected_subjects: Optional[List[str]] = None, time_range: str = "all") -> Optional[str]:
+    def _export_ics_bytes(self, tkb_raw: List[Dict[str, Any]], telegram_user_id: int, week_offset: int,
+                          selected_subjects: Iterable[str], time_range: str) -> Optional[bytes]:
+        """Từ dữ liệu TKB thô trong cache → nội dung file .ics (chạy trong thread)."""
+        return self.build_ics_bytes(
+            self.get_all_tkb_data(tkb_raw), telegram_user_id, week_offset, selected_subjects, time_range
+        )
+
+    def build_ics_bytes(self, tkb_data: Dict[str, Any], telegram_user_id: int, week_offset: int = 0,
+                        selected_subjects: Optional[Iterable[str]] = None, time_range: str = "all") -> Optional[bytes]:
+        """Dựng nội dung file .ics trong RAM (không ghi file tạm). None nếu không có môn nào."""
         try:
             cal = Calendar()
             cal.add("prodid", "-//HUTECH TKB Bot//hutech.edu.vn//")
@@ -629,8 +675,7 @@ class TkbHandler:
             subjects = tkb_data.get("subjects", [])
             if not subjects:
                 return None
-            if selected_subjects is None:
-                selected_subjects = []
+            selected_subjects = set(selected_subjects or ())
             today = datetime.now()
             days_since_monday = today.weekday()
             monday = today - timedelta(days=days_since_monday)
@@ -671,52 +716,28 @@ class TkbHandler:
                     except (ValueError, TypeError) as e:
                         logger.warning("Skipping event due to processing error: %s", e)
                         continue
-            temp_dir = "temp"
-            if not os.path.exists(temp_dir):
-                os.makedirs(temp_dir)
-            file_path = os.path.join(temp_dir, f"tkb_{telegram_user_id}.ics")
-            with open(file_path, "wb") as f:
-                f.write(cal.to_ical())
-            return file_path
+            return cal.to_ical()
         except Exception as e:
             logger.error("Error creating ICS file for user %s: %s", telegram_user_id, e)
             return None
 
     # ==================== Keyboards ====================
 
-    def _week_keyboard(self, week_offset: int) -> Dict[str, Any]:
-        return build_inline_keyboard([
-            [
-                make_inline_button("Tuần trước", f"tkb_{week_offset - 1}", tone=None),
-                make_inline_button("Tuần hiện tại", "tkb_0", tone=None),
-                make_inline_button("Tuần tới", f"tkb_{week_offset + 1}", tone=None),
-            ],
-            [
-                make_inline_button("Xuất iCalendar (.ics)", f"tkb_export_ics_{week_offset}", tone="warning", emoji="🗓️"),
-            ],
-        ])
-
-    def _subject_keyboard(self, subjects: List[Dict[str, Any]], selected: List[str]) -> Dict[str, Any]:
-        rows: List[List[Dict[str, Any]]] = []
+    @staticmethod
+    def _week_keyboard(week_offset: int) -> Dict[str, Any]:
+        return _week_keyboard(week_offset)
+
+    def _subject_keyboard(self, subjects: List[Dict[str, Any]], selected: Iterable[str]) -> Dict[str, Any]:
+        selected = set(selected)
+        rows: List[List[Dict[str, Any]]] = [[
+            make_inline_button(f"Đã chọn: {len(selected)}/{len(subjects)}", "tkb_noop", tone=None)
+        ]]
         for subject in subjects:
             ma_hp = subject.get("ma_hp", "")
-            ten_hp = subject.get("ten_hp", "")
-            text = f"{ten_hp} ({ma_hp})"
-            tone = "primary" if ma_hp in selected else None
-            rows.append([make_inline_button(text, f"tkb_subject_toggle_{ma_hp}", tone=tone)])
-        rows.append([
-            make_inline_button("Xác nhận", "tkb_subject_confirm", tone="success"),
-            make_inline_button("Hủy", "tkb_subject_cancel", tone="danger"),
-        ])
+            rows.append(_subject_row(ma_hp, subject.get("ten_hp", ""), ma_hp in selected))
+        rows.append(_SUBJECT_ACTION_ROW)
         return build_inline_keyboard(rows)
 
-    def _time_keyboard(self) -> Dict[str, Any]:
-        return build_inline_keyboard([
-            [
-                make_inline_button("Toàn bộ thời gian", "tkb_time_all", tone=None, emoji="📅"),
-                make_inline_button("Từ tuần hiện tại", "tkb_time_current", tone=None, emoji="📆"),
-            ],
-            [
-                make_inline_button("Quay lại", "tkb_time_back", tone="neutral"),
-            ],
-        ])
+    @staticmethod
+    def _time_keyboard() -> Dict[str, Any]:
+        return _TIME_KEYBOARD
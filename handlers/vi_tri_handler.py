@@ -12,12 +12,14 @@ UI dùng Rich Message (Bot API 10.1): mỗi khi user chọn / xoá campus,
 message được edit kèm `<tg-map>` preview vị trí GPS.
 
 Cú pháp callback:
-    vitri_select_<campus_name>  - lưu campus làm mặc định
+    vitri_select_<index>        - lưu campus làm mặc định (index trong `CAMPUS_NAMES`)
     vitri_delete                - xóa campus đã lưu
 """
 
+import asyncio
 import logging
-from typing import Any, Dict, List, Optional
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
 
 from utils.button_style import make_inline_button, build_inline_keyboard
 from utils.rich_message import (
@@ -41,6 +43,25 @@ CAMPUS_LOCATIONS: Dict[str, Dict[str, float]] = {
     "Hitech Park Campus": {"lat": 10.8408075, "long": 106.8088987},
 }
 
+# Thứ tự cố định của campus — callback_data chỉ mang index thay vì tên đầy đủ
+CAMPUS_NAMES = tuple(CAMPUS_LOCATIONS)
+
+
+def campus_token(campus_name: str) -> str:
+    """Mã hoá tên campus thành index ngắn để nhét vào `callback_data`."""
+    return str(CAMPUS_NAMES.index(campus_name))
+
+
+def campus_from_token(token: str) -> Optional[str]:
+    """Giải mã token từ `callback_data` về tên campus. Trả về None nếu không hợp lệ.
+
+    Vẫn nhận tên campus đầy đủ để các menu gửi trước khi đổi format còn bấm được.
+    """
+    if token.isascii() and token.isdigit():
+        index = int(token)
+        return CAMPUS_NAMES[index] if index < len(CAMPUS_NAMES) else None
+    return token if token in CAMPUS_LOCATIONS else None
+
 
 def build_campus_map_block(campus_name: Optional[str]) -> str:
     """Trả về `<tg-map>` cho campus (chuỗi rỗng nếu không hợp lệ).
@@ -61,6 +82,27 @@ def build_campus_map_block(campus_name: Optional[str]) -> str:
     )
 
 
+def build_campus_keyboard(callback_prefix: str) -> Dict[str, Any]:
+    """Dựng menu chọn campus 2 cột, callback là `<callback_prefix><index>`.
+
+    Layout cố định nên các handler gọi 1 lần lúc import rồi dùng lại dict này.
+    """
+    rows: List[List[Dict[str, Any]]] = []
+    for i in range(0, len(CAMPUS_NAMES), 2):
+        rows.append([
+            make_inline_button(name, f"{callback_prefix}{campus_token(name)}", tone=None, emoji="📍")
+            for name in CAMPUS_NAMES[i:i + 2]
+        ])
+    return build_inline_keyboard(rows)
+
+
+_VITRI_KEYBOARD = build_campus_keyboard("vitri_select_")
+_VITRI_KEYBOARD_WITH_DELETE = build_inline_keyboard(
+    _VITRI_KEYBOARD["inline_keyboard"]
+    + [[make_inline_button("Xóa vị trí đã lưu", "vitri_delete", tone="danger")]]
+)
+
+
 class ViTriHandler:
     """Handler cho `/vitri` — quản lý campus mặc định cho điểm danh."""
 
@@ -84,35 +126,41 @@ class ViTriHandler:
         return CAMPUS_LOCATIONS.get(campus_name)
 
     def get_all_campuses(self) -> List[str]:
-        return list(CAMPUS_LOCATIONS.keys())
+        return list(CAMPUS_NAMES)
 
     async def cmd_vitri(self, chat_id: int, user_id: int, reply_to_message_id: Optional[int]) -> None:
         preferred = await self.get_user_preferred_campus(user_id)
+        html, markup = self._render_menu(preferred)
         await self.telegram.send_rich_message(
             chat_id=chat_id,
-            html=self._format_rich_menu(preferred),
-            reply_markup=self._build_keyboard(preferred),
+            html=html,
+            reply_markup=markup,
             reply_to_message_id=reply_to_message_id,
         )
 
     async def cb_handle(self, callback_id: str, chat_id: int, message_id: int,
                        user_id: int, callback_data: str) -> None:
-        await self.telegram.answer_callback_query(callback_id)
-
         if callback_data == "vitri_delete":
             await self.delete_user_preferred_campus(user_id)
             preferred = None
-            html = self._format_rich_menu(None)
-            markup = self._build_keyboard(None)
         elif callback_data.startswith("vitri_select_"):
-            campus_name = callback_data[len("vitri_select_"):]
-            await self.set_user_preferred_campus(user_id, campus_name)
-            preferred = campus_name
-            html = self._format_rich_menu(campus_name)
-            markup = self._build_keyboard(campus_name)
+            preferred = campus_from_token(callback_data.removeprefix("vitri_select_"))
+            if not preferred:
+                await self.telegram.answer_callback_query(callback_id)
+                return
+            await self.set_user_preferred_campus(user_id, preferred)
         else:
+            await self.telegram.answer_callback_query(callback_id)
             return
 
+        # answer và edit độc lập nhau → gửi song song, bớt 1 RTT
+        await asyncio.gather(
+            self.telegram.answer_callback_query(callback_id),
+            self._edit_menu(chat_id, message_id, preferred),
+        )
+
+    async def _edit_menu(self, chat_id: int, message_id: int, preferred: Optional[str]) -> None:
+        html, markup = self._render_menu(preferred)
         try:
             await self.telegram.edit_message_text_rich(
                 chat_id=chat_id,
@@ -126,6 +174,18 @@ class ViTriHandler:
 
     # ==================== Internal ====================
 
+    @staticmethod
+    @lru_cache(maxsize=16)
+    def _render_menu(preferred_campus: Optional[str]) -> Tuple[str, Dict[str, Any]]:
+        """Dựng (html, keyboard) cho menu `/vitri`, dùng chung cho lệnh và callback.
+
+        Chỉ có vài giá trị campus nên cache luôn kết quả theo campus.
+        """
+        return (
+            ViTriHandler._format_rich_menu(preferred_campus),
+            ViTriHandler._build_keyboard(preferred_campus),
+        )
+
     @staticmethod
     def _format_rich_menu(preferred_campus: Optional[str]) -> str:
         blocks: List[str] = [section_heading("📍", "Quản Lý Vị Trí Điểm Danh")]
@@ -140,14 +200,6 @@ class ViTriHandler:
         blocks.append(p("Chọn một campus để lưu làm vị trí mặc định."))
         return join_blocks(blocks)
 
-    def _build_keyboard(self, preferred_campus: Optional[str]) -> Dict[str, Any]:
-        rows: List[List[Dict[str, Any]]] = []
-        row: List[Dict[str, Any]] = []
-        for i, name in enumerate(self.get_all_campuses()):
-            row.append(make_inline_button(name, f"vitri_select_{name}", tone=None, emoji="📍"))
-            if len(row) == 2 or i == len(self.get_all_campuses()) - 1:
-                rows.append(row)
-                row = []
-        if preferred_campus:
-            rows.append([make_inline_button("Xóa vị trí đã lưu", "vitri_delete", tone="danger")])
-        return build_inline_keyboard(rows)
+    @staticmethod
+    def _build_keyboard(preferred_campus: Optional[str]) -> Dict[str, Any]:
+        return _VITRI_KEYBOARD_WITH_DELETE if preferred_campus else _VITRI_KEYBOARD
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Chạy tác vụ nền "bắn rồi quên" cho handler.
+
+Vòng polling xử lý update tuần tự: handler còn `await` upload file Excel thì
+update của mọi user khác phải xếp hàng chờ. Phần việc user không cần chờ
+(gửi file đã tạo xong...) được đẩy ra `spawn()`; module giữ reference tới
+task (event loop chỉ giữ weak ref → task có thể bị GC giữa chừng), log lỗi
+khi task hỏng và `drain()` đợi chúng xong trước khi bot đóng kết nối.
+
+Tác vụ nền chạy song song nên dễ chạm giới hạn gửi của Telegram (429);
+`retry_on_flood()` chờ đúng `retry_after` rồi gửi lại. Chỉ dùng ở đây — trong
+luồng dispatch, chờ như vậy sẽ chặn update của mọi user.
+"""
+
+import asyncio
+import logging
+from typing import Awaitable, Callable, Optional, Set, TypeVar
+
+from utils.telegram_api import TelegramAPIError
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Gửi lại tối đa bao nhiêu lần sau 429, và chờ tối đa bao lâu (giây) mỗi lần
+FLOOD_RETRY_MAX_ATTEMPTS = 3
+FLOOD_RETRY_MAX_WAIT = 60
+
+_tasks: Set[asyncio.Task] = set()
+
+
+def spawn(coro: Awaitable[None], *, name: Optional[str] = None) -> asyncio.Task:
+    """Chạy `coro` nền, không chặn handler hiện tại."""
+    task = asyncio.ensure_future(coro)
+    if name:
+        task.set_name(name)
+    _tasks.add(task)
+    task.add_done_callback(_on_done)
+    return task
+
+
+def _on_done(task: asyncio.Task) -> None:
+    _tasks.discard(task)
+    if task.cancelled():
+        return
+    exc = task.exception()
+    if exc is not None:
+        logger.error("Tác vụ nền %s lỗi: %s", task.get_name(), exc, exc_info=exc)
+
+
+async def drain(timeout: float = 30) -> None:
+    """Đợi các tác vụ nền còn dở (tối đa `timeout` giây), quá hạn thì hủy."""
+    if not _tasks:
+        return
+    pending = list(_tasks)
+    _, still_pending = await asyncio.wait(pending, timeout=timeout)
+    for task in still_pending:
+        task.cancel()
+    if still_pending:
+        logger.warning("Hủy %s tác vụ nền chưa xong khi dừng bot.", len(still_pending))
+        await asyncio.gather(*still_pending, return_exceptions=True)
+
+
+async def retry_on_flood(factory: Callable[[], Awaitable[T]]) -> T:
+    """Gọi `factory()`; gặp 429 có `retry_after` thì chờ rồi gọi lại.
+
+    `retry_after` quá `FLOOD_RETRY_MAX_WAIT` hoặc hết lượt thử → raise lỗi gốc.
+    """
+    attempt = 1
+    while True:
+        try:
+            return await factory()
+        except TelegramAPIError as e:
+            if (
+                e.retry_after is None
+                or e.retry_after > FLOOD_RETRY_MAX_WAIT
+                or attempt >= FLOOD_RETRY_MAX_ATTEMPTS
+            ):
+                raise
+            logger.warning("%s bị giới hạn (429), gửi lại sau %ss.", e.method, e.retry_after)
+            await asyncio.sleep(e.retry_after)
+            attempt += 1
+
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Gộp (debounce) các lần gọi liên tiếp theo key.
+
+Dùng cho bàn phím số điểm danh: user bấm 4 số liên tục, mỗi lần bấm lẽ ra
+phải edit message để vẽ lại mã đã nhập. Telegram giới hạn ~1 edit/giây mỗi
+chat nên bấm nhanh dễ dính 429. `Debouncer` hoãn lần edit lại `delay` giây,
+nếu trong lúc chờ có lần bấm mới thì hủy lần cũ — chỉ lần cuối được gửi.
+"""
+
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Hashable
+
+logger = logging.getLogger(__name__)
+
+
+class Debouncer:
+    """Chạy `factory()` sau `delay` giây, hủy lần chờ trước đó nếu cùng key."""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        # key -> task đang chờ hết `delay`
+        self._pending: Dict[Hashable, asyncio.Task] = {}
+        # key -> task đã hết thời gian chờ và đang chạy factory (không hủy giữa chừng)
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+
+    def schedule(self, key: Hashable, factory: Callable[[], Awaitable[None]]) -> None:
+        """Hẹn chạy `factory()` cho `key`, thay thế lần hẹn chưa chạy trước đó."""
+        previous = self._pending.pop(key, None)
+        if previous is not None:
+            previous.cancel()
+        self._pending[key] = asyncio.create_task(self._run(key, factory))
+
+    async def cancel(self, key: Hashable) -> None:
+        """Hủy lần hẹn của `key`. Nếu factory đang chạy dở thì đợi nó chạy xong."""
+        pending = self._pending.pop(key, None)
+        if pending is not None:
+            pending.cancel()
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            await asyncio.wait([inflight])
+
+    async def _run(self, key: Hashable, factory: Callable[[], Awaitable[None]]) -> None:
+        current = asyncio.current_task()
+        try:
+            await asyncio.sleep(self.delay)
+            # Lần chạy trước của cùng key chưa xong → đợi, tránh 2 edit chồng nhau
+            previous = self._inflight.get(key)
+            if previous is not None:
+                await asyncio.wait([previous])
+            if self._pending.get(key) is not current:
+                return
+            del self._pending[key]
+            self._inflight[key] = current
+            await factory()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Lỗi khi chạy tác vụ debounce key=%s", key)
+        finally:
+            if self._inflight.get(key) is current:
+                del self._inflight[key]
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+HTTP client dùng chung cho các API HUTECH.
+
+Trước đây mỗi lần gọi API, handler tự mở `aiohttp.ClientSession()` mới →
+mỗi request phải bắt tay TCP + TLS lại từ đầu. Module này giữ 1 session với
+connector có keep-alive, dùng chung cho mọi handler trong suốt vòng đời bot.
+
+Class `HttpClient` là singleton giống `Config`: handler gọi `HttpClient()`
+ở đâu cũng nhận cùng 1 instance. `HutechBot` gọi `start()` lúc khởi động và
+`close()` lúc dừng.
+"""
+
+import logging
+from typing import Optional
+
+import aiohttp
+
+from config.config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class HttpClient:
+    """Giữ 1 `aiohttp.ClientSession` (keep-alive) cho các request tới HUTECH."""
+
+    _instance: "HttpClient | None" = None
+    _initialized: bool = False
+
+    def __new__(cls):
+        # Singleton: mọi handler dùng chung 1 connection pool
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        if HttpClient._initialized:
+            return
+        HttpClient._initialized = True
+        self.config = Config()
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    def _build_session(self) -> aiohttp.ClientSession:
+        connector = aiohttp.TCPConnector(
+            limit=self.config.HUTECH_CONNECTION_POOL_SIZE,
+            keepalive_timeout=self.config.HTTP_KEEPALIVE_TIMEOUT,
+            ttl_dns_cache=300,
+        )
+        return aiohttp.ClientSession(connector=connector)
+
+    async def start(self) -> None:
+        """Khởi tạo session. Gọi 1 lần lúc bot khởi động."""
+        if self._session is None or self._session.closed:
+            self._session = self._build_session()
+            logger.info("Đã khởi tạo aiohttp session dùng chung cho API HUTECH.")
+
+    async def close(self) -> None:
+        """Đóng session khi bot dừng."""
+        if self._session and not self._session.closed:
+            await self._session.close()
+            logger.info("Đã đóng aiohttp session của API HUTECH.")
+        self._session = None
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        """Trả về session dùng chung. Tự tạo nếu chưa `start()` (vd chạy handler riêng lẻ)."""
+        if self._session is None or self._session.closed:
+            self._session = self._build_session()
+        return self._session
@@ -6,7 +6,8 @@ Cấu hình logging cho toàn bộ bot.
 
 Hỗ trợ 2 format:
 - Plain text (mặc định, dễ đọc khi chạy local).
-- JSON (bật qua `LOG_JSON=true`, dễ parse khi chạy trong Docker).
+- JSON (bật qua `LOG_JSON=true`, dễ parse khi chạy trong Docker). Dùng `orjson`
+  nếu đã cài (nhanh hơn nhiều), fallback về `json` của stdlib.
 
 Tự động giảm log noise từ thư viện HTTP (`httpx`, `httpcore`) xuống WARNING
 để log polling Telegram không bị spam.
@@ -16,15 +17,30 @@ import json
 import logging
 import os
 from datetime import datetime, timezone
-from typing import Optional
+from typing import Any, Dict, Optional
+
+try:
+    import orjson
+except ImportError:  # orjson là optional — thiếu thì dùng json của stdlib
+    orjson = None
+
+
+def _dumps(payload: Dict[str, Any]) -> str:
+    if orjson is not None:
+        return orjson.dumps(payload, default=str).decode("utf-8")
+    return json.dumps(payload, ensure_ascii=False, default=str)
 
 
 class JsonFormatter(logging.Formatter):
-    """Render log record thành 1 dòng JSON. Dùng cho môi trường production."""
+    """Render log record thành 1 dòng JSON. Dùng cho môi trường production.
+
+    Record dưới `LOG_LEVEL` bị logger lọc trước khi tới handler, nên formatter
+    chỉ chạy (và chỉ `getMessage()`) cho record thực sự được ghi ra.
+    """
 
     def format(self, record: logging.LogRecord) -> str:
         payload = {
-            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "timestamp": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
             "level": record.levelname,
             "logger": record.name,
             "message": record.getMessage(),
@@ -33,7 +49,7 @@ class JsonFormatter(logging.Formatter):
         if record.exc_info:
             payload["exception"] = self.formatException(record.exc_info)
 
-        return json.dumps(payload, ensure_ascii=False)
+        return _dumps(payload)
 
 
 def _parse_bool_env(value: Optional[str], default: bool = False) -> bool:
@@ -13,10 +13,13 @@ user phải bắt đầu lại flow.
 
 StateStore gọi qua wrapper `cache.get/set/delete` nên tương thích với mọi
 backend (Redis / memory).
+
+Các key hợp lệ của state được khai báo trong `BotState` (TypedDict) — state
+vẫn là dict thường để serialize JSON, nhưng type checker bắt được key gõ sai.
 """
 
 import logging
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional, TypedDict
 
 from cache.base import BaseCache
 from cache.cache_manager import CacheManager
@@ -30,6 +33,29 @@ DEFAULT_STATE_TTL = 1800
 STATE_KEY_PREFIX = "bot:state:"
 
 
+class BotState(TypedDict, total=False):
+    """Schema state tạm per user. Mọi key đều optional — mỗi flow chỉ dùng 1 phần."""
+
+    # /dangnhap
+    step: str
+    username: str
+    login_command_message_id: Optional[int]
+    username_prompt_message_id: Optional[int]
+    password_prompt_message_id: Optional[int]
+
+    # /diemdanh, /diemdanhtatca
+    feature: str
+    campus: str
+    input: str
+    accounts_count: int
+
+    # /tkb (xuất .ics)
+    tkb_week_offset: int
+    tkb_subjects: List[Dict[str, Any]]
+    tkb_subject_names: Dict[str, str]
+    selected_subjects: List[str]
+
+
 class StateStore:
     """Wrapper quanh cache backend để lưu/đọc state per user."""
 
@@ -43,7 +69,7 @@ class StateStore:
         """Sinh cache key cho state của user."""
         return f"{STATE_KEY_PREFIX}{user_id}"
 
-    async def get_state(self, user_id: int) -> Dict[str, Any]:
+    async def get_state(self, user_id: int) -> BotState:
         """Lấy state hiện tại của user. Trả về dict rỗng nếu chưa có hoặc lỗi."""
         try:
             raw = await self.cache.get(self._key(user_id))
@@ -55,20 +81,32 @@ class StateStore:
             logger.error("Lỗi đọc state cho user %s: %s", user_id, e)
             return {}
 
-    async def set_state(self, user_id: int, data: Dict[str, Any]) -> None:
+    async def set_state(self, user_id: int, data: BotState) -> None:
         """Ghi đè state của user bằng dict mới."""
         try:
             await self.cache.set(self._key(user_id), data, ttl=self.ttl)
         except Exception as e:
             logger.error("Lỗi ghi state cho user %s: %s", user_id, e)
 
-    async def update_state(self, user_id: int, updates: Dict[str, Any]) -> Dict[str, Any]:
+    async def update_state(self, user_id: int, updates: BotState) -> BotState:
         """Merge `updates` vào state hiện tại và ghi lại. Trả về state sau khi merge."""
         current = await self.get_state(user_id)
         current.update(updates)
         await self.set_state(user_id, current)
         return current
 
+    async def discard_keys(self, user_id: int, *keys: str) -> None:
+        """Xóa hẳn các key khỏi state (1 lần đọc + 1 lần ghi). State rỗng thì xóa luôn key cache."""
+        current = await self.get_state(user_id)
+        if not any(k in current for k in keys):
+            return
+        for k in keys:
+            current.pop(k, None)
+        if current:
+            await self.set_state(user_id, current)
+        else:
+            await self.clear_state(user_id)
+
     async def clear_state(self, user_id: int) -> None:
         """Xóa toàn bộ state của user."""
         try:
@@ -12,7 +12,7 @@ Hỗ trợ:
 - Gọi JSON (`call`) và multipart upload (`call_form`).
 - Long-polling `getUpdates`.
 - High-level helpers: `send_message`, `send_rich_message`, `edit_message_text_*`,
-  `answer_callback_query`, `delete_message`, `send_document`.
+  `answer_callback_query`, `delete_message`, `delete_messages`, `send_document`.
 
 Cú pháp Rich Message (Bot API 10.1):
 - Gửi mới: dùng `send_rich_message` với `rich_message: {"html": "<h1>...</h1>"}`.
@@ -20,19 +20,39 @@ Cú pháp Rich Message (Bot API 10.1):
   `text` (text và rich_message là mutually exclusive).
 """
 
-import asyncio
 import json
 import logging
 import mimetypes
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Union
+from typing import Any, Dict, Iterable, List, Optional, Union
 
 import aiohttp
 
+try:
+    import orjson
+except ImportError:  # orjson là optional — thiếu thì dùng json của stdlib
+    orjson = None
+
 from config.config import Config
 
 logger = logging.getLogger(__name__)
 
+# Số message tối đa mỗi lần gọi `deleteMessages`
+DELETE_MESSAGES_LIMIT = 100
+
+_JSON_HEADERS = {"Content-Type": "application/json"}
+
+
+def _dumps(value: Any) -> bytes:
+    """Encode body JSON gửi lên Bot API (orjson nếu có, nhanh hơn stdlib vài lần)."""
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, ensure_ascii=False).encode("utf-8")
+
+
+# Decode response (getUpdates trả về payload lớn nhất) bằng orjson nếu có
+_loads = orjson.loads if orjson is not None else json.loads
+
 # Bot API base URL
 _API_BASE = "https://api.telegram.org"
 
@@ -48,11 +68,13 @@ DEFAULT_ALLOWED_UPDATES = [
 class TelegramAPIError(Exception):
     """Lỗi trả về từ Telegram Bot API (khi `ok=False` trong response)."""
 
-    def __init__(self, method: str, code: int, description: str):
+    def __init__(self, method: str, code: int, description: str, retry_after: Optional[int] = None):
         super().__init__(f"{method} failed: {code} {description}")
         self.method = method
         self.code = code
         self.description = description
+        # Số giây Telegram yêu cầu chờ khi bị 429 (`parameters.retry_after`)
+        self.retry_after = retry_after
 
 
 class TelegramAPI:
@@ -61,11 +83,20 @@ class TelegramAPI:
     def __init__(self, config: Optional[Config] = None):
         self.config = config or Config()
         self._session: Optional[aiohttp.ClientSession] = None
+        # Token không đổi trong vòng đời bot → dựng sẵn prefix URL 1 lần
+        self._base_url = f"{_API_BASE}/bot{self.config.TELEGRAM_BOT_TOKEN}/"
 
     async def start(self) -> None:
         """Khởi tạo aiohttp session. Gọi 1 lần trước khi dùng các method khác."""
         if self._session is None or self._session.closed:
-            self._session = aiohttp.ClientSession()
+            # Giữ connection keep-alive tới api.telegram.org: long-poll getUpdates
+            # chiếm 1 connection, các call gửi/sửa tin nhắn dùng phần còn lại
+            connector = aiohttp.TCPConnector(
+                limit=self.config.TELEGRAM_CONNECTION_POOL_SIZE,
+                keepalive_timeout=self.config.HTTP_KEEPALIVE_TIMEOUT,
+                ttl_dns_cache=300,
+            )
+            self._session = aiohttp.ClientSession(connector=connector)
             logger.info("Đã khởi tạo aiohttp session cho Telegram Bot API.")
 
     async def close(self) -> None:
@@ -84,7 +115,7 @@ class TelegramAPI:
 
     def _url(self, method: str) -> str:
         """Sinh URL đầy đủ cho 1 method của Bot API."""
-        return f"{_API_BASE}/bot{self.config.TELEGRAM_BOT_TOKEN}/{method}"
+        return self._base_url + method
 
     async def call(
         self,
@@ -93,24 +124,11 @@ class TelegramAPI:
         params: Optional[Dict[str, Any]] = None,
     ) -> Dict[str, Any]:
         """Gọi Bot API dạng JSON (POST). Trả về `result` nếu ok=True, raise TelegramAPIError nếu lỗi."""
-        url = self._url(method)
         if params:
             params = {k: v for k, v in params.items() if v is not None}
-        try:
-            async with self.session.post(url, json=params) as resp:
-                try:
-                    payload = await resp.json(content_type=None)
-                except (aiohttp.ContentTypeError, json.JSONDecodeError) as e:
-                    text = await resp.text()
-                    raise TelegramAPIError(method, resp.status, f"Invalid JSON: {text[:200]}") from e
-
-                if not payload.get("ok"):
-                    code = int(payload.get("error_code") or resp.status or 0)
-                    description = payload.get("description") or "Unknown error"
-                    raise TelegramAPIError(method, code, description)
-                return payload.get("result", {})
-        except aiohttp.ClientError as e:
-            raise TelegramAPIError(method, 0, f"Network error: {e}") from e
+        body = _dumps(params) if params else None
+        headers = _JSON_HEADERS if body is not None else None
+        return await self._post(method, data=body, headers=headers)
 
     async def call_form(
         self,
@@ -127,35 +145,47 @@ class TelegramAPI:
             files: Dict `{field_name: file_value}`. `file_value` có thể là Path,
                    bytes, hoặc tuple đã đúng định dạng.
         """
-        url = self._url(method)
         if data:
             data = {k: v for k, v in data.items() if v is not None}
+
         form = aiohttp.FormData()
         if data:
             for k, v in data.items():
                 if isinstance(v, (dict, list)):
-                    form.add_field(k, json.dumps(v, ensure_ascii=False))
+                    form.add_field(k, _dumps(v).decode("utf-8"))
                 else:
                     form.add_field(k, str(v))
         if files:
             for field, value in files.items():
-                form.add_field(field, *self._normalize_file(value))
+                filename, payload, content_type = self._normalize_file(value)[:3]
+                form.add_field(field, payload, filename=filename, content_type=content_type)
+
+        return await self._post(method, data=form)
+
+    async def _post(self, method: str, **request: Any) -> Any:
+        """POST 1 method, trả về `result`. Lỗi (kể cả 429) raise `TelegramAPIError` ngay:
+        handler chạy tuần tự nên chờ `retry_after` ở đây sẽ chặn update của mọi user.
+        Tác vụ nền muốn gửi lại sau 429 dùng `background.retry_on_flood`."""
         try:
-            async with self.session.post(url, data=form) as resp:
+            async with self.session.post(self._url(method), **request) as resp:
                 try:
-                    payload = await resp.json(content_type=None)
+                    payload = await resp.json(loads=_loads, content_type=None)
                 except (aiohttp.ContentTypeError, json.JSONDecodeError) as e:
                     text = await resp.text()
                     raise TelegramAPIError(method, resp.status, f"Invalid JSON: {text[:200]}") from e
-
-                if not payload.get("ok"):
-                    code = int(payload.get("error_code") or resp.status or 0)
-                    description = payload.get("description") or "Unknown error"
-                    raise TelegramAPIError(method, code, description)
-                return payload.get("result", {})
+                status = resp.status
         except aiohttp.ClientError as e:
             raise TelegramAPIError(method, 0, f"Network error: {e}") from e
 
+        if payload.get("ok"):
+            return payload.get("result", {})
+        code = int(payload.get("error_code") or status or 0)
+        retry_after = (payload.get("parameters") or {}).get("retry_after")
+        raise TelegramAPIError(
+            method, code, payload.get("description") or "Unknown error",
+            retry_after=int(retry_after) if retry_after is not None else None,
+        )
+
     @staticmethod
     def _normalize_file(value: Any) -> tuple:
         """Chuẩn hoá file input thành tuple `(filename, payload, content_type)` cho aiohttp.
@@ -200,6 +230,27 @@ class TelegramAPI:
         """Gọi `getMe` — lấy thông tin bot hiện tại."""
         return await self.call("getMe")
 
+    async def set_webhook(
+        self,
+        url: str,
+        *,
+        secret_token: Optional[str] = None,
+        allowed_updates: Optional[List[str]] = None,
+        max_connections: Optional[int] = None,
+    ) -> bool:
+        """Đăng ký webhook: Telegram sẽ POST update tới `url` thay vì chờ getUpdates."""
+        params: Dict[str, Any] = {
+            "url": url,
+            "secret_token": secret_token,
+            "allowed_updates": allowed_updates or DEFAULT_ALLOWED_UPDATES,
+            "max_connections": max_connections,
+        }
+        return await self.call("setWebhook", params=params)
+
+    async def delete_webhook(self, *, drop_pending_updates: bool = False) -> bool:
+        """Gỡ webhook (nếu có) để dùng lại getUpdates. Không có webhook thì vẫn ok."""
+        return await self.call("deleteWebhook", params={"drop_pending_updates": drop_pending_updates})
+
     async def get_updates(
         self,
         offset: Optional[int] = None,
@@ -375,6 +426,27 @@ class TelegramAPI:
             logger.debug("Không thể xóa message %s: %s", message_id, e.description)
             return False
 
+    async def delete_messages(self, chat_id: Union[int, str], message_ids: Iterable[Optional[int]]) -> bool:
+        """Xóa nhiều message bằng `deleteMessages` (1 request / 100 id), bỏ qua id rỗng.
+
+        Message không tìm thấy được Telegram bỏ qua. Trả về False nếu request lỗi.
+        """
+        ids = [mid for mid in message_ids if mid]
+        if not ids:
+            return True
+        if len(ids) == 1:
+            return await self.delete_message(chat_id, ids[0])
+        try:
+            for start in range(0, len(ids), DELETE_MESSAGES_LIMIT):
+                await self.call("deleteMessages", params={
+                    "chat_id": chat_id,
+                    "message_ids": ids[start:start + DELETE_MESSAGES_LIMIT],
+                })
+            return True
+        except TelegramAPIError as e:
+            logger.debug("Không thể xóa các message %s: %s", ids, e.description)
+            return False
+
     async def send_document(
         self,
         chat_id: Union[int, str],
@@ -382,6 +454,7 @@ class TelegramAPI:
         *,
         filename: str,
         caption: Optional[str] = None,
+        parse_mode: Optional[str] = None,
         reply_to_message_id: Optional[int] = None,
     ) -> Dict[str, Any]:
         """Gửi file (document) qua `sendDocument`.
@@ -390,9 +463,11 @@ class TelegramAPI:
             file: Path, bytes, hoặc tuple theo định dạng aiohttp.
             filename: Tên file hiển thị trên Telegram.
             caption: Mô tả file (optional).
+            parse_mode: Kiểu định dạng caption (vd "HTML").
         """
         if isinstance(file, Path):
-            file_tuple = (filename, file.open("rb"), mimetypes.guess_type(str(file))[0])
+            # Đọc hẳn ra bytes: không giữ file handle mở, gửi lại sau 429 vẫn đủ nội dung
+            file_tuple = (filename, file.read_bytes(), mimetypes.guess_type(str(file))[0])
         elif isinstance(file, tuple):
             file_tuple = (filename, *self._normalize_file(file)[1:])
         else:
@@ -402,6 +477,7 @@ class TelegramAPI:
             data={
                 "chat_id": chat_id,
                 "caption": caption,
+                "parse_mode": parse_mode,
                 "reply_to_message_id": reply_to_message_id,
             },
             files={"document": file_tuple},
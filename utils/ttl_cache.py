@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Cache nhỏ trong RAM có TTL + giới hạn số entry (LRU).
+
+Dùng cho dữ liệu nóng theo user mà handler/facade cần đọc lại nhiều lần trong
+thời gian ngắn (trạng thái đăng nhập, campus ưa thích, danh sách học phần...),
+để khỏi phải đi qua DB / cache backend (Redis + JSON decode) mỗi lần.
+"""
+
+import time
+from collections import OrderedDict
+from typing import Any, Hashable
+
+# Phân biệt "chưa cache" với giá trị None đã cache (vd user chưa chọn campus)
+MISSING = object()
+
+
+class TtlLruCache:
+    """Cache trong RAM: hết hạn sau `ttl` giây, giữ tối đa `max_size` entry (LRU)."""
+
+    def __init__(self, ttl: float, max_size: int):
+        self.ttl = ttl
+        self.max_size = max_size
+        # key -> (thời điểm monotonic, giá trị), LRU theo thứ tự truy cập
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+
+    def get(self, key: Hashable) -> Any:
+        """Trả về giá trị còn hạn, hoặc `MISSING`."""
+        entry = self._entries.get(key)
+        if entry is None or time.monotonic() - entry[0] >= self.ttl:
+            return MISSING
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        self._entries[key] = (time.monotonic(), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def pop(self, key: Hashable) -> None:
+        self._entries.pop(key, None)
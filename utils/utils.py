@@ -10,6 +10,11 @@ import uuid
 
 logger = logging.getLogger(__name__)
 
+# `reason` trong kết quả `handle_*` khi user không có account active.
+# Handler tự phát hiện lúc lấy token → command không cần gọi riêng `is_user_logged_in`.
+NOT_LOGGED_IN = "not_logged_in"
+NOT_LOGGED_IN_MESSAGE = "Bạn chưa đăng nhập. Vui lòng /dangnhap để đăng nhập."
+
 
 def generate_uuid() -> str:
     """Sinh UUID v4 uppercase. Dùng làm device UUID cho mỗi tài khoản HUTECH."""